@@ -4,16 +4,21 @@
 #include <ESPAsyncWebServer.h>
 #include <ESPAsyncTCP.h>
 #include <LittleFS.h>
+#include <WiFiUdp.h>
 
 #define LED_PIN    D4      // Pin connected to the Data input of the WS2811 strip
 #define NUM_LEDS   250     // Total number of LEDs in your strip
 #define LED_TYPE   WS2811  // Type of LED strip
 #define COLOR_ORDER RGB    // Color order
 #define MAX_BRIGHTNESS 60      // LED brightness
-#define NUM_CAL_STEPS 5      // Number of calibration steps
-#define NUM_FRAMES 6       // Number of frames in the calibration pattern
+#define NUM_CAL_STEPS 3      // Number of calibration steps (codes correct one bad frame, so 3 repeats suffice)
+#define NUM_FRAMES 9       // Number of frames in the calibration pattern (code length)
 #define FRAME_DELAY 300    // Delay between frames in milliseconds
 #define MAX_GIF_FRAMES 100  // Maximum number of frames for GIF animations
+#define DDP_PORT 4048       // UDP port for live frames (DDP protocol)
+#define DDP_FLAG_PUSH 0x01
+#define DDP_FLAG_TIMECODE 0x10
+#define LIVE_TIMEOUT 2000   // ms without live frames before going back to GIF/default effects
 
 struct Coord { int x; int y; };
 
@@ -33,6 +38,26 @@ bool gifMode = false;
 bool gifPlaying = false;    // Whether a GIF is currently playing
 File gifFile;               // File handle for reading frames from flash
 
+// GIF upload in progress. An upload may arrive in several requests: after a dropped
+// connection the server asks /gif/status how much arrived and resumes with ?offset=
+File uploadFile;            // "/gif.part", renamed to "/gif.dat" once complete
+size_t uploadReceived = 0;  // payload bytes received so far (including the 2-byte header)
+size_t uploadSize = 0;      // full payload size
+int uploadFrames = 0;
+bool uploadRejected = false; // ignore the remaining chunks of a rejected request
+
+// Synchronized start across several trees: uploads with ?play=0 are staged as "/gif.next"
+// (the current animation keeps playing) and /gif/control?action=start&delay=<ms> swaps them in
+int gifNextFrames = 0;      // frames of the staged animation, 0 when nothing is staged
+bool gifStartPending = false;
+unsigned long gifStartAt = 0;
+
+// Live streaming (DDP over UDP)
+WiFiUDP ddpUdp;
+uint8_t ddpPacket[1500];
+unsigned long liveLastFrame = 0;
+bool liveMode = false;
+
 const char* ssid = "NOS-676B"; // Your WiFi SSID
 const char* password = "L4N9U7JC"; // Your WiFi password
 
@@ -47,9 +72,11 @@ bool calibration_mode = false;
 CRGB getColorFromChar(char c);
 void playCalibrationSequence();
 bool connectToWiFi(unsigned long timeoutMs = 15000);
+void startStagedGIF();
 void UpAndDownEffect();
 void RainbowEffect();
 void playGIFAnimation();
+void handleDDP();
 
 void setup() {
   Serial.begin(115200);
@@ -77,7 +104,7 @@ void setup() {
       int len = ledAssignment.length();
       for (int i = 0; i < NUM_LEDS; i++) {
         for (int j = 0; j < NUM_FRAMES; j++) {
-          int idx = i * NUM_FRAMES + j; // expecting 6 chars per LED
+          int idx = i * NUM_FRAMES + j; // expecting NUM_FRAMES chars per LED
           if (idx < len) {
             patternTable[i][j] = getColorFromChar(ledAssignment.charAt(idx));
           } else {
@@ -133,58 +160,94 @@ void setup() {
   });
 
   // GIF upload endpoint - saves frame data to SPIFFS
+  // ?size=<payload bytes> (defaults to this body), ?offset=<byte> resumes an interrupted upload.
+  // The body arrives in TCP-segment sized chunks; index/total are relative to this request.
   server.on("/gif", HTTP_POST, 
     [](AsyncWebServerRequest *request){
       request->send(200);
     },
     NULL,
     [](AsyncWebServerRequest *request, uint8_t *data, size_t len, size_t index, size_t total){
-      static File uploadFile;
+      size_t offset = request->hasParam("offset") ? request->getParam("offset")->value().toInt() : 0;
       
-      // First chunk - parse header and create file
+      // First chunk - parse header and create file, or check the resume point
       if (index == 0) {
-        // First 2 bytes = number of frames (little endian)
-        if (len < 2) {
-          request->send(400, "text/plain", "Invalid data");
-          return;
-        }
-        
-        gifNumFrames = data[0] | (data[1] << 8);
-        
-        if (gifNumFrames < 1) {
-          Serial.printf("Invalid frame count: %d\n", gifNumFrames);
-          request->send(400, "text/plain", "Invalid frame count");
-          return;
-        }
-        
-        // Remove MAX_GIF_FRAMES limit - SPIFFS can handle any size!
-        size_t totalSize = gifNumFrames * NUM_LEDS * sizeof(CRGB);
-        Serial.printf("Receiving GIF: %d frames (%d bytes total)\n", gifNumFrames, totalSize);
-        
-        // Create/overwrite file in SPIFFS
-        uploadFile = LittleFS.open("/gif.dat", "w");
-        if (!uploadFile) {
-          Serial.println("Failed to create GIF file!");
-          request->send(500, "text/plain", "Storage error");
-          return;
-        }
+        uploadRejected = false;
+        uploadSize = request->hasParam("size") ? request->getParam("size")->value().toInt() : total;
         
-        // Write frame data (skip first 2 bytes header)
-        size_t dataToCopy = len - 2;
-        uploadFile.write(data + 2, dataToCopy);
-      } else {
-        // Subsequent chunks - append data to file
-        if (uploadFile) {
-          uploadFile.write(data, len);
+        if (offset > 0) {
+          if (!uploadFile || offset != uploadReceived) {
+            Serial.printf("Cannot resume at %d, have %d bytes\n", offset, uploadReceived);
+            uploadRejected = true;
+            request->send(409, "text/plain", "Resume offset mismatch");
+            return;
+          }
+          Serial.printf("Resuming GIF upload at %d/%d bytes\n", offset, uploadSize);
+        } else {
+          // First 2 bytes = number of frames (little endian)
+          if (len < 2) {
+            uploadRejected = true;
+            request->send(400, "text/plain", "Invalid data");
+            return;
+          }
+          
+          uploadFrames = data[0] | (data[1] << 8);
+          
+          if (uploadFrames < 1) {
+            Serial.printf("Invalid frame count: %d\n", uploadFrames);
+            uploadRejected = true;
+            request->send(400, "text/plain", "Invalid frame count");
+            return;
+          }
+          
+          // Remove MAX_GIF_FRAMES limit - SPIFFS can handle any size!
+          size_t totalSize = uploadFrames * NUM_LEDS * sizeof(CRGB);
+          Serial.printf("Receiving GIF: %d frames (%d bytes total)\n", uploadFrames, totalSize);
+          
+          // Write to a separate file so the current animation keeps playing until this one is complete
+          if (uploadFile) uploadFile.close();
+          uploadFile = LittleFS.open("/gif.part", "w");
+          if (!uploadFile) {
+            Serial.println("Failed to create GIF file!");
+            uploadRejected = true;
+            request->send(500, "text/plain", "Storage error");
+            return;
+          }
+          
+          // Write frame data (skip first 2 bytes header)
+          uploadFile.write(data + 2, len - 2);
+          uploadReceived = len;
+          data += len;
+          len = 0;
         }
       }
+      if (uploadRejected || !uploadFile) {
+        return;
+      }
+      
+      // Append data to file
+      if (len > 0) {
+        uploadFile.write(data, len);
+        uploadReceived += len;
+      }
       
-      // Last chunk - finalize
-      if (index + len >= total) {
-        if (uploadFile) {
-          uploadFile.close();
-          Serial.printf("GIF saved to SPIFFS: %d frames, %d LEDs per frame\n", gifNumFrames, NUM_LEDS);
+      // Last chunk of the payload - finalize
+      if (uploadReceived >= uploadSize) {
+        uploadFile.close();
+        uploadReceived = 0;
+        if (request->hasParam("play") && request->getParam("play")->value() == "0") {
+          // Staged: wait for action=start
+          LittleFS.remove("/gif.next");
+          LittleFS.rename("/gif.part", "/gif.next");
+          gifNextFrames = uploadFrames;
+          Serial.printf("GIF staged: %d frames\n", gifNextFrames);
+          request->send(200, "text/plain", "GIF staged");
+          return;
         }
+        LittleFS.remove("/gif.dat");
+        LittleFS.rename("/gif.part", "/gif.dat");
+        gifNumFrames = uploadFrames;
+        Serial.printf("GIF saved to SPIFFS: %d frames, %d LEDs per frame\n", gifNumFrames, NUM_LEDS);
         gifCurrentFrame = 0;
         gifPlaying = true;
         gifMode = true;
@@ -193,6 +256,16 @@ void setup() {
     }
   );
 
+  // Progress of an interrupted GIF upload, so the server can resume it
+  server.on("/gif/status", HTTP_GET, [](AsyncWebServerRequest *request){
+    String json = "{\"received\":" + String(uploadFile ? uploadReceived : 0) +
+                  ",\"size\":" + String(uploadSize) +
+                  ",\"frames\":" + String(gifNumFrames) +
+                  ",\"staged\":" + String(gifNextFrames) +
+                  ",\"leds\":" + String(NUM_LEDS) + "}";
+    request->send(200, "application/json", json);
+  });
+
   // GIF control endpoint
   server.on("/gif/control", HTTP_GET, [](AsyncWebServerRequest *request){
     if (request->hasParam("action")) {
@@ -211,6 +284,12 @@ void setup() {
         gifCurrentFrame = 0;
         gifMode = false;
         request->send(200, "text/plain", "Stopped");
+      } else if (action == "start") {
+        // Staged animation (or the current one) from frame 0 after ?delay= ms
+        unsigned long delayMs = request->hasParam("delay") ? request->getParam("delay")->value().toInt() : 0;
+        gifStartAt = millis() + delayMs;
+        gifStartPending = true;
+        request->send(200, "text/plain", "Starting");
       } else if (action == "speed" && request->hasParam("value")) {
         gifFrameDelay = request->getParam("value")->value().toInt();
         request->send(200, "text/plain", "Speed updated");
@@ -223,6 +302,7 @@ void setup() {
   });
 
   server.begin();
+  ddpUdp.begin(DDP_PORT);
 
   delay(1000); // Wait a moment before starting
 
@@ -251,6 +331,15 @@ void setup() {
 }
 
 void loop() {
+  handleDDP();
+  if (gifStartPending && (long)(millis() - gifStartAt) >= 0) {
+    startStagedGIF();
+  }
+  if (liveMode && millis() - liveLastFrame > LIVE_TIMEOUT) {
+    liveMode = false;
+    Serial.println("Live stream ended");
+  }
+
   if (calibration_mode) {
     // Keep the webserver and WiFi 
     delay(1000);
@@ -264,6 +353,9 @@ void loop() {
       }
     }
   }
+  else if (liveMode) {
+    delay(1);  // Frames are shown as they arrive in handleDDP()
+  }
   else if (gifMode && gifNumFrames > 0) {
     playGIFAnimation();
   }
@@ -285,6 +377,51 @@ CRGB getColorFromChar(char c) {
   }
 }
 
+// Read all pending DDP datagrams: 10-byte header (+4-byte timecode), then RGB data
+// written at the byte offset from the header. The frame is shown on the PUSH flag.
+void handleDDP() {
+  int size;
+  while ((size = ddpUdp.parsePacket()) > 0) {
+    int len = ddpUdp.read(ddpPacket, sizeof(ddpPacket));
+    if (len < 10) continue;
+
+    uint8_t flags = ddpPacket[0];
+    uint32_t offset = ((uint32_t)ddpPacket[4] << 24) | ((uint32_t)ddpPacket[5] << 16) |
+                      ((uint32_t)ddpPacket[6] << 8) | ddpPacket[7];
+    uint16_t dataLen = (ddpPacket[8] << 8) | ddpPacket[9];
+    int headerLen = (flags & DDP_FLAG_TIMECODE) ? 14 : 10;
+    if (len < headerLen) continue;  // truncated timecode header; len - headerLen would wrap
+    if (headerLen + dataLen > len) dataLen = len - headerLen;
+
+    // Clip to the LED buffer
+    if (offset < NUM_LEDS * sizeof(CRGB)) {
+      size_t room = NUM_LEDS * sizeof(CRGB) - offset;
+      memcpy((uint8_t*)leds + offset, ddpPacket + headerLen, dataLen < room ? dataLen : room);
+    }
+
+    if (flags & DDP_FLAG_PUSH) {
+      FastLED.show();
+      liveLastFrame = millis();
+      liveMode = true;
+    }
+  }
+}
+
+void startStagedGIF() {
+  gifStartPending = false;
+  if (gifNextFrames > 0) {
+    LittleFS.remove("/gif.dat");
+    LittleFS.rename("/gif.next", "/gif.dat");
+    gifNumFrames = gifNextFrames;
+    gifNextFrames = 0;
+  }
+  gifCurrentFrame = 0;
+  gifLastUpdate = millis() - gifFrameDelay;  // show frame 0 right away
+  gifPlaying = true;
+  gifMode = true;
+  Serial.printf("GIF started: %d frames\n", gifNumFrames);
+}
+
 void playGIFAnimation() {
   if (!gifPlaying) {
     delay(1);  // Small delay to prevent WiFi issues
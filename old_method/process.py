@@ -2,8 +2,10 @@ import cv2
 import numpy as np
 import os
 import re
+import json
+from multiprocessing import Pool
 
-def detect_brightest_spot(image_path):
+def detect_brightest_spot(image_path, min_pixels=20):
     # Read the image
     img = cv2.imread(image_path)
     if img is None:
@@ -12,29 +14,34 @@ def detect_brightest_spot(image_path):
     # Convert the image to grayscale
     gray = cv2.cvtColor(img, cv2.COLOR_BGR2GRAY)
 
-    brightness = 255
-    
-    while brightness > 0:
-        # Threshold the grayscale image to create a binary mask of bright areas
-        _, mask = cv2.threshold(gray, brightness, 255, cv2.THRESH_BINARY)
+    _, max_val, _, max_loc = cv2.minMaxLoc(gray)
+    if max_val <= 1:
+        return None
+
+    # One histogram pass: the highest level that still keeps `min_pixels` bright pixels
+    hist = np.bincount(gray.ravel(), minlength=256)
+    count_above = np.cumsum(hist[::-1])[::-1]  # pixels >= level
+    level = int(np.flatnonzero(count_above >= min(min_pixels, count_above[int(max_val)]))[-1])
 
-        # Find contours in the mask
-        contours, _ = cv2.findContours(mask, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
+    # Threshold the grayscale image once to create a binary mask of bright areas
+    _, mask = cv2.threshold(gray, level - 1, 255, cv2.THRESH_BINARY)
 
-        if contours:
-            # Find the largest bright spot
-            largest_contour = max(contours, key=cv2.contourArea)
+    # Find contours in the mask
+    contours, _ = cv2.findContours(mask, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
 
-            # Get the center of the contour (brightest spot position)
-            M = cv2.moments(largest_contour)
-            if M['m00'] != 0:
-                cx = int(M['m10'] / M['m00'])
-                cy = int(M['m01'] / M['m00'])
-                return (cx, cy)  # Return the position of the brightest spot
+    if contours:
+        # Find the largest bright spot
+        largest_contour = max(contours, key=cv2.contourArea)
 
-        brightness -= 1
+        # Get the center of the contour (brightest spot position)
+        M = cv2.moments(largest_contour)
+        if M['m00'] != 0:
+            cx = int(M['m10'] / M['m00'])
+            cy = int(M['m01'] / M['m00'])
+            return (cx, cy)  # Return the position of the brightest spot
 
-    return None
+    # Spot too small to have an area: use the brightest pixel itself
+    return (int(max_loc[0]), int(max_loc[1]))
 
 def generate_led_map(led_positions, img_shape):
     # Create a blank white image with the same size as the input image
@@ -56,45 +63,59 @@ def sort_numerical_filenames(file_list):
     # Use regex to extract numeric parts from filenames for sorting
     return sorted(file_list, key=lambda x: int(re.search(r'\d+', x).group()) if re.search(r'\d+', x) else float('inf'))
 
-def process_images_in_folder(folder_path):
-    all_led_positions = []
-    
+def process_images_in_folder(folder_path, processes=None):
     # List all files in the folder and sort them numerically
     file_list = [f for f in os.listdir(folder_path) if f.lower().endswith(('.png', '.jpg', '.jpeg'))]
     sorted_files = sort_numerical_filenames(file_list)
-    
-    # Process each file in numerical order
-    for idx, filename in enumerate(sorted_files, start=1):
-        image_path = os.path.join(folder_path, filename)
-        led_position = detect_brightest_spot(image_path)
-        
+    image_paths = [os.path.join(folder_path, filename) for filename in sorted_files]
+
+    # Process all photos in parallel, results come back in numerical order
+    with Pool(processes) as pool:
+        spots = pool.map(detect_brightest_spot, image_paths)
+
+    for filename, led_position in zip(sorted_files, spots):
         if led_position:
             print(f"Found brightest spot in {filename} at position: {led_position}")
-            all_led_positions.append(led_position)
         else:
             print(f"No bright spot found in {filename}")
-    
-    return all_led_positions
-
-# Example usage
-folder_path = "photos"  # Change this to the folder containing your images
-led_positions = process_images_in_folder(folder_path)
-
-if led_positions:
-    # Get the size of the first image to create a map with the same dimensions
-    sample_image = cv2.imread(os.path.join(folder_path, os.listdir(folder_path)[0]))
-    img_shape = sample_image.shape  # (height, width, channels)
-    
-    # Generate the LED map
-    led_map = generate_led_map(led_positions, img_shape)
-
-    # Save the LED positions to a file
-    save_position_data(led_positions, "led_positions.txt")
-    
-    # Save the LED map to a file
-    cv2.imwrite("led_map.png", led_map)
-    print("LED map saved as led_map.png")
-else:
-    print("No bright spots detected in the images.")
 
+    return spots
+
+def save_led_positions_json(spots, output_file):
+    """
+    Save in the server's led_positions.json format: [[index, [x, y]], ...]
+    with one entry per photo. Photos without a spot are interpolated from
+    their neighbours along the LED index.
+    """
+    known = [i for i, spot in enumerate(spots) if spot]
+    if not known:
+        return
+    xs = np.interp(range(len(spots)), known, [spots[i][0] for i in known])
+    ys = np.interp(range(len(spots)), known, [spots[i][1] for i in known])
+    positions = [[i, list(spots[i]) if spots[i] else [float(xs[i]), float(ys[i])]] for i in range(len(spots))]
+    with open(output_file, 'w') as fh:
+        json.dump(positions, fh)
+
+if __name__ == "__main__":
+    # Example usage
+    folder_path = "photos"  # Change this to the folder containing your images
+    spots = process_images_in_folder(folder_path)
+    led_positions = [spot for spot in spots if spot]
+
+    if led_positions:
+        # Get the size of the first image to create a map with the same dimensions
+        sample_image = cv2.imread(os.path.join(folder_path, os.listdir(folder_path)[0]))
+        img_shape = sample_image.shape  # (height, width, channels)
+        
+        # Generate the LED map
+        led_map = generate_led_map(led_positions, img_shape)
 
+        # Save the LED positions to a file
+        save_position_data(led_positions, "led_positions.txt")
+        save_led_positions_json(spots, "led_positions.json")
+        
+        # Save the LED map to a file
+        cv2.imwrite("led_map.png", led_map)
+        print("LED map saved as led_map.png")
+    else:
+        print("No bright spots detected in the images.")
@@ -1,40 +1,8 @@
 import cv2
 import numpy as np
 import os
-import re
 
-def detect_brightest_spot(image_path):
-    # Read the image
-    img = cv2.imread(image_path)
-    if img is None:
-        raise ValueError("Image not found or unable to read")
-
-    # Convert the image to grayscale
-    gray = cv2.cvtColor(img, cv2.COLOR_BGR2GRAY)
-
-    brightness = 255
-    
-    while brightness > 0:
-        # Threshold the grayscale image to create a binary mask of bright areas
-        _, mask = cv2.threshold(gray, brightness, 255, cv2.THRESH_BINARY)
-
-        # Find contours in the mask
-        contours, _ = cv2.findContours(mask, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
-
-        if contours:
-            # Find the largest bright spot
-            largest_contour = max(contours, key=cv2.contourArea)
-
-            # Get the center of the contour (brightest spot position)
-            M = cv2.moments(largest_contour)
-            if M['m00'] != 0:
-                cx = int(M['m10'] / M['m00'])
-                cy = int(M['m01'] / M['m00'])
-                return (cx, cy)  # Return the position of the brightest spot
-
-        brightness -= 1
-
-    return None
+from process import detect_brightest_spot, sort_numerical_filenames
 
 def generate_led_map(led_positions, img_shape):
     # Create a blank white image with the same size as the input image
@@ -52,10 +20,6 @@ def save_position_data(led_positions, output_file):
         for idx, (cx, cy) in enumerate(led_positions, start=1):
             file.write(f"({idx},{cx},{cy})")
 
-def sort_numerical_filenames(file_list):
-    # Use regex to extract numeric parts from filenames for sorting
-    return sorted(file_list, key=lambda x: int(re.search(r'\d+', x).group()) if re.search(r'\d+', x) else float('inf'))
-
 def process_images_in_folder(folder_path):
     all_led_positions = []
     
@@ -92,8 +56,9 @@ def process_images_in_folder(folder_path):
     
     return all_led_positions
 
-# Example usage
-folder_path = "photos"  # Change this to the folder containing your images
-process_images_in_folder(folder_path)
+if __name__ == "__main__":
+    # Example usage
+    folder_path = "photos"  # Change this to the folder containing your images
+    process_images_in_folder(folder_path)
 
 
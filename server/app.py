@@ -1,66 +1,173 @@
-from flask import Flask, request, jsonify, send_from_directory, send_file
-from calibration.image_processing import analyze_video, detect_leds_in_frame
-import requests, json, os, time, struct,io
-from calibration import image_processing
-from effectProcessing import gifEffects
-from effectProcessing import testGifEffects
-from PIL import Image
-from effectProcessing.code_effects import LEDEffectGenerator
-
-ESP_URL = "http://192.168.1.200"  # ESP's IP
+from flask import Flask, request, jsonify, send_from_directory, send_file, redirect, g
+import json, os, sys, time, struct, io, tempfile
+import asyncio, functools, threading
+import importlib
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from effectProcessing import preview_cache
+import metrics
+import profiling
+import shared_state
+from urllib.parse import urlparse
+
+class _LazyModule:
+    def __init__(self, name):
+        self._name = name
+        self._module = None
+
+    def __getattr__(self, attr):
+        if self._module is None:
+            self._module = importlib.import_module(self._name)
+        return getattr(self._module, attr)
+
+def lazy_import(name):
+    """
+    Module that is only imported on first attribute access.
+    Keeps startup fast: numpy, cv2, Pillow and requests (and every module of ours
+    that pulls them in) are only loaded by the routes that use them.
+    import_module holds the import lock until the module is fully executed, so
+    threads hitting it at the same time never see a half-initialized module
+    (importlib.util.LazyLoader does not guarantee that).
+    """
+    return _LazyModule(name)
+
+requests = lazy_import("requests")
+Image = lazy_import("PIL.Image")
+image_processing = lazy_import("calibration.image_processing")
+gifEffects = lazy_import("effectProcessing.gifEffects")
+preview_encoder = lazy_import("effectProcessing.preview_encoder")
+esp_client = lazy_import("esp_client")
+np = lazy_import("numpy")
+codebook = lazy_import("calibration.codebook")
+code_effects = lazy_import("effectProcessing.code_effects")
+compositor = lazy_import("effectProcessing.compositor")
+controllers = lazy_import("controllers")
+live_stream = lazy_import("live_stream")
+
+ESP_URL = os.getenv("ESP_URL", "http://192.168.1.200")  # ESP's IP; more trees go in jsons/controllers.json
 
 GIF_FOLDER = "gifs"
+PREVIEW_DIR = os.path.join(os.path.dirname(__file__), "static", "effect_previews", "cache")
+LED_POSITIONS_PATH = os.path.join(os.path.dirname(__file__), "jsons", "led_positions.json")
 
 # Ensure UPLOAD_DIR is defined
 UPLOAD_DIR = os.getenv("UPLOAD_DIR", "uploads")  # Default to "uploads" if not set
 
-import random
+# LEDs on the calibrated tree (the ESP at ESP_URL): the ESP reports its NUM_LEDS when the
+# codebook is sent; before that, LED_COUNT or the calibrated layout decide
+DEFAULT_LED_COUNT = 250
 
-elements = ['R','G','B']
-led_count = 250
-k = 6 # sequence length
-n_sequences = 5
-used = set()
-led_color_mappings = []
+# Live stream shared by all workers (see live_stream.SharedStream), created on first use
+STREAM_CONTROL_PATH = os.path.join(os.path.dirname(__file__), "jsons", "stream.json")
+_shared_stream = None
 
-mapping_file = "jsons/mappings.json"
+# Rendered effect payloads keyed by (effect, layout hash, normalized params)
+# Bounded by size, not count: a payload for thousands of LEDs is several MB
+EFFECT_CACHE_BYTES = 64 * 1024 * 1024
+effect_payload_cache = OrderedDict()
+effect_cache_lock = threading.Lock()
+
+# CPU-bound work of the async ESP views (rendering, GIF sampling, encoding).
+# Bounded, so many concurrent control requests never mean as many renders at once
+RENDER_WORKERS = int(os.getenv("RENDER_WORKERS", 2))
+render_pool = ThreadPoolExecutor(max_workers=RENDER_WORKERS, thread_name_prefix="render")
 
-def draw_unique_led_colors():
-    while True:
-        # pick with replacement (allows repeated letters)
-        chars = tuple(random.choices(elements, k=k))
-        code = ''.join(chars)
-        if code not in used:
-            used.add(code)
-            print(f"Chosen LED colors: {code} (Total used: {len(used)})")
-            return code
-
-def generate_led_color_mappings():
-    mappings = []
-    for _ in range(led_count):
-        # Add Random Color
-        mappings.append(draw_unique_led_colors())
+mapping_file = "jsons/mappings.json"
+# Last uploaded calibration video, kept for the calibration dev scripts (color_tuning.py)
+last_video_file = "tmp_video.mp4"
+
+def initial_led_count():
+    """LED count for a first codebook: LED_COUNT, else the calibrated layout's length, else DEFAULT_LED_COUNT."""
+    if os.getenv("LED_COUNT"):
+        return int(os.getenv("LED_COUNT"))
+    layout = shared_state.read_json(LED_POSITIONS_PATH)
+    if isinstance(layout, list) and layout:
+        return len(layout)
+    return DEFAULT_LED_COUNT
+
+def generate_led_color_mappings(count):
+    # Deterministic codebook: any two codes differ in at least 3 frames, so a
+    # single misdetected frame can still be corrected during matching. The
+    # length is fixed by the firmware, not by the LED count
+    mappings = codebook.generate_codebook(count, code_len=codebook.FIRMWARE_CODE_LEN)
 
     # persist mappings to disk so they can be inspected or reused
+    # (callers hold the mapping_file lock, other server workers read it)
     try:
-        with open(mapping_file, 'w') as fh:
-            json.dump(mappings, fh)
-        # app may not be defined at import-time when this function is defined,
-        # but it's called after `app` is created below, so logger is available.
-        try:
-            app.logger.info('Saved %d LED mappings to %s', len(mappings), mapping_file)
-        except Exception:
-            pass
+        shared_state.write_json(mapping_file, mappings, locked=True)
+        app.logger.info('Saved %d LED mappings to %s', len(mappings), mapping_file)
     except Exception as e:
-        try:
-            app.logger.error('Failed to save mappings to %s: %s', mapping_file, e)
-        except Exception:
-            pass
+        app.logger.error('Failed to save mappings to %s: %s', mapping_file, e)
 
     return mappings
+
+def valid_led_color_mappings(mappings, count=None):
+    """Well-formed codebook of codes as long as the firmware plays, of `count` codes when given."""
+    return (isinstance(mappings, list) and mappings and (count is None or len(mappings) == count)
+            and all(isinstance(c, str) and len(c) == codebook.FIRMWARE_CODE_LEN
+                    and set(c) <= set(codebook.SYMBOLS) for c in mappings))
+
+def load_led_color_mappings(count=None):
+    """
+    Codes from mapping_file, so a restart keeps the codes the ESP is showing
+    (e.g. during a calibration in progress). A new codebook is only generated
+    when the file is missing, unreadable or for a different LED count than `count`
+    (initial_led_count() when there is no codebook yet).
+    Runs under the file lock, so workers starting together agree on one codebook.
+    """
+    with shared_state.file_lock(mapping_file):
+        mappings = shared_state.read_json(mapping_file)
+        if valid_led_color_mappings(mappings, count):
+            app.logger.info('Loaded %d LED mappings from %s', len(mappings), mapping_file)
+            return mappings
+        count = count or initial_led_count()
+        if mappings is not None:
+            app.logger.warning('%s does not hold %d valid codes, generating a new codebook', mapping_file, count)
+        return generate_led_color_mappings(count)
+
+def get_led_color_mappings(count=None):
+    """Current codebook as stored on disk (shared by all workers, re-read only when it changes)."""
+    mappings = shared_state.read_json(mapping_file)
+    if valid_led_color_mappings(mappings, count):
+        return mappings
+    return load_led_color_mappings(count)
     
 app = Flask(__name__, static_folder="static")
-led_color_mappings = generate_led_color_mappings()
+# Span timings go to the app log as one JSON object per line
+metrics.logger = app.logger
+
+@app.before_request
+def start_request_timer():
+    g.request_start = time.perf_counter()
+
+@app.after_request
+def record_request_time(response):
+    start = g.pop("request_start", None)
+    if start is not None:
+        metrics.observe_request(request.endpoint or "unknown", request.method, response.status_code,
+                                time.perf_counter() - start)
+    return response
+
+@app.route("/profiles", methods=["GET"])
+def list_profiles():
+    """Saved request profiles (admin only); add ?profile=cprofile|sampling to a profiled route to create one."""
+    if not profiling.is_admin():
+        return jsonify({"status": "error", "message": "Admins only"}), 403
+    profiles = profiling.list_profiles()
+    for entry in profiles:
+        entry["url"] = f"/profiles/{entry['file']}"
+    return jsonify({"status": "ok", "profiles": profiles}), 200
+
+@app.route("/profiles/<path:filename>", methods=["GET"])
+def download_profile(filename):
+    if not profiling.is_admin():
+        return jsonify({"status": "error", "message": "Admins only"}), 403
+    return send_from_directory(profiling.PROFILE_DIR, filename, as_attachment=True)
+
+@app.route("/metrics", methods=["GET"])
+def prometheus_metrics():
+    """Stage and request timing histograms in the Prometheus text format."""
+    return app.response_class(metrics.render_prometheus(), mimetype="text/plain; version=0.0.4")
 
 @app.route("/")
 def index():
@@ -87,8 +194,9 @@ def get_led_positions():
         return jsonify({"status": "error", "message": "LED positions not found. Please run calibration first."}), 404
     
     try:
-        with open(led_positions_file, 'r') as f:
-            positions = json.load(f)
+        positions = shared_state.read_json(led_positions_file)
+        if positions is None:
+            raise ValueError(f"{led_positions_file} is not valid JSON")
         return jsonify(positions), 200
     except Exception as e:
         app.logger.error(f"Error loading LED positions: {str(e)}")
@@ -101,16 +209,31 @@ def get_gif_image(filename):
     return send_from_directory("gifs", filename)
 
 @app.route("/upload_video", methods=["POST"])
+@profiling.profiled
 def upload_video():
     video = request.files["video"]
-    path = f"tmp_video.mp4"
-    video.save(path)
-    matched = image_processing.led_calibration(path)
+    # One file per request: concurrent uploads (or another worker) must not overwrite it mid-analysis
+    fd, path = tempfile.mkstemp(suffix=".mp4", prefix="calibration_", dir=os.path.dirname(os.path.abspath(last_video_file)))
+    try:
+        with os.fdopen(fd, "wb") as fh:
+            video.save(fh)
+        with metrics.span("calibration"):
+            matched = image_processing.led_calibration(path)
+        os.replace(path, last_video_file)
+    finally:
+        if os.path.exists(path):
+            os.remove(path)
+    # New layout: re-render every preview in the background
+    # cheap effects first so most of the page fills in quickly
+    Generator = code_effects.LEDEffectGenerator
+    names = sorted(Generator.get_effect_names(),
+                   key=lambda n: code_effects.COST_CLASSES.index(Generator.effect_info(n).cost))
+    preview_cache.schedule_all(names, LED_POSITIONS_PATH, PREVIEW_DIR, app.logger)
     send_new_led_mapping(matched)
     return send_from_directory("static", "index.html")
 
 @app.route("/send_led_mapping", methods=["GET"])
-def send_led_mapping():
+async def send_led_mapping():
     # Make sure the endpoint matches the one your ESP serves (main.cpp uses "/led")
     url = f"{ESP_URL}/calibrate"
 
@@ -119,15 +242,16 @@ def send_led_mapping():
     # into one string before sending. Passing the list directly as params
     # results in an encoding the ESP won't understand.
     # send all in a single code string
-    assignment = ''
-    for code in led_color_mappings:
-        assignment += code
-    app.logger.info("Sending ledAssignment length=%d to %s", len(assignment), url)
     try:
-        resp = requests.get(url, params={"ledAssignment": assignment}, timeout=5)
+        # One code per LED the ESP drives (firmware without /gif/status keeps the current codebook)
+        led_count = (await esp_client.status(ESP_URL)).get("leds")
+        assignment = ''.join(get_led_color_mappings(led_count))
+        app.logger.info("Sending ledAssignment length=%d to %s", len(assignment), url)
+        with metrics.span("upload", target="calibrate"):
+            resp = await esp_client.control(ESP_URL, "/calibrate", {"ledAssignment": assignment})
         app.logger.info("ESP responded: %s %s", resp.status_code, resp.text[:200])
         return jsonify({"status": "ok", "esp_status": resp.status_code, "esp_text": resp.text}), 200
-    except requests.RequestException as e:
+    except esp_client.Error as e:
         app.logger.error("Failed to send to ESP %s: %s", url, str(e))
         return jsonify({"status": "error", "error": str(e)}), 502
     
@@ -144,7 +268,8 @@ def send_new_led_mapping(matched=None):
     retries = 6
     for attempt in range(1, retries + 1):
         try:
-            resp = requests.get(url, params={"ledsPositions": assignment}, timeout=8)
+            with metrics.span("upload", target="calibrated_leds"):
+                resp = requests.get(url, params={"ledsPositions": assignment}, timeout=8)
             app.logger.info("ESP responded: %s %s (attempt %d/%d)", resp.status_code, resp.text[:200], attempt, retries)
             return jsonify({"status": "ok", "esp_status": resp.status_code, "esp_text": resp.text}), 200
         except requests.RequestException as e:
@@ -174,7 +299,7 @@ def upload_gif_editor():
         os.makedirs(gifs_dir)
     
     filepath = os.path.join(gifs_dir, filename)
-    file.save(filepath)
+    shared_state.save_stream(filepath, file.stream)
     
     return jsonify({"status": "ok", "filename": filename}), 200
 
@@ -215,14 +340,17 @@ def crop_gif():
             output_name = f"{base}_cropped.gif"
             output_path = os.path.join(UPLOAD_DIR, output_name)
 
+            out = io.BytesIO()
             frames[0].save(
-                output_path,
+                out,
+                format="GIF",
                 save_all=True,
                 append_images=frames[1:],
                 duration=durations,
                 loop=0,
                 disposal=2
             )
+            shared_state.write_bytes(output_path, out.getvalue())
 
         return jsonify({"status": "ok", "output": output_name})
     except Exception as e:
@@ -230,6 +358,7 @@ def crop_gif():
 
 # --- THE FIXED FUNCTION ---
 @app.route('/get_frames/<filename>')
+@profiling.profiled
 def get_frames(filename):
     path = os.path.join(UPLOAD_DIR, filename)
     if not os.path.exists(path):
@@ -241,49 +370,40 @@ def get_frames(filename):
         if not os.path.exists(LED_POSITIONS_FILE):
              return jsonify({"error": "LED positions not found"}), 404
              
-        with open(LED_POSITIONS_FILE) as f:
-            # Expected format in JSON: [[index, [x, y]], [index, [x, y]], ...]
-            raw_data = json.load(f)
-            led_positions = [item[1] for item in raw_data]
+        # Expected format in JSON: [[index, [x, y]], [index, [x, y]], ...]
+        raw_data = shared_state.read_json(LED_POSITIONS_FILE)
+        if raw_data is None:
+            raise ValueError(f"{LED_POSITIONS_FILE} is not valid JSON")
+        led_positions = [item[1] for item in raw_data]
 
         if not led_positions:
             return jsonify({"frames": []})
 
         # 2. Calculate LED Bounding Box (to map coordinate space)
-        xs = [p[0] for p in led_positions]
-        ys = [p[1] for p in led_positions]
-        min_x, max_x = min(xs), max(xs)
-        min_y, max_y = min(ys), max(ys)
-        
-        led_width = max_x - min_x if max_x != min_x else 1
-        led_height = max_y - min_y if max_y != min_y else 1
+        coords = np.array(led_positions, dtype=float)[:, :2]
+        min_xy = coords.min(axis=0)
+        extent = coords.max(axis=0) - min_xy
+        extent[extent == 0] = 1
+
+        # Normalize LED positions (0.0 to 1.0) relative to the LED cloud
+        # We clamp values to be safe
+        norm = np.clip((coords - min_xy) / extent, 0, 1)
 
         # 3. Process GIF Frames
         gif = Image.open(path)
         frames = []
 
-        for frame_index in range(gif.n_frames):
-            gif.seek(frame_index)
-            frame_img = gif.convert("RGB")
-            img_w, img_h = frame_img.size
-            
-            sampled_leds = []
-            
-            for (lx, ly) in led_positions:
-                # Normalize LED position (0.0 to 1.0) relative to the LED cloud
-                norm_x = (lx - min_x) / led_width
-                norm_y = (ly - min_y) / led_height
-                
-                # Map normalized position to GIF pixel coordinates
-                # We clamp values to be safe
-                gx = int(max(0, min(1, norm_x)) * (img_w - 1))
-                gy = int(max(0, min(1, norm_y)) * (img_h - 1))
-                
-                # Get color
-                r, g, b = frame_img.getpixel((gx, gy))
-                sampled_leds.append([r, g, b])
-
-            frames.append(sampled_leds)
+        with metrics.span("sample", source="get_frames"):
+            for frame_index in range(gif.n_frames):
+                gif.seek(frame_index)
+                frame_img = gif.convert("RGB")
+                img_w, img_h = frame_img.size
+
+                # Map normalized positions to GIF pixel coordinates and
+                # read every LED's color in one lookup (per-LED getpixel was the cost at thousands of LEDs)
+                gx = (norm[:, 0] * (img_w - 1)).astype(int)
+                gy = (norm[:, 1] * (img_h - 1)).astype(int)
+                frames.append(np.asarray(frame_img)[gy, gx].tolist())
 
         return jsonify({"frames": frames})
     except Exception as e:
@@ -305,8 +425,7 @@ def save_gif(filename):
     dest_path = os.path.join(dest_dir, new_name + ".gif")
     try:
         with open(source_path, 'rb') as src_file:
-            with open(dest_path, 'wb') as dest_file:
-                dest_file.write(src_file.read())
+            shared_state.save_stream(dest_path, src_file)
         return jsonify({"status": "ok", "message": "GIF saved"}), 200
     except Exception as e:
         return jsonify({"status": "error", "message": str(e)}), 500
@@ -329,12 +448,18 @@ def list_gifs():
     }), 200
 
 @app.route("/send_gif", methods=["POST"])
-def send_gif():
+@profiling.profiled
+async def send_gif():
     """
     Process and send a GIF animation to the ESP
-    Expects JSON: {"gif_name": "gradient.gif"} or {"gif_path": "/full/path/to/file.gif"}
+    Expects JSON: {"gif_name": "gradient.gif"} or {"gif_path": "/full/path/to/file.gif"},
+    optionally "controllers": [names] to send to only some of the trees
     """
     data = request.json
+    try:
+        registry, targets = get_controllers(data)
+    except ValueError as e:
+        return jsonify({"status": "error", "message": str(e)}), 400
     
     if "gif_name" in data:
         gif_name = data["gif_name"]
@@ -347,39 +472,35 @@ def send_gif():
     if not os.path.exists(gif_path):
         return jsonify({"status": "error", "message": f"GIF not found: {gif_path}"}), 404
     
+    def process():
+        # Process the GIF
+        with metrics.span("sample", source="gif"):
+            frames = gifEffects.process_gif_effects(gif_path, led_positions_path=registry.layout_path)
+
+        # Build payload: [2-byte frame count][RGB data]
+        with metrics.span("encode", format="esp"):
+            return build_payload(frames), len(frames)
+
     try:
         app.logger.info(f"Processing GIF: {gif_path}")
         
-        # Process the GIF
-        frames = gifEffects.process_gif_effects(gif_path)
-        num_frames = len(frames)
+        payload, num_frames = await run_cpu(process)
         
         app.logger.info(f"Processed {num_frames} frames")
         
-        # Build payload: [2-byte frame count][RGB data]
-        payload = bytearray(struct.pack('<H', num_frames))
-        
-        for frame in frames:
-            for led in frame:
-                payload.extend(led)  # Append R, G, B bytes
-        
         total_size = len(payload)
         app.logger.info(f"Payload size: {total_size} bytes ({total_size / 1024:.2f} KB)")
         
-        # Send to ESP
-        url = f"{ESP_URL}/gif"
-        app.logger.info(f"Sending GIF to {url}")
+        # Send to the ESP(s)
+        app.logger.info(f"Sending GIF to {', '.join(c.url for c in targets)}")
+        results = await fan_out(registry, targets, payload)
         
-        resp = requests.post(url, data=payload, timeout=30)
-        app.logger.info(f"ESP response: {resp.status_code} - {resp.text}")
-        
-        return jsonify({
+        return controllers_response({
             "status": "ok",
             "gif": os.path.basename(gif_path),
             "frames": num_frames,
             "size_kb": round(total_size / 1024, 2),
-            "esp_response": resp.text
-        }), 200
+        }, results)
         
     except Exception as e:
         app.logger.error(f"Error sending GIF: {str(e)}")
@@ -387,120 +508,368 @@ def send_gif():
 
 @app.route('/list_effects', methods=['GET'])
 def list_effects():
-    effect_names = LEDEffectGenerator.get_effect_names()
+    Generator = code_effects.LEDEffectGenerator
+    effect_names = Generator.get_effect_names()
     
     return jsonify({
         'status': 'ok',
-        'effects': effect_names
+        'effects': effect_names,
+        'params': {name: Generator.param_schema(name) for name in effect_names},
+        'info': {name: Generator.effect_info(name).to_dict(Generator.normalize_params(name))
+                 for name in effect_names}
     })
 
+def build_payload(frames):
+    """ESP payload for (T, N, 3) RGB frames: [2-byte frame count][RGB data]."""
+    frames = np.asarray(frames, dtype=np.uint8)
+    return struct.pack('<H', len(frames)) + frames.tobytes()
+
+async def run_cpu(fn, *args):
+    """
+    Run CPU-bound work of an async view on render_pool and await the result.
+    Runs inline while the request is profiled, so the profile includes it.
+    """
+    if g.get("profiling"):
+        return fn(*args)
+    return await asyncio.get_running_loop().run_in_executor(render_pool, functools.partial(fn, *args))
+
+def requested_controllers(data):
+    """Controller names a request targets (optional "controllers": [names]), None for all of them."""
+    names = data.get("controllers")
+    if names is not None and not (isinstance(names, list) and all(isinstance(n, str) for n in names)):
+        raise ValueError('"controllers" must be a list of controller names')
+    return names
+
+def get_controllers(data):
+    """The controller registry (every layout read, for rendering) and the controllers a request targets."""
+    names = requested_controllers(data)
+    registry = controllers.load(ESP_URL, LED_POSITIONS_PATH)
+    return registry, registry.select(names)
+
+def get_control_targets(data):
+    """The controllers a request targets, without reading layouts: control works before calibration."""
+    names = requested_controllers(data)
+    return controllers.select(controllers.configured(ESP_URL, LED_POSITIONS_PATH), names)
+
+async def fan_out(registry, targets, payload):
+    """
+    Upload a payload rendered on the registry layout: each target gets its slice,
+    all concurrently, started together. Returns a result dict per controller.
+    """
+    parts = await run_cpu(registry.split_payload, payload, targets)
+    with metrics.span("upload", target="gif"):
+        results = await esp_client.upload_all([(c.name, c.url, part) for c, part in parts],
+                                              progress=lambda label: esp_client.log_progress(app.logger, label))
+    for r in results:
+        if r["status"] == "ok":
+            app.logger.info(f"ESP {r['controller']}: {r['esp_response']} ({r['upload']['kbps']} KB/s)")
+        else:
+            app.logger.error(f"ESP {r['controller']} failed: {r.get('error') or r.get('esp_response')}")
+    return results
+
+def controllers_response(body, results):
+    """JSON response with per-controller results; 502 naming the failed controllers if any failed."""
+    body["controllers"] = results
+    failed = [r for r in results if r["status"] != "ok"]
+    if not failed:
+        return jsonify(body), 200
+    body["status"] = "error"
+    body["error"] = "Failed on " + ", ".join(f"{r['controller']} ({r.get('error') or r.get('esp_response')})"
+                                             for r in failed)
+    return jsonify(body), 502
+
+def render_effect_payload(effect_name, params, max_frames=None, layout_path=LED_POSITIONS_PATH):
+    """
+    Render an effect to the ESP payload ([2-byte frame count][RGB data]).
+    Payloads of deterministic effects are cached per layout and normalized
+    parameter set, so repeated requests for the same variant skip rendering;
+    randomized effects are rendered fresh every time.
+    max_frames stops rendering early, so frames past the budget are never computed.
+    Returns (payload, num_frames, cache_hit).
+    """
+    cacheable = code_effects.LEDEffectGenerator.effect_info(effect_name).cacheable
+    key = (effect_name, preview_cache.layout_hash(layout_path), json.dumps(params, sort_keys=True),
+           max_frames)
+    if cacheable:
+        with effect_cache_lock:
+            if key in effect_payload_cache:
+                effect_payload_cache.move_to_end(key)
+                payload, num_frames = effect_payload_cache[key]
+                return payload, num_frames, True
+
+    with metrics.span("load_layout"):
+        gen = code_effects.LEDEffectGenerator(layout_path)
+    with metrics.span("render", effect=effect_name):
+        frames = gen.render(effect_name, params, max_frames=max_frames)
+    num_frames = len(frames)
+    with metrics.span("encode", format="esp"):
+        payload = build_payload(frames)
+
+    if cacheable:
+        with effect_cache_lock:
+            effect_payload_cache[key] = (payload, num_frames)
+            while (len(effect_payload_cache) > 1 and
+                   sum(len(p) for p, _ in effect_payload_cache.values()) > EFFECT_CACHE_BYTES):
+                effect_payload_cache.popitem(last=False)
+    return payload, num_frames, False
+
 @app.route("/send_effect", methods=["POST"]) 
-def send_effect():
-    data = request.json
+@profiling.profiled
+async def send_effect():
+    data = request.json or {}
 
-    if "effect_name" in data:
-        effect_name = data["effect_name"]
+    effect_name = data.get("effect_name")
+    # Unknown effects and invalid parameters are rejected before any rendering
     try:
-        app.logger.info(f"Processing Effect: {effect_name}")
-        
-        gen = LEDEffectGenerator("jsons/led_positions.json")
-
-        frames = getattr(gen, effect_name)()
+        params = code_effects.LEDEffectGenerator.normalize_params(effect_name, data.get("params"))
+        # Optional frame budget, e.g. to keep uploads small
+        max_frames = data.get("max_frames")
+        if max_frames is not None:
+            max_frames = code_effects.Param("int", 1, 65535).normalize("max_frames", max_frames)
+        registry, targets = get_controllers(data)
+    except ValueError as e:
+        return jsonify({"status": "error", "message": str(e)}), 400
 
-        num_frames = len(frames)
-        
-        app.logger.info(f"Processed {num_frames} frames")
+    try:
+        app.logger.info(f"Processing Effect: {effect_name} {params}")
         
         # Build payload: [2-byte frame count][RGB data]
-        payload = bytearray(struct.pack('<H', num_frames))
+        payload, num_frames, cached = await run_cpu(render_effect_payload, effect_name, params, max_frames,
+                                                    registry.layout_path)
         
-        for frame in frames:
-            for led in frame:
-                payload.extend(led)  # Append R, G, B bytes
+        app.logger.info(f"Processed {num_frames} frames{' (cached)' if cached else ''}")
         
         total_size = len(payload)
         app.logger.info(f"Payload size: {total_size} bytes ({total_size / 1024:.2f} KB)")
         
-        # Send to ESP
-        url = f"{ESP_URL}/gif"
-        app.logger.info(f"Sending GIF to {url}")
+        # Send to the ESP(s)
+        app.logger.info(f"Sending GIF to {', '.join(c.url for c in targets)}")
+        results = await fan_out(registry, targets, payload)
         
-        resp = requests.post(url, data=payload, timeout=30)
-        app.logger.info(f"ESP response: {resp.status_code} - {resp.text}")
-        
-        return jsonify({
+        return controllers_response({
             "status": "ok",
             "effect": os.path.basename(effect_name),
+            "params": params,
             "frames": num_frames,
             "size_kb": round(total_size / 1024, 2),
-            "esp_response": resp.text
-        }), 200
+        }, results)
         
     except Exception as e:
         app.logger.error(f"Error sending Effect: {str(e)}")
         return jsonify({"status": "error", "error": str(e)}), 500
     
+@app.route("/send_composition", methods=["POST"])
+async def send_composition():
+    """
+    Blend several effects into one animation and send it to the ESP.
+    Expects JSON: {"layers": [{"effect": <name>, "params": {...}, "mode": "normal|add|screen|multiply|lighten",
+                               "opacity": 0..1, "region": {...}}, ...]} listed bottom to top.
+    """
+    data = request.json or {}
+    try:
+        layers = compositor.normalize_layers(data.get("layers"))
+        registry, targets = get_controllers(data)
+    except ValueError as e:
+        return jsonify({"status": "error", "message": str(e)}), 400
+
+    def process():
+        with metrics.span("load_layout"):
+            gen = code_effects.LEDEffectGenerator(registry.layout_path)
+        with metrics.span("render", effect="composition"):
+            frames = compositor.compose(gen, layers, preview_cache.layout_hash(registry.layout_path))
+        with metrics.span("encode", format="esp"):
+            return build_payload(frames), len(frames)
+
+    try:
+        app.logger.info(f"Composing {len(layers)} layers: {[l['effect'] for l in layers]}")
+        payload, num_frames = await run_cpu(process)
+        total_size = len(payload)
+        app.logger.info(f"Composed {num_frames} frames, payload {total_size / 1024:.2f} KB")
+
+        results = await fan_out(registry, targets, payload)
+
+        return controllers_response({
+            "status": "ok",
+            "layers": len(layers),
+            "frames": num_frames,
+            "size_kb": round(total_size / 1024, 2),
+        }, results)
+
+    except Exception as e:
+        app.logger.error(f"Error sending composition: {str(e)}")
+        return jsonify({"status": "error", "error": str(e)}), 500
+
+def shared_stream():
+    global _shared_stream
+    if _shared_stream is None:
+        def make_source(control):
+            gen = code_effects.LEDEffectGenerator(LED_POSITIONS_PATH)
+            return live_stream.effect_frames(gen, control["effect_name"], control["params"])
+        _shared_stream = live_stream.SharedStream(STREAM_CONTROL_PATH, make_source, app.logger)
+    return _shared_stream
+
+def stream_hosts():
+    """Hosts /stream may send to without the admin token: the ESP and the registered controllers."""
+    configured = controllers.configured(ESP_URL, LED_POSITIONS_PATH)
+    return {urlparse(ESP_URL).hostname} | {urlparse(c.url).hostname for c in configured}
+
+@app.route("/stream/start", methods=["POST"])
+def stream_start():
+    """
+    Stream an effect live over UDP (DDP) instead of uploading it.
+    Expects JSON: {"effect_name": <name>, "params": {...}, "fps": 30, "host": <ip>, "port": 4048}
+    host defaults to the ESP and must be one of the known controllers unless the
+    request carries the admin token. Calling it again while streaming switches the
+    effect on the next frame. Any server worker may take the request: the worker
+    that owns the stream follows jsons/stream.json.
+    """
+    data = request.json or {}
+    effect_name = data.get("effect_name")
+    try:
+        params = code_effects.LEDEffectGenerator.normalize_params(effect_name, data.get("params"))
+        fps = float(data.get("fps", 30))
+        if not 1 <= fps <= 120:
+            raise ValueError("fps must be in 1..120")
+        port = code_effects.Param("int", 1, 65535).normalize("port", data.get("port", live_stream.DDP_PORT))
+        host = data.get("host", urlparse(ESP_URL).hostname)
+        # Otherwise any client could point a UDP stream at any address
+        if host not in stream_hosts() and not profiling.is_admin():
+            return jsonify({"status": "error", "message": f"Unknown stream host {host!r}, "
+                                                          f"known: {sorted(stream_hosts())}"}), 403
+    except ValueError as e:
+        return jsonify({"status": "error", "message": str(e)}), 400
+
+    stream = shared_stream()
+    stream.update(running=True, effect_name=effect_name, params=params, fps=fps, host=host, port=port)
+    stream.ensure_running()
+    app.logger.info(f"Live streaming {effect_name} to {host}:{port} at {fps} fps")
+    return jsonify({"status": "ok", "effect": effect_name, "params": params,
+                    "target": f"{host}:{port}", "fps": fps}), 200
+
+@app.route("/stream/stop", methods=["POST"])
+def stream_stop():
+    stream = shared_stream()
+    if not stream.control().get("running"):
+        return jsonify({"status": "ok", "running": False}), 200
+    control = stream.update(running=False)
+    # The owning worker (maybe another process) stops and publishes its final report
+    report = stream.wait_for_status(control["generation"]).get("report")
+    app.logger.info(f"Live stream stopped: {report}")
+    return jsonify({"status": "ok", "report": report}), 200
+
+@app.route("/stream/stats", methods=["GET"])
+def stream_stats():
+    """Sender-side jitter/timing report of the current live stream, as last published by its worker."""
+    stream = shared_stream()
+    if not stream.control().get("running"):
+        return jsonify({"status": "ok", "running": False}), 200
+    # Takes the stream over if the worker that ran it has died
+    stream.ensure_running()
+    status = stream.status()
+    body = {"status": "ok", "report": status.get("report"), "owner": status.get("owner")}
+    if status.get("error"):
+        body["error"] = status["error"]
+    return jsonify(body), 200
+
+def preview_placeholder():
+    placeholder = os.path.join(os.path.dirname(__file__), "static", "images", "effect_placeholder.png")
+    if os.path.exists(placeholder):
+        return send_file(placeholder, mimetype='image/png')
+
+    # Generate simple fallback image
+    from io import BytesIO
+    img = Image.new('RGB', (200, 200), color=(50, 50, 100))
+    img_io = BytesIO()
+    img.save(img_io, 'PNG')
+    img_io.seek(0)
+    return send_file(img_io, mimetype='image/png')
+
 @app.route('/get_effect_preview/<effect_name>')
 def get_effect_preview(effect_name):
-    """Generate or serve a preview GIF for the effect"""
-    from effectProcessing.code_effects import LEDEffectGenerator
-    import numpy as np
-    
-    # Check if preview already exists in cache
-    preview_dir = os.path.join(os.path.dirname(__file__), "static", "effect_previews")
-    os.makedirs(preview_dir, exist_ok=True)
-    
-    preview_path = os.path.join(preview_dir, f"{effect_name}.mp4")
-    
-    # If preview doesn't exist, generate it
-    if not os.path.exists(preview_path):
-        try:
-            app.logger.info(f"Generating preview for effect: {effect_name}")
-            gen = LEDEffectGenerator("jsons/led_positions.json")
-            
-            # Get the effect method
-            if hasattr(gen, effect_name):
-                frames = getattr(gen, effect_name)()
-                if frames:
-                    # Limit to first 90 frames for faster preview generation
-                    preview_frames = frames[:90] if len(frames) > 90 else frames
-                    
-                    # Generate video preview
-                    testGifEffects.frames_to_video(
-                        preview_frames, 
-                        preview_path, 
-                        fps=15, 
-                        canvas_size=(200, 300),
-                        dot_radius=3
-                    )
-                    app.logger.info(f"Generated preview at {preview_path}")
-                else:
-                    raise ValueError(f"Effect {effect_name} returned no frames")
-            else:
-                raise ValueError(f"Effect {effect_name} not found")
-        except Exception as e:
-            app.logger.error(f"Error generating preview for {effect_name}: {str(e)}")
-            # Return a placeholder on error
-            placeholder = os.path.join(os.path.dirname(__file__), "static", "images", "effect_placeholder.png")
-            if os.path.exists(placeholder):
-                return send_file(placeholder, mimetype='image/png')
-            
-            # Generate simple fallback image
-            from PIL import Image
-            from io import BytesIO
-            img = Image.new('RGB', (200, 200), color=(50, 50, 100))
-            img_io = BytesIO()
-            img.save(img_io, 'PNG')
-            img_io.seek(0)
-            return send_file(img_io, mimetype='image/png')
-    
-    # Serve the cached video preview
-    return send_file(preview_path, mimetype='video/mp4')
+    """
+    Serve the cached preview for the current LED layout.
+    Missing or stale previews are rendered in the background; until then a
+    placeholder is returned immediately (202). With ?format=json the status and
+    a cache-busting URL are returned instead of the media itself.
+    """
+    if effect_name not in code_effects.LEDEffectGenerator.get_effect_names():
+        return jsonify({"status": "error", "message": f"Effect {effect_name} not found"}), 404
+    if not os.path.exists(LED_POSITIONS_PATH):
+        return jsonify({"status": "error", "message": "LED positions not found. Please run calibration first."}), 404
+
+    try:
+        state, filename, layout = preview_cache.preview_status(
+            effect_name, LED_POSITIONS_PATH, PREVIEW_DIR, app.logger)
+    except Exception as e:
+        app.logger.error(f"Error generating preview for {effect_name}: {str(e)}")
+        return preview_placeholder()
+
+    url = f"/static/effect_previews/cache/{filename}?v={layout}" if filename else None
+    if request.args.get("format") == "json":
+        code = {"ready": 200, "pending": 202}.get(state, 500)
+        return jsonify({"status": state, "url": url, "layout_hash": layout}), code
+
+    if state == "error":
+        return preview_placeholder()
+    if url is None:
+        resp = preview_placeholder()
+        resp.status_code = 202
+        resp.headers["Retry-After"] = "2"
+        resp.headers["Cache-Control"] = "no-store"
+        return resp
+
+    # Versioned URL, so browsers never keep a preview of an old layout
+    return redirect(url)
+
+@app.route('/render_effect_preview/<effect_name>')
+def render_effect_preview(effect_name):
+    """
+    Render a preview on the fly and return it from memory without caching.
+    ?format=webp|gif|mp4|webm (default webp), ?frames=<n> (default 90),
+    ?params=<json object of parameter overrides>.
+    Encode timings are returned in X-Render-Time / X-Encode-Time headers.
+    """
+    fmt = request.args.get("format", "webp")
+    if fmt not in preview_encoder.MIMETYPES:
+        return jsonify({"status": "error", "message": f"Unsupported format: {fmt}"}), 400
+    if effect_name not in code_effects.LEDEffectGenerator.get_effect_names():
+        return jsonify({"status": "error", "message": f"Effect {effect_name} not found"}), 404
+
+    try:
+        params = code_effects.LEDEffectGenerator.normalize_params(effect_name,
+                                                                  json.loads(request.args.get("params", "{}")))
+        # Same upper bound as an effect's own frame count; short previews are fine
+        num_frames = code_effects.Param("int", 1, code_effects.FRAMES.max).normalize(
+            "frames", request.args.get("frames", preview_cache.PREVIEW_FRAMES))
+    except ValueError as e:
+        return jsonify({"status": "error", "message": str(e)}), 400
+
+    try:
+        gen = code_effects.LEDEffectGenerator(LED_POSITIONS_PATH)
+        with metrics.span("render", effect=effect_name):
+            frames = gen.render(effect_name, params, max_frames=num_frames)
+        data, stats = preview_encoder.encode_preview(
+            frames, fmt=fmt, fps=preview_cache.PREVIEW_FPS, canvas_size=preview_cache.PREVIEW_CANVAS,
+            dot_radius=preview_cache.PREVIEW_DOT_RADIUS, led_positions_path=LED_POSITIONS_PATH)
+    except Exception as e:
+        app.logger.error(f"Error rendering preview for {effect_name}: {str(e)}")
+        return jsonify({"status": "error", "error": str(e)}), 500
+    metrics.observe("preview_draw", stats["render_seconds"])
+    metrics.observe("encode", stats["encode_seconds"], format=fmt)
+
+    app.logger.info(f"Preview {effect_name}.{fmt}: {stats['frames']} frames {stats['width']}x{stats['height']}, "
+                    f"render {stats['render_seconds']:.3f}s, encode {stats['encode_seconds']:.3f}s, "
+                    f"{stats['bytes'] / 1024:.1f} KB")
+    resp = send_file(io.BytesIO(data), mimetype=preview_encoder.MIMETYPES[fmt])
+    resp.headers["X-Render-Time"] = str(stats["render_seconds"])
+    resp.headers["X-Encode-Time"] = str(stats["encode_seconds"])
+    resp.headers["Cache-Control"] = "no-store"
+    return resp
 
 @app.route("/gif_control", methods=["POST"])
-def gif_control():
+async def gif_control():
     """
-    Control GIF playback on ESP
+    Control GIF playback on every ESP (or the ones in "controllers": [names])
     Expects JSON: {"action": "play|pause|stop|speed", "value": <speed_ms>}
     """
     data = request.json
@@ -508,22 +877,24 @@ def gif_control():
     
     if not action:
         return jsonify({"status": "error", "message": "Missing action parameter"}), 400
+    try:
+        targets = get_control_targets(data)
+    except ValueError as e:
+        return jsonify({"status": "error", "message": str(e)}), 400
     
-    url = f"{ESP_URL}/gif/control"
     params = {"action": action}
     
     if action == "speed" and "value" in data:
         params["value"] = data["value"]
     
     try:
-        resp = requests.get(url, params=params, timeout=5)
-        app.logger.info(f"GIF control: {action} - {resp.text}")
+        results = await esp_client.control_all([(c.name, c.url) for c in targets], "/gif/control", params)
+        app.logger.info(f"GIF control: {action} - {[r.get('esp_response') or r.get('error') for r in results]}")
         
-        return jsonify({
+        return controllers_response({
             "status": "ok",
             "action": action,
-            "esp_response": resp.text
-        }), 200
+        }, results)
         
     except Exception as e:
         app.logger.error(f"Error controlling GIF: {str(e)}")
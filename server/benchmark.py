@@ -0,0 +1,339 @@
+"""
+Benchmark suite for startup, effects, compositions, previews, GIF processing, payload encoding,
+/get_frames and calibration.
+
+Everything runs on synthetic layouts, so no ESP or phone recording is needed:
+
+    python benchmark.py                          # full suite, compare to history and save
+    python benchmark.py --only effect/ --sizes 250 --no-save
+    python benchmark.py --only effect/ compose/ payload/ --sizes 1000 10000   # large layouts
+    python benchmark.py --threshold 0.5          # allow 50% slowdown before failing
+
+Results are appended to benchmark_history.json (one entry per run, tagged with the
+host). A benchmark regresses when it is slower than the median of its last runs on
+the same host by more than --threshold; the script then exits with status 1.
+"""
+import argparse
+import itertools
+import json
+import math
+import os
+import platform
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+from calibration import codebook, image_processing, synthetic_video
+from effectProcessing.code_effects import LEDEffectGenerator
+from effectProcessing import compositor, gifEffects, preview_cache
+
+SERVER_DIR = os.path.dirname(os.path.abspath(__file__))
+HISTORY_PATH = os.path.join(SERVER_DIR, "benchmark_history.json")
+GIF_DIR = os.path.join(SERVER_DIR, "gifs")
+
+EFFECT_SIZES = (250, 1000, 5000, 10000)
+CALIBRATION_SIZES = (250,)
+CALIBRATION_RESOLUTIONS = ("720x1280",)
+BASELINE_RUNS = 5       # previous runs the baseline median is taken from
+NOISE_FLOOR = 0.002     # seconds; smaller differences never count as a regression
+
+
+# --- Synthetic inputs ---
+
+def write_layout(directory, num_leds):
+    os.makedirs(os.path.join(directory, "jsons"), exist_ok=True)
+    path = os.path.join(directory, "jsons", "led_positions.json")
+    with open(path, "w") as fh:
+        json.dump(synthetic_video.spiral_layout(num_leds), fh)
+    return path
+
+
+# --- Timing ---
+
+def measure(fn, repeat):
+    """Best wall time of `repeat` calls and the last return value."""
+    best = math.inf
+    result = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = fn()
+        best = min(best, time.perf_counter() - start)
+    return best, result
+
+
+class Suite:
+    def __init__(self, only=None, repeat=3):
+        self.only = only or []
+        self.repeat = repeat
+        self.results = {}
+        self.extra = {}
+
+    def wanted(self, name):
+        return not self.only or any(name.startswith(prefix) for prefix in self.only)
+
+    def wants_group(self, group):
+        """True when any benchmark of a group (e.g. "calibration/") can be selected."""
+        return not self.only or any(p.startswith(group) or group.startswith(p) for p in self.only)
+
+    def run(self, name, fn, repeat=None):
+        """Time fn when the benchmark is selected; returns its result, or None when skipped."""
+        if not self.wanted(name):
+            return None
+        seconds, result = measure(fn, repeat or self.repeat)
+        self.results[name] = seconds
+        print(f"  {name:<55} {seconds * 1000:10.2f} ms")
+        return result
+
+    def stage(self, name, fn, repeat=None):
+        """Like run() for pipeline stages: fn always runs, since later stages need its result."""
+        if not self.wanted(name):
+            return fn()
+        return self.run(name, fn, repeat)
+
+
+# --- Benchmarks ---
+
+# Run in a fresh interpreter: time `import app` and report heavy modules it loaded eagerly
+STARTUP_SCRIPT = """
+import json, sys, time
+start = time.perf_counter()
+import app
+seconds = time.perf_counter() - start
+loaded = [m for m in ("cv2", "PIL.Image", "requests", "httpx") if m in sys.modules
+          and not type(sys.modules[m]).__name__.startswith("_Lazy")]
+print(json.dumps({"seconds": seconds, "heavy": loaded}))
+"""
+
+
+def bench_startup(suite, repeat):
+    """Server import time, measured in fresh interpreters (best of `repeat`)."""
+    if not suite.wanted("startup/import_app"):
+        return
+    runs = []
+    for _ in range(repeat):
+        out = subprocess.run([sys.executable, "-c", STARTUP_SCRIPT], cwd=SERVER_DIR,
+                             capture_output=True, text=True, check=True)
+        runs.append(json.loads(out.stdout.strip().splitlines()[-1]))
+    best = min(run["seconds"] for run in runs)
+    suite.results["startup/import_app"] = best
+    print(f"  {'startup/import_app':<55} {best * 1000:10.2f} ms")
+    if runs[-1]["heavy"]:
+        print(f"  ⚠️ imported eagerly at startup: {', '.join(runs[-1]['heavy'])}")
+
+
+def bench_effects(suite, sizes, max_frames):
+    for num_leds in sizes:
+        tmp = tempfile.mkdtemp(prefix="bench_")
+        try:
+            gen = LEDEffectGenerator(write_layout(tmp, num_leds))
+            for name in LEDEffectGenerator.get_effect_names():
+                suite.run(f"effect/{name}/{num_leds}",
+                          lambda: gen.render(name, max_frames=max_frames), repeat=1)
+        finally:
+            shutil.rmtree(tmp)
+
+
+def bench_compose(suite, sizes):
+    """Two blended layers with a feathered region; the second run is served from the layer cache."""
+    layers = [{"effect": "plasma_cloud"},
+              {"effect": "candy_cane_effect", "mode": "screen",
+               "region": {"type": "circle", "center": [0.5, 0.5], "radius": 0.3, "feather": 0.05}}]
+    for num_leds in sizes:
+        tmp = tempfile.mkdtemp(prefix="bench_")
+        try:
+            gen = LEDEffectGenerator(write_layout(tmp, num_leds))
+            compositor.layer_cache.clear()
+            suite.run(f"compose/render/{num_leds}", lambda: compositor.compose(gen, layers, str(num_leds)), repeat=1)
+            suite.run(f"compose/cached/{num_leds}", lambda: compositor.compose(gen, layers, str(num_leds)))
+        finally:
+            compositor.layer_cache.clear()
+            shutil.rmtree(tmp)
+
+
+def bench_previews(suite, sizes):
+    for num_leds in sizes:
+        tmp = tempfile.mkdtemp(prefix="bench_")
+        try:
+            layout = write_layout(tmp, num_leds)
+            suite.run(f"preview/plasma_cloud/{num_leds}", lambda: preview_cache.render_preview(
+                "plasma_cloud", layout, os.path.join(tmp, "preview.mp4")), repeat=1)
+        finally:
+            shutil.rmtree(tmp)
+
+
+def bench_payload(suite, sizes):
+    from app import build_payload
+    for num_leds in sizes:
+        tmp = tempfile.mkdtemp(prefix="bench_")
+        try:
+            frames = LEDEffectGenerator(write_layout(tmp, num_leds)).render("plasma_cloud")
+            suite.run(f"payload/build/{num_leds}", lambda: build_payload(frames))
+        finally:
+            shutil.rmtree(tmp)
+
+
+def bench_gifs(suite, sizes, gif_limit):
+    gifs = sorted(f for f in os.listdir(GIF_DIR) if f.lower().endswith(".gif"))[:gif_limit]
+    for num_leds in sizes:
+        tmp = tempfile.mkdtemp(prefix="bench_")
+        try:
+            layout = write_layout(tmp, num_leds)
+            for gif in gifs:
+                suite.run(f"gif/{os.path.splitext(gif)[0]}/{num_leds}",
+                          lambda: gifEffects.process_gif_effects(os.path.join(GIF_DIR, gif), led_positions_path=layout),
+                          repeat=1)
+        finally:
+            shutil.rmtree(tmp)
+
+
+def bench_get_frames(suite, gif_limit):
+    """/get_frames samples every GIF frame at the LED positions of the current layout."""
+    import app
+    if not os.path.exists(os.path.join(SERVER_DIR, "jsons", "led_positions.json")):
+        print("  ⚠️ jsons/led_positions.json not found, skipping /get_frames")
+        return
+    gifs = sorted(f for f in os.listdir(GIF_DIR) if f.lower().endswith(".gif"))[:gif_limit]
+    upload_dir = app.UPLOAD_DIR
+    app.UPLOAD_DIR = GIF_DIR
+    client = app.app.test_client()
+    for gif in gifs:
+        def request():
+            resp = client.get(f"/get_frames/{gif}")
+            if resp.status_code != 200:
+                raise RuntimeError(f"/get_frames/{gif} returned {resp.status_code}")
+        suite.run(f"get_frames/{os.path.splitext(gif)[0]}", request, repeat=1)
+    app.UPLOAD_DIR = upload_dir
+
+
+def bench_calibration(suite, sizes, resolutions, camera):
+    """Every calibration stage on a rendered calibration video, per LED count and resolution."""
+    if not suite.wants_group("calibration/"):
+        return
+    for num_leds, resolution in itertools.product(sizes, resolutions):
+        tmp = tempfile.mkdtemp(prefix="bench_")
+        try:
+            layout = synthetic_video.spiral_layout(num_leds)
+            mappings = codebook.generate_codebook(num_leds)
+            video = os.path.join(tmp, "calibration.mp4")
+            size = tuple(int(v) for v in resolution.lower().split("x"))
+            info = synthetic_video.render_calibration_video(
+                video, [p for _, p in layout], mappings, size=size, **camera)
+            print(f"  (rendered {num_leds}-LED {resolution} calibration video in {info['render_seconds']:.1f}s)")
+
+            steps = image_processing.calibration_steps(mappings)
+            tag = f"/{num_leds}/{resolution}"
+            suite.run("calibration/find_sync_frames" + tag, lambda: image_processing.find_sync_frames(video), repeat=1)
+            results = suite.stage("calibration/analyze_video" + tag,
+                                  lambda: image_processing.analyze_video(video, num_steps=steps), repeat=1)
+            grouped = suite.stage("calibration/group_detections" + tag,
+                                  lambda: image_processing.group_detections(results), repeat=1)
+            matched = suite.stage("calibration/match_leds" + tag,
+                                  lambda: image_processing.match_calibration_codes(mappings, grouped))
+            corrected = suite.stage("calibration/correct_outliers" + tag,
+                                    lambda: image_processing.correct_outliers_with_quality(matched)[0])
+            suite.run("calibration/fill_missing_leds" + tag,
+                      lambda: image_processing.fill_missing_leds_with_confidence(corrected, num_leds))
+
+            accuracy = synthetic_video.match_accuracy(matched, info["positions"])
+            suite.extra[f"calibration/accuracy{tag}"] = round(accuracy, 4)
+            print(f"  🎯 {accuracy:.1%} of LEDs matched to within 5 px")
+        finally:
+            shutil.rmtree(tmp)
+
+
+# --- History and regressions ---
+
+def host_id():
+    return f"{platform.node()}|{platform.machine()}|py{platform.python_version()}"
+
+
+def load_history(path):
+    try:
+        with open(path) as fh:
+            return json.load(fh)
+    except (OSError, ValueError):
+        return []
+
+
+def find_regressions(history, results, threshold):
+    """[(name, baseline, current)] for benchmarks slower than their baseline median by more than threshold."""
+    host = host_id()
+    previous = [run for run in history if run.get("host") == host]
+    regressions = []
+    for name, current in results.items():
+        past = [run["results"][name] for run in previous if name in run["results"]][-BASELINE_RUNS:]
+        if not past:
+            continue
+        baseline = statistics.median(past)
+        if current > baseline * (1 + threshold) and current - baseline > NOISE_FLOOR:
+            regressions.append((name, baseline, current))
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--only", nargs="+", action="extend", help="Only run benchmarks whose name starts with one of these prefixes")
+    parser.add_argument("--sizes", type=int, nargs="+", default=list(EFFECT_SIZES), help="LED counts for effects/payload/gifs")
+    parser.add_argument("--calibration-sizes", type=int, nargs="+", default=list(CALIBRATION_SIZES))
+    parser.add_argument("--resolutions", nargs="+", default=list(CALIBRATION_RESOLUTIONS),
+                        help="Calibration video sizes, e.g. 720x1280 1080x1920 2160x3840")
+    parser.add_argument("--noise", type=float, default=3.0, help="Calibration video sensor noise")
+    parser.add_argument("--blur", type=float, default=0.0, help="Calibration video defocus blur sigma")
+    parser.add_argument("--shake", type=float, default=0.0, help="Calibration video camera shake (px)")
+    parser.add_argument("--frames", type=int, default=None, help="Render at most this many frames per effect")
+    parser.add_argument("--gifs", type=int, default=None, help="Only the first N bundled GIFs")
+    parser.add_argument("--repeat", type=int, default=3, help="Repetitions for cheap benchmarks (best is kept)")
+    parser.add_argument("--threshold", type=float, default=0.25, help="Allowed slowdown vs the baseline (0.25 = 25%%)")
+    parser.add_argument("--history", default=HISTORY_PATH)
+    parser.add_argument("--no-save", action="store_true", help="Compare only, do not append this run to the history")
+    args = parser.parse_args()
+
+    suite = Suite(args.only, args.repeat)
+    print("⏱️ Startup")
+    bench_startup(suite, args.repeat)
+    print("⏱️ Effects")
+    bench_effects(suite, args.sizes, args.frames)
+    print("⏱️ Compositions")
+    bench_compose(suite, args.sizes)
+    print("⏱️ Previews")
+    bench_previews(suite, args.sizes)
+    print("⏱️ Payload encoding")
+    bench_payload(suite, args.sizes)
+    print("⏱️ GIF processing")
+    bench_gifs(suite, args.sizes, args.gifs)
+    print("⏱️ /get_frames")
+    if suite.wanted("get_frames/"):
+        bench_get_frames(suite, args.gifs)
+    print("⏱️ Calibration")
+    bench_calibration(suite, args.calibration_sizes, args.resolutions,
+                      {"noise": args.noise, "blur": args.blur, "shake": args.shake})
+
+    history = load_history(args.history)
+    regressions = find_regressions(history, suite.results, args.threshold)
+
+    if not args.no_save and suite.results:
+        history.append({
+            "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "host": host_id(),
+            "settings": {"frames": args.frames, "repeat": args.repeat,
+                         "camera": {"noise": args.noise, "blur": args.blur, "shake": args.shake}},
+            "results": {name: round(seconds, 6) for name, seconds in suite.results.items()},
+            "extra": suite.extra,
+        })
+        with open(args.history, "w") as fh:
+            json.dump(history, fh, indent=1)
+        print(f"💾 Saved run to {args.history}")
+
+    if regressions:
+        print(f"\n❌ {len(regressions)} regression(s) beyond {args.threshold:.0%}:")
+        for name, baseline, current in regressions:
+            print(f"   {name}: {baseline * 1000:.2f} ms -> {current * 1000:.2f} ms ({current / baseline - 1:+.0%})")
+        sys.exit(1)
+    print(f"\n✅ {len(suite.results)} benchmarks, no regressions beyond {args.threshold:.0%}")
+
+
+if __name__ == "__main__":
+    main()
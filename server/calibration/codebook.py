@@ -0,0 +1,131 @@
+import numpy as np
+
+# Symbols the ESP can show during calibration, in digit order (R=0, G=1, B=2)
+SYMBOLS = 'RGB'
+
+# Frames per code the ESP plays back: keep in sync with NUM_FRAMES in
+# SmartChristmasTree_ESP/src/main.cpp (holds up to 3 ** 6 = 729 codes)
+FIRMWARE_CODE_LEN = 9
+
+def _check_symbols(code_len):
+    """Number of parity symbols r for a shortened ternary Hamming code of length code_len."""
+    r = 2
+    while (3 ** r - 1) // 2 < code_len:
+        r += 1
+    return r
+
+def _normalized_columns(r):
+    """All non-zero length-r vectors over GF(3) whose first non-zero entry is 1, in lex order."""
+    cols = []
+    for value in range(1, 3 ** r):
+        digits = [(value // 3 ** (r - 1 - i)) % 3 for i in range(r)]
+        if digits[next(i for i, d in enumerate(digits) if d)] == 1:
+            cols.append(digits)
+    return np.array(cols, dtype=np.int64).T
+
+def parity_check_matrix(code_len):
+    """
+    Systematic parity-check matrix H = [A | I] of a shortened ternary Hamming code.
+    No column is zero or a multiple of another, so the code has minimum distance 3.
+    """
+    r = _check_symbols(code_len)
+    if code_len <= r:
+        raise ValueError(f"code_len must be greater than {r}")
+    identity = np.eye(r, dtype=np.int64)
+    others = [c for c in _normalized_columns(r).T if not any((c == u).all() for u in identity)]
+    A = np.array(others[:code_len - r], dtype=np.int64).T
+    return np.hstack([A, identity])
+
+def code_length_for(count):
+    """Shortest code length whose codebook holds at least `count` codewords."""
+    k = 1
+    while 3 ** k < count:
+        k += 1
+    n = k + 2
+    while n - _check_symbols(n) < k:
+        n += 1
+    return n
+
+def generate_codebook(count, code_len=None):
+    """
+    Deterministic list of `count` R/G/B codes with pairwise Hamming distance >= 3,
+    so any single misdetected frame in a code can be corrected.
+    """
+    if code_len is None:
+        code_len = code_length_for(count)
+    H = parity_check_matrix(code_len)
+    r = H.shape[0]
+    k = code_len - r
+    if 3 ** k < count:
+        raise ValueError(f"code length {code_len} only holds {3 ** k} codes, {count} requested")
+
+    messages = np.arange(count)[:, None] // (3 ** np.arange(k - 1, -1, -1)) % 3
+    parity = (-messages @ H[:, :k].T) % 3
+    words = np.hstack([messages, parity])
+    return [''.join(SYMBOLS[d] for d in w) for w in words]
+
+def codes_to_array(codes):
+    """Convert R/G/B strings to an (N, L) int array; any other symbol (e.g. 'N') becomes -1."""
+    lookup = {s: i for i, s in enumerate(SYMBOLS)}
+    return np.array([[lookup.get(c, -1) for c in code] for code in codes], dtype=np.int64).reshape(len(codes), -1)
+
+def syndrome_table(H):
+    """Map every correctable syndrome (as a base-3 int) to (position, error value); -1 where undecodable."""
+    r, n = H.shape
+    weights = 3 ** np.arange(r - 1, -1, -1)
+    positions = np.full(3 ** r, -1, dtype=np.int64)
+    values = np.zeros(3 ** r, dtype=np.int64)
+    for j in range(n):
+        for e in (1, 2):
+            s = int(((e * H[:, j]) % 3) @ weights)
+            positions[s] = j
+            values[s] = e
+    return positions, values
+
+def decode_codes(codes):
+    """
+    Correct up to one wrong or missing ('N') symbol per code with syndrome decoding.
+    Returns a list with the corrected code, or None when it cannot be decoded.
+    """
+    if not codes:
+        return []
+    code_len = len(codes[0])
+    H = parity_check_matrix(code_len)
+    positions, values = syndrome_table(H)
+    weights = 3 ** np.arange(H.shape[0] - 1, -1, -1)
+
+    words = codes_to_array(codes)
+    erased = words < 0
+    words[erased] = 0
+    syndromes = ((words @ H.T) % 3) @ weights
+
+    err_pos = positions[syndromes]
+    ok = (syndromes == 0) | (err_pos >= 0)
+    # an erasure is only correctable when the syndrome points at it
+    n_erased = erased.sum(axis=1)
+    erased_pos = np.argmax(erased, axis=1)
+    ok &= (n_erased == 0) | ((n_erased == 1) & ((syndromes == 0) | (err_pos == erased_pos)))
+
+    fix = (syndromes != 0) & ok
+    rows = np.flatnonzero(fix)
+    words[rows, err_pos[rows]] = (words[rows, err_pos[rows]] - values[syndromes[rows]]) % 3
+
+    return [''.join(SYMBOLS[d] for d in w) if good else None for w, good in zip(words, ok)]
+
+def is_codebook(codes):
+    """True when every code is a codeword of the parity-check code for its length."""
+    if not codes or len({len(c) for c in codes}) != 1:
+        return False
+    try:
+        H = parity_check_matrix(len(codes[0]))
+    except ValueError:
+        return False
+    words = codes_to_array(codes)
+    return bool((words >= 0).all() and not ((words @ H.T) % 3).any())
+
+def min_distance(codes):
+    """Smallest pairwise Hamming distance between codes (vectorized distance matrix)."""
+    words = codes_to_array(codes)
+    dist = (words[:, None, :] != words[None, :, :]).sum(axis=2)
+    np.fill_diagonal(dist, words.shape[1] + 1)
+    return int(dist.min())
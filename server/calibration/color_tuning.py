@@ -1,15 +1,156 @@
 import cv2
 import numpy as np
 import json
+import os
+import tempfile
+import time
+from multiprocessing import Pool
 from pathlib import Path
 import sys
 
 # Add parent directory to path to import image_processing
 sys.path.insert(0, str(Path(__file__).parent.parent))
-from calibration.image_processing import detect_leds_in_frame, analyze_video, group_detections, match_leds
+from calibration.image_processing import detect_leds_in_hsv, iter_calibration_frames, group_detections, match_calibration_codes, calibration_steps
 
 
-def optimize_color_ranges_with_feedback(video_path, mappings_path, max_iterations=20, population_size=20):
+# Histogram bins per HSV channel used for the cheap pre-scoring (H: 2 wide, S/V: 8 wide)
+HIST_BINS = (90, 32, 32)
+
+def cache_calibration_frames(video_path, num_steps, scale=0.5, cache_path=None):
+    """
+    Decode, downscale and convert the sampled calibration frames to HSV once
+    and save them as a .npy file that the tuning workers memory-map.
+    Returns the file path.
+    """
+    frames = np.stack([cv2.cvtColor(frame, cv2.COLOR_BGR2HSV)
+                       for _, _, frame in iter_calibration_frames(video_path, num_steps=num_steps, scale=scale)])
+    if cache_path is None:
+        fd, cache_path = tempfile.mkstemp(suffix=".npy", prefix="calibration_hsv_")
+        os.close(fd)
+    np.save(cache_path, frames)
+    return cache_path
+
+def build_hsv_integrals(hsv_frames, bins=HIST_BINS):
+    """
+    Per-frame 3D HSV histograms turned into integral (cumulative-sum) tables,
+    so the number of pixels inside any HSV box is 8 lookups per frame.
+    Returns (integrals of shape (F, Hb+1, Sb+1, Vb+1), bin widths).
+    """
+    widths = np.array([180 // bins[0], 256 // bins[1], 256 // bins[2]])
+    integrals = np.zeros((len(hsv_frames),) + tuple(b + 1 for b in bins), dtype=np.int64)
+    for f, hsv in enumerate(hsv_frames):
+        idx = hsv.reshape(-1, 3) // widths
+        flat = (idx[:, 0] * bins[1] + idx[:, 1]) * bins[2] + idx[:, 2]
+        hist = np.bincount(flat, minlength=bins[0] * bins[1] * bins[2]).reshape(bins)
+        integrals[f, 1:, 1:, 1:] = hist.cumsum(0).cumsum(1).cumsum(2)
+    return integrals, widths
+
+def box_pixel_counts(integrals, widths, lower, upper):
+    """Pixels per frame inside the HSV box [lower, upper] (bounds snapped to histogram bins)."""
+    h0, s0, v0 = np.asarray(lower) // widths
+    h1, s1, v1 = np.asarray(upper) // widths + 1
+    I = integrals
+    return (I[:, h1, s1, v1] - I[:, h0, s1, v1] - I[:, h1, s0, v1] - I[:, h1, s1, v0]
+            + I[:, h0, s0, v1] + I[:, h0, s1, v0] + I[:, h1, s0, v0] - I[:, h0, s0, v0])
+
+def expected_color_counts(mappings, num_frames):
+    """How many LEDs show each colour in every sampled frame, from the codebook."""
+    code_len = len(mappings[0])
+    return {color: np.array([sum(code[f % code_len] == color for code in mappings) for f in range(num_frames)])
+            for color in ['R', 'G', 'B']}
+
+def prescore_ranges(ranges, integrals, widths, expected, max_fraction=0.05):
+    """
+    Cheap fitness from integral histograms only: how well the pixel count in
+    each colour box follows the number of LEDs the codebook lights in that
+    colour, frame by frame (Pearson correlation, -1..1). Boxes that swallow
+    more than `max_fraction` of the frame (background) are penalised. A
+    colour the codebook shows equally often in every frame scores the
+    steadiness of its pixel count instead.
+    """
+    pixels_per_frame = integrals[0, -1, -1, -1]
+    total = 0.0
+    for color in ['R', 'G', 'B']:
+        counts = box_pixel_counts(integrals, widths, ranges[color]['lower'], ranges[color]['upper']).astype(float)
+        exp = expected[color].astype(float)
+        corr = 0.0
+        if counts.std() > 0 and exp.std() > 0:
+            corr = float(np.corrcoef(counts, exp)[0, 1])
+        elif exp.std() == 0 and exp.mean() > 0 and counts.mean() > 0:
+            # constant expectation: reward a steady pixel count instead
+            corr = 1.0 - min(1.0, counts.std() / counts.mean())
+        if counts.mean() > max_fraction * pixels_per_frame:
+            corr -= 1.0
+        total += corr
+    return total / 3.0
+
+def format_color_ranges(ranges, scale=1.0):
+    """
+    Convert tuner ranges to the detect_leds_in_frame format. Blur and min
+    area are scaled so frames downscaled by `scale` behave like full-size ones.
+    """
+    blur = max(1, int(round(ranges['blur'] * scale)))
+    return {
+        'R': (np.array(ranges['R']['lower']), np.array(ranges['R']['upper'])),
+        'G': (np.array(ranges['G']['lower']), np.array(ranges['G']['upper'])),
+        'B': (np.array(ranges['B']['lower']), np.array(ranges['B']['upper'])),
+        'blur': blur if blur % 2 else blur + 1,
+        'area': ranges['area'] * scale * scale
+    }
+
+def score_ranges(ranges, frames, mappings, scale=1.0):
+    """Score a set of HSV ranges on cached frames based on actual LED matching quality"""
+    num_leds = len(mappings)
+    color_ranges = format_color_ranges(ranges, scale)
+
+    # Run the actual detection pipeline with these ranges (frames are already HSV)
+    results = [(step_id, detect_leds_in_hsv(hsv, color_ranges))
+               for step_id, hsv in enumerate(frames)]
+    grouped = group_detections(results, match_radius=15.0 * scale)
+    matched = match_calibration_codes(mappings, grouped)
+
+    num_matched = len(matched)
+
+    # Score based on number of matched LEDs (primary metric)
+    match_ratio = num_matched / num_leds
+    match_score = match_ratio * 100
+
+    # Bonus for exact match
+    if num_matched == num_leds:
+        match_score += 10
+
+    # Slight penalty for over-matching (false positives)
+    if num_matched > num_leds:
+        overmatch_penalty = (num_matched - num_leds) * 0.5
+        match_score -= overmatch_penalty
+
+    return max(0, match_score), num_matched
+
+def ranges_key(ranges):
+    """Hashable, order-independent key used to memoize fitness."""
+    return tuple(
+        (color, tuple(int(v) for v in ranges[color]['lower']), tuple(int(v) for v in ranges[color]['upper']))
+        for color in ['R', 'G', 'B']
+    ) + (int(ranges['blur']), int(ranges['area']))
+
+# Per-process state for the evaluation pool (set once by _init_worker)
+_worker_state = {}
+
+def _init_worker(cache_path, mappings, scale):
+    _worker_state['frames'] = np.load(cache_path, mmap_mode='r')
+    _worker_state['mappings'] = mappings
+    _worker_state['scale'] = scale
+
+def _evaluate_in_worker(ranges):
+    try:
+        return score_ranges(ranges, _worker_state['frames'], _worker_state['mappings'], _worker_state['scale'])
+    except Exception as e:
+        print(f"⚠️  Evaluation error: {e}")
+        return 0, 0
+
+
+def optimize_color_ranges_with_feedback(video_path, mappings_path, max_iterations=20, population_size=20,
+                                        processes=None, frame_scale=0.5, cache_path=None, full_eval_top=5):
     """
     Automatic HSV range optimization using genetic algorithm with feedback from detection quality.
     
@@ -19,6 +160,16 @@ def optimize_color_ranges_with_feedback(video_path, mappings_path, max_iteration
     3. Score based on: number of detections, match quality, consistency
     4. Keep best performers and mutate for next generation
     5. Converge to optimal ranges
+
+    The sampled frames are decoded (and downscaled by `frame_scale`) once into
+    a memory-mapped .npy cache, each generation is scored across `processes`
+    worker processes (None = all cores, 1 = in-process), and the fitness of
+    every candidate already seen is reused instead of recomputed.
+
+    The cache holds HSV frames, and their integral histograms pre-score every
+    candidate with box lookups; only the `full_eval_top` best pre-scores of a
+    generation run the contour/match pipeline. The rest rank below any fully
+    scored candidate (score = pre-score - 2).
     """
     print("🧬 AUTOMATIC COLOR CALIBRATION WITH FEEDBACK LOOP")
     print("=" * 60)
@@ -27,6 +178,15 @@ def optimize_color_ranges_with_feedback(video_path, mappings_path, max_iteration
     with open(mappings_path, 'r') as f:
         mappings = json.load(f)
     num_leds = len(mappings)
+
+    started = time.perf_counter()
+    owns_cache = cache_path is None
+    cache_path = cache_calibration_frames(video_path, calibration_steps(mappings), frame_scale, cache_path)
+    hsv_frames = np.load(cache_path, mmap_mode='r')
+    integrals, widths = build_hsv_integrals(hsv_frames)
+    expected = expected_color_counts(mappings, len(hsv_frames))
+    del hsv_frames
+    print(f"🎞️  Cached {len(integrals)} HSV frames and histograms in {cache_path} ({time.perf_counter() - started:.1f}s)")
     
     from calibration.image_processing import default_ranges
     # Initial HSV ranges (starting point - current defaults)
@@ -40,44 +200,6 @@ def optimize_color_ranges_with_feedback(video_path, mappings_path, max_iteration
     
     print(f"🎯 Target: Detect {num_leds} LEDs reliably")
     
-    def evaluate_ranges(ranges):
-        """Score a set of HSV ranges based on actual LED matching quality"""
-        # Convert ranges to the format expected by analyze_video
-        color_ranges_formatted = {
-            'R': (np.array(ranges['R']['lower']), np.array(ranges['R']['upper'])),
-            'G': (np.array(ranges['G']['lower']), np.array(ranges['G']['upper'])),
-            'B': (np.array(ranges['B']['lower']), np.array(ranges['B']['upper'])),
-            'blur': ranges['blur'],
-            'area': ranges['area']
-        }
-        
-        # Run the actual detection pipeline with these ranges
-        try:
-            results = analyze_video(video_path, debug=False, color_ranges=color_ranges_formatted)
-            grouped = group_detections(results)
-            matched = match_leds(mappings, grouped)
-            
-            num_matched = len(matched)
-            
-            # Score based on number of matched LEDs (primary metric)
-            match_ratio = num_matched / num_leds
-            match_score = match_ratio * 100
-            
-            # Bonus for exact match
-            if num_matched == num_leds:
-                match_score += 10
-            
-            # Slight penalty for over-matching (false positives)
-            if num_matched > num_leds:
-                overmatch_penalty = (num_matched - num_leds) * 0.5
-                match_score -= overmatch_penalty
-            
-            return max(0, match_score), num_matched
-            
-        except Exception as e:
-            print(f"⚠️  Evaluation error: {e}")
-            return 0, 0
-    
     def mutate_ranges(ranges, mutation_rate=0.2):
         """Create a mutated copy of ranges"""
         new_ranges = {}
@@ -139,43 +261,77 @@ def optimize_color_ranges_with_feedback(video_path, mappings_path, max_iteration
     best_score = 0
     best_ranges = base_ranges
     best_detections = 0
-    
-    for iteration in range(max_iterations):
-        # Evaluate population
-        scores = []
-        for candidate in population:
-            score, avg_det = evaluate_ranges(candidate)
-            scores.append((score, avg_det, candidate))
-        
-        # Sort by score
-        scores.sort(reverse=True, key=lambda x: x[0])
-        
-        current_best_score, current_best_det, current_best_ranges = scores[0]
-        
-        if current_best_score > best_score:
-            best_score = current_best_score
-            best_ranges = current_best_ranges
-            best_detections = current_best_det
-            print(f"🔥 Iteration {iteration+1}: New best score={best_score:.1f}, matched={int(best_detections)}/{num_leds}")
-        else:
-            print(f"   Iteration {iteration+1}: score={current_best_score:.1f}, matched={int(current_best_det)}/{num_leds}")
-        
-        # Early stopping if we're close to target
-        if abs(best_detections - num_leds) < 5 and best_score > 90:
-            print(f"✅ Converged! Score={best_score:.1f}, Matched={int(best_detections)}/{num_leds}")
-            break
-        
-        # Selection: keep top 50%
-        survivors = [candidate for _, _, candidate in scores[:population_size // 2]]
-        
-        # Generate new population through mutation
-        new_population = survivors.copy()
-        while len(new_population) < population_size:
-            parent = survivors[np.random.randint(0, len(survivors))]
-            child = mutate_ranges(parent, mutation_rate=0.25)
-            new_population.append(child)
-        
-        population = new_population
+
+    fitness_cache = {}
+    pool = None
+    if processes == 1:
+        _init_worker(cache_path, mappings, frame_scale)
+    else:
+        pool = Pool(processes, initializer=_init_worker, initargs=(cache_path, mappings, frame_scale))
+
+    prescore_cache = {}
+
+    def evaluate_population(population):
+        keys = [ranges_key(candidate) for candidate in population]
+        for key, candidate in zip(keys, population):
+            if key not in prescore_cache:
+                prescore_cache[key] = prescore_ranges(candidate, integrals, widths, expected)
+
+        # Only the best pre-scored candidates never seen before are sent to the workers
+        by_key = dict(zip(keys, population))
+        ranked = sorted(by_key, key=prescore_cache.get, reverse=True)[:full_eval_top]
+        pending = {key: by_key[key] for key in ranked if key not in fitness_cache}
+        if pending:
+            candidates = list(pending.values())
+            outcomes = pool.map(_evaluate_in_worker, candidates) if pool else [_evaluate_in_worker(c) for c in candidates]
+            fitness_cache.update(zip(pending, outcomes))
+        return [(fitness_cache[key] if key in fitness_cache else (prescore_cache[key] - 2.0, 0)) + (candidate,)
+                for key, candidate in zip(keys, population)]
+
+    try:
+        for iteration in range(max_iterations):
+            # Evaluate population
+            scores = evaluate_population(population)
+            
+            # Sort by score
+            scores.sort(reverse=True, key=lambda x: x[0])
+            
+            current_best_score, current_best_det, current_best_ranges = scores[0]
+            
+            if current_best_score > best_score:
+                best_score = current_best_score
+                best_ranges = current_best_ranges
+                best_detections = current_best_det
+                print(f"🔥 Iteration {iteration+1}: New best score={best_score:.1f}, matched={int(best_detections)}/{num_leds}")
+            else:
+                print(f"   Iteration {iteration+1}: score={current_best_score:.1f}, matched={int(current_best_det)}/{num_leds}")
+            
+            # Early stopping if we're close to target
+            if abs(best_detections - num_leds) < 5 and best_score > 90:
+                print(f"✅ Converged! Score={best_score:.1f}, Matched={int(best_detections)}/{num_leds}")
+                break
+            
+            # Selection: keep top 50%
+            survivors = [candidate for _, _, candidate in scores[:population_size // 2]]
+            
+            # Generate new population through mutation
+            new_population = survivors.copy()
+            while len(new_population) < population_size:
+                parent = survivors[np.random.randint(0, len(survivors))]
+                child = mutate_ranges(parent, mutation_rate=0.25)
+                new_population.append(child)
+            
+            population = new_population
+    finally:
+        if pool:
+            pool.close()
+            pool.join()
+        _worker_state.clear()  # drop the memmap before deleting its file
+        if owns_cache:
+            os.remove(cache_path)
+
+    print(f"⏱️  {len(prescore_cache)} candidates pre-scored, {len(fitness_cache)} fully scored "
+          f"in {time.perf_counter() - started:.1f}s")
     
     print("\n" + "=" * 60)
     print(f"🎯 OPTIMIZATION COMPLETE")
@@ -3,6 +3,9 @@ import numpy as np
 import os
 import json
 from pathlib import Path
+from calibration import codebook
+from metrics import span
+import shared_state
 
 default_ranges = {
     'R': (np.array([130, 180, 41]), np.array([179, 255, 255])),
@@ -12,8 +15,11 @@ default_ranges = {
     'area' : 5
 }
 
-def detect_leds_in_frame(frame, step_id=0, frame_id=0, debug=False, save_dir="led_debug_frames", color_ranges=default_ranges):
-    hsv = cv2.cvtColor(frame, cv2.COLOR_BGR2HSV)
+# Repetitions of the code pattern the ESP plays (must match NUM_CAL_STEPS in main.cpp)
+NUM_CAL_STEPS = 3
+
+def detect_leds_in_hsv(hsv, color_ranges=default_ranges):
+    """Find LED blobs in an already converted HSV frame; returns [(cx, cy, color), ...]."""
     masks = {
         'R': cv2.inRange(hsv, color_ranges['R'][0], color_ranges['R'][1]), 
         'G': cv2.inRange(hsv, color_ranges['G'][0], color_ranges['G'][1]),
@@ -22,9 +28,6 @@ def detect_leds_in_frame(frame, step_id=0, frame_id=0, debug=False, save_dir="le
     masks = {color: cv2.GaussianBlur(mask, (color_ranges['blur'],color_ranges['blur']), 0) for color, mask in masks.items()}
 
     detections = []
-    debug_vis = frame.copy()
-    os.makedirs(save_dir, exist_ok=True)
-
     for color, mask in masks.items():
         contours, _ = cv2.findContours(mask, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
         for c in contours:
@@ -32,18 +35,26 @@ def detect_leds_in_frame(frame, step_id=0, frame_id=0, debug=False, save_dir="le
                 x, y, w, h = cv2.boundingRect(c)
                 cx, cy = x + w // 2, y + h // 2
                 detections.append((cx, cy, color))
+    return detections
 
-                color_map = {
-                    'R': (0, 0, 255),
-                    'G': (0, 255, 0),
-                    'B': (255, 0, 0)
-                }
-                cv2.circle(debug_vis, (cx, cy), 5, color_map[color], 2)
-                cv2.putText(debug_vis, color, (cx + 5, cy - 5),
-                            cv2.FONT_HERSHEY_SIMPLEX, 0.5, color_map[color], 1)
+def detect_leds_in_frame(frame, step_id=0, frame_id=0, debug=False, save_dir="led_debug_frames", color_ranges=default_ranges):
+    hsv = cv2.cvtColor(frame, cv2.COLOR_BGR2HSV)
+    detections = detect_leds_in_hsv(hsv, color_ranges)
 
     # Only show live debug window if debug=True
     if debug:
+        os.makedirs(save_dir, exist_ok=True)
+        debug_vis = frame.copy()
+        color_map = {
+            'R': (0, 0, 255),
+            'G': (0, 255, 0),
+            'B': (255, 0, 0)
+        }
+        for (cx, cy, color) in detections:
+            cv2.circle(debug_vis, (cx, cy), 5, color_map[color], 2)
+            cv2.putText(debug_vis, color, (cx + 5, cy - 5),
+                        cv2.FONT_HERSHEY_SIMPLEX, 0.5, color_map[color], 1)
+
         if(step_id == 0):
             cv2.imwrite(os.path.join(save_dir, f"frame_first.jpg"), frame)
         cv2.imwrite(os.path.join(save_dir, f"frame_{step_id:04d}_detected.jpg"), debug_vis)
@@ -152,7 +163,11 @@ def find_sync_frames(video_path, debug=False):
     sync_indices = np.array([start_frame, end_frame])
     return sync_indices, brightness
 
-def analyze_video(video_path, debug=False, color_ranges=default_ranges):
+def iter_calibration_frames(video_path, debug=False, num_steps=30, scale=1.0):
+    """
+    Yield (step_id, frame_id, frame) for every sampled calibration step.
+    Frames are resized by `scale` when it is not 1.0.
+    """
     sync_indices, brightness = find_sync_frames(video_path, debug=debug)
     start, end = sync_indices[0], sync_indices[-1]
     
@@ -171,44 +186,47 @@ def analyze_video(video_path, debug=False, color_ranges=default_ranges):
 
     frame_id = 0
     step_id = 0
-    results = []
 
     target_interval_s = 0.3
     if debug:
         print(f"   Starting analysis at {cap.get(cv2.CAP_PROP_POS_MSEC):.1f} ms")
     next_target_ms = start_ms + 2250.0  # Start sampling 2500ms after sync
 
-    while True:
-        ret, frame = cap.read()
-        
-        if not ret:
-            break
-
-        #if frame_id < start + 1:
-        #    frame_id += 1
-        #    continue
+    try:
+        while True:
+            ret, frame = cap.read()
+            
+            if not ret:
+                break
 
-        current_ms = cap.get(cv2.CAP_PROP_POS_MSEC)  # timestamp of this frame
-        # process frames when their timestamp crosses the next target time
-        if current_ms >= next_target_ms:
-            detections = detect_leds_in_frame(frame,step_id,frame_id,debug, color_ranges=color_ranges)
-            results.append((step_id, detections))
-            step_id += 1
-            # handle frame
-            next_target_ms += target_interval_s * 1000.0
+            current_ms = cap.get(cv2.CAP_PROP_POS_MSEC)  # timestamp of this frame
+            # process frames when their timestamp crosses the next target time
+            if current_ms >= next_target_ms:
+                if scale != 1.0:
+                    frame = cv2.resize(frame, None, fx=scale, fy=scale, interpolation=cv2.INTER_AREA)
+                yield step_id, frame_id, frame
+                step_id += 1
+                next_target_ms += target_interval_s * 1000.0
 
-        if step_id >= 30:
-            break
+            if step_id >= num_steps:
+                break
 
-        frame_id += 1
+            frame_id += 1
+    finally:
+        cap.release()
 
-    cap.release()
+def analyze_video(video_path, debug=False, color_ranges=default_ranges, num_steps=30):
+    results = []
+    for step_id, frame_id, frame in iter_calibration_frames(video_path, debug, num_steps):
+        detections = detect_leds_in_frame(frame,step_id,frame_id,debug, color_ranges=color_ranges)
+        results.append((step_id, detections))
     return results
 
-def group_detections(results):
+def group_detections(results, match_radius=15.0):
     """
     Improved detection grouping with dynamic position tracking and outlier rejection.
     Uses clustering across all frames instead of just anchoring to frame 0.
+    `match_radius` is the largest jump (pixels) a detection may make and still join a track.
     """
     if not results:
         return []
@@ -241,8 +259,8 @@ def group_detections(results):
                     
                     distance = np.sqrt((x - avg_x) ** 2 + (y - avg_y) ** 2)
                     
-                    # Match if within reasonable distance (15 pixels)
-                    if distance < 15.0 and distance < best_distance:
+                    # Match if within reasonable distance (15 pixels at full resolution)
+                    if distance < match_radius and distance < best_distance:
                         best_match = det_idx
                         best_distance = distance
                 
@@ -291,94 +309,238 @@ def group_detections(results):
     
     return leds_detected
 
-def match_leds(mappings, grouped, debug = False, save_dir="led_debug_frames", base_frame_path=None):
-    matched = []
+def split_track_codes(colors, code_len=6):
+    """Split a track's per-step colours into consecutive code_len segments (partial tail dropped)."""
+    return [''.join(colors[j:j + code_len]) for j in range(0, len(colors) - code_len + 1, code_len)]
+
+def build_code_index(grouped, code_len=6, max_distance=0, decoder=None):
+    """
+    Compute every track's code segments once and index them.
+
+    Returns (exact_index, near_index):
+      exact_index[code]  -> {track_idx: votes}
+      near_index[masked] -> [(track_idx, segment, votes), ...]
+    `masked` is a segment with one position replaced by '*', so two codes are
+    within Hamming distance 1 iff they share a masked key. 'N' (missed frame)
+    behaves like any other mismatching symbol. near_index is only built when
+    max_distance > 0.
+    When a `decoder` is given (see codebook.decode_codes) all segments are
+    corrected in one batch before indexing; undecodable segments are dropped.
+    """
+    track_segments = [split_track_codes(colors, code_len) for (_, colors) in grouped]
+    if decoder is not None:
+        decoded = iter(decoder([seg for segments in track_segments for seg in segments]))
+        track_segments = [[d for d in (next(decoded) for _ in segments) if d is not None]
+                          for segments in track_segments]
+
+    exact_index = {}
+    near_index = {}
+    for track_idx, segments in enumerate(track_segments):
+        votes = {}
+        for segment in segments:
+            votes[segment] = votes.get(segment, 0) + 1
+        for segment, count in votes.items():
+            exact_index.setdefault(segment, {})[track_idx] = count
+            if max_distance > 0:
+                for p in range(len(segment)):
+                    key = segment[:p] + '*' + segment[p + 1:]
+                    near_index.setdefault(key, []).append((track_idx, segment, count))
+    return exact_index, near_index
+
+def match_leds_detailed(mappings, grouped, min_votes=3, max_distance=0, decoder=None):
+    """
+    Match mapping codes to grouped tracks with dictionary lookups.
+
+    A track is a candidate for a mapping when at least `min_votes` of its
+    segments equal the mapping (or, with max_distance=1, are one symbol away).
+    Exact votes rank ahead of tolerant ones. Pairs are assigned strongest vote
+    first, so a track or mapping that loses a conflict falls back to its
+    next-best candidate that is still free. `decoder` corrects segments
+    before indexing (only meaningful when mappings form an error-correcting codebook).
+
+    Returns (matched, report) where report holds:
+      'ambiguous':  [(mapping_idx, [track_idx, ...]), ...] several tracks tied for best vote
+      'duplicates': [(track_idx, [mapping_idx, ...]), ...] several mappings claimed the track
+      'unmatched':  [(track_idx, reason), ...] tracks with candidates that all went elsewhere
+    """
+    if not mappings:
+        return [], {'ambiguous': [], 'duplicates': [], 'unmatched': []}
+    exact_index, near_index = build_code_index(grouped, len(mappings[0]), max_distance, decoder)
+
+    pairs = []  # (exact_votes, total_votes, mapping_idx, track_idx) for every candidate
+    claims = {}  # track_idx -> [mapping_idx, ...] that ranked it first
+    ambiguous = []
     for (i, mapping) in enumerate(mappings):
-        for (pos, colors) in grouped:
-            detected_codes = [''.join(colors[j:j+6]) for j in range(0, len(colors), 6)]
-            # if theres more than one equal 6-length segment
-            num_found = 0
-            for detected_code in detected_codes:
-                if mapping == detected_code:
-                    num_found += 1
-            if num_found > 2:
-                matched.append((i, pos))
-                break
+        scores = {t: [v, v] for t, v in exact_index.get(mapping, {}).items()}
+        if max_distance > 0:
+            for p in range(len(mapping)):
+                key = mapping[:p] + '*' + mapping[p + 1:]
+                for (t, segment, votes) in near_index.get(key, ()):
+                    if segment != mapping:
+                        scores.setdefault(t, [0, 0])[1] += votes
+
+        candidates = sorted(((ex, tot, t) for t, (ex, tot) in scores.items() if tot >= min_votes),
+                            key=lambda c: (c[0], c[1], -c[2]), reverse=True)
+        if not candidates:
+            continue
+        tied = [t for ex, tot, t in candidates if (ex, tot) == candidates[0][:2]]
+        if len(tied) > 1:
+            ambiguous.append((i, tied))
+        claims.setdefault(candidates[0][2], []).append(i)
+        pairs.extend((ex, tot, i, t) for ex, tot, t in candidates)
+
+    duplicates = [(t, sorted(ids)) for t, ids in claims.items() if len(ids) > 1]
+
+    # Greedy assignment, strongest vote first; ties go to the lower mapping, then the lower track
+    pairs.sort(key=lambda p: (-p[0], -p[1], p[2], p[3]))
+    owner = {}  # mapping_idx -> track_idx
+    assigned = {}  # track_idx -> mapping_idx
+    lost = {}  # track_idx -> first (mapping_idx, owning track) it lost
+    for ex, tot, i, t in pairs:
+        if t in assigned:
+            continue
+        if i in owner:
+            lost.setdefault(t, (i, owner[i]))
+            continue
+        owner[i] = t
+        assigned[t] = i
+
+    matched = sorted((i, grouped[t][0]) for i, t in owner.items())
+    unmatched = [(t, f"LED {i} went to track {winner} with a stronger vote")
+                 for t, (i, winner) in sorted(lost.items()) if t not in assigned]
+
+    return matched, {'ambiguous': ambiguous, 'duplicates': duplicates, 'unmatched': unmatched}
+
+def match_leds(mappings, grouped, debug = False, save_dir="led_debug_frames", base_frame_path=None, min_votes=3, max_distance=0, decoder=None):
+    matched, report = match_leds_detailed(mappings, grouped, min_votes=min_votes, max_distance=max_distance, decoder=decoder)
+    if debug:
+        print(f"   Matched {len(matched)}/{len(mappings)} LEDs "
+              f"({len(report['ambiguous'])} ambiguous, {len(report['duplicates'])} duplicate tracks, "
+              f"{len(report['unmatched'])} tracks left unmatched)")
     return matched
 
-def fill_missing_leds(matched, num_leds):
-    matched_dict = {i: pos for (i, pos) in matched}
-    for i in range(num_leds):
-        if i not in matched_dict:
-            # Find nearest known neighbors safely to predict a position.
-            # Prefer averaging previous and next known positions when available.
-            prev_idx = None
-            next_idx = None
-            # search backwards for previous known
-            for j in range(i - 1, -1, -1):
-                if j in matched_dict:
-                    prev_idx = j
-                    break
-            # search forwards for next known
-            for j in range(i + 1, num_leds):
-                if j in matched_dict:
-                    next_idx = j
-                    break
+def match_calibration_codes(mappings, grouped, debug=False):
+    """
+    Match with the settings the mappings support: codebooks generated by
+    calibration.codebook are decoded (one error per code corrected) and need a
+    simple majority of NUM_CAL_STEPS votes; legacy random codes keep the
+    exact 3-vote rule.
+    """
+    if codebook.is_codebook(mappings):
+        return match_leds(mappings, grouped, debug, min_votes=NUM_CAL_STEPS // 2 + 1,
+                          decoder=codebook.decode_codes)
+    return match_leds(mappings, grouped, debug)
+
+def calibration_steps(mappings):
+    """Number of frames analyze_video should sample for these mappings."""
+    if codebook.is_codebook(mappings):
+        return NUM_CAL_STEPS * len(mappings[0])
+    return 30
+
+def fill_missing_leds_with_confidence(matched, num_leds):
+    """
+    Fill unmatched LEDs by interpolating along the LED index axis.
+
+    Positions inside a gap are spread between the known neighbours in
+    proportion to their index; LEDs before the first / after the last known
+    one take that LED's position. Returns (filled, confidence) where
+    confidence is 1.0 for measured LEDs, 1 / (1 + d) for interpolated ones
+    (d = index distance to the nearest measured LED), half that when
+    extrapolated past either end, and 0.0 when nothing was measured.
+    """
+    matched_dict = {i: pos for (i, pos) in matched if 0 <= i < num_leds}
+    if not matched_dict:
+        # No known LEDs at all — fallback to (0,0)
+        return [(i, (0.0, 0.0)) for i in range(num_leds)], np.zeros(num_leds)
+
+    known_idx = np.array(sorted(matched_dict))
+    known_pos = np.array([matched_dict[i] for i in known_idx], dtype=float)
+    all_idx = np.arange(num_leds)
+
+    xs = np.interp(all_idx, known_idx, known_pos[:, 0])
+    ys = np.interp(all_idx, known_idx, known_pos[:, 1])
+
+    # index distance to the nearest measured LED
+    right = np.clip(np.searchsorted(known_idx, all_idx), 0, len(known_idx) - 1)
+    left = np.clip(right - 1, 0, len(known_idx) - 1)
+    dist = np.minimum(np.abs(all_idx - known_idx[left]), np.abs(known_idx[right] - all_idx))
+    confidence = 1.0 / (1.0 + dist)
+    outside = (all_idx < known_idx[0]) | (all_idx > known_idx[-1])
+    confidence[outside] *= 0.5
+
+    filled = [(i, matched_dict[i]) if i in matched_dict else (i, (float(xs[i]), float(ys[i])))
+              for i in range(num_leds)]
+    return filled, confidence
 
-            if prev_idx is not None and next_idx is not None:
-                prev = matched_dict[prev_idx]
-                nxt = matched_dict[next_idx]
-                x_predicted_pos = (prev[0] + nxt[0]) / 2.0
-                y_predicted_pos = (prev[1] + nxt[1]) / 2.0
-            elif prev_idx is not None:
-                prev = matched_dict[prev_idx]
-                x_predicted_pos = prev[0]
-                y_predicted_pos = prev[1]
-            elif next_idx is not None:
-                nxt = matched_dict[next_idx]
-                x_predicted_pos = nxt[0]
-                y_predicted_pos = nxt[1]
-            else:
-                # No known LEDs at all — fallback to (0,0)
-                x_predicted_pos = 0.0
-                y_predicted_pos = 0.0
-
-            matched_dict[i] = (float(x_predicted_pos), float(y_predicted_pos))
-    return [(i, matched_dict[i]) for i in range(num_leds)]
+def fill_missing_leds(matched, num_leds):
+    filled, _ = fill_missing_leds_with_confidence(matched, num_leds)
+    return filled
     
-def correct_outliers(matched, distance_threshold_factor=2.0):
+def correct_outliers_with_quality(matched, distance_threshold_factor=2.0, mad_k=3.0, max_run=3, max_iter=10):
     """
     Detect and correct outlier LED positions that are too far from their neighbors.
+
+    All consecutive distances are computed at once. A link is "long" when it
+    exceeds both median * distance_threshold_factor and median + mad_k robust
+    sigmas (MAD based). A run of up to `max_run` LEDs enclosed by two long
+    links is an outlier run and is re-interpolated between its neighbours.
+    This repeats until no new outliers are found.
+
+    Returns (corrected, quality): quality is a per-entry score in (0, 1],
+    lower for LEDs with long links left over and halved for corrected LEDs.
     """
     if len(matched) < 3:
-        return matched  # nothing to correct
-
-    # Compute pairwise distances between consecutive LEDs
-    distances = []
-    for i in range(1, len(matched)):
-        x1, y1 = matched[i-1][1]
-        x2, y2 = matched[i][1]
-        distances.append(np.sqrt((x2 - x1)**2 + (y2 - y1)**2))
-
-    median_dist = np.median(distances)
-    threshold = median_dist * distance_threshold_factor
-
-    corrected = matched.copy()
-    for i in range(1, len(matched) - 1):
-        prev_pos = np.array(matched[i - 1][1])
-        curr_pos = np.array(matched[i][1])
-        next_pos = np.array(matched[i + 1][1])
-
-        dist_prev = np.linalg.norm(curr_pos - prev_pos)
-        dist_next = np.linalg.norm(curr_pos - next_pos)
-
-        # If current point is too far from both sides, consider it an outlier
-        if dist_prev > threshold and dist_next > threshold:
-            print(f"Outlier detected at index {i}: {curr_pos} (prev: {prev_pos}, next: {next_pos})")
-            # Replace with midpoint of neighbors
-            corrected_pos = (prev_pos + next_pos) / 2.0
-            corrected[i] = (matched[i][0], (float(corrected_pos[0]), float(corrected_pos[1])))
+        return matched, np.ones(len(matched))  # nothing to correct
+
+    pos = np.array([p for _, p in matched], dtype=float)
+    order = np.array([i for i, _ in matched], dtype=float)  # LED index, so gaps interpolate correctly
+    corrected_mask = np.zeros(len(pos), dtype=bool)
+
+    def link_stats(pos):
+        dists = np.linalg.norm(np.diff(pos, axis=0), axis=1)
+        median_dist = np.median(dists)
+        sigma = 1.4826 * np.median(np.abs(dists - median_dist))
+        threshold = max(median_dist * distance_threshold_factor, median_dist + mad_k * sigma)
+        return dists, median_dist, sigma, threshold
+
+    for _ in range(max_iter):
+        dists, _, _, threshold = link_stats(pos)
+        breaks = np.flatnonzero(dists > threshold)
+        if len(breaks) < 2:
+            break
+        # points b0+1 .. b1 sit between two long links
+        starts, ends = breaks[:-1] + 1, breaks[1:]
+        short = (ends - starts + 1) <= max_run
+        outliers = np.zeros(len(pos), dtype=bool)
+        for start, end in zip(starts[short], ends[short]):
+            outliers[start:end + 1] = True
+        if not outliers.any() or outliers.all():
+            break
+        for start, end in zip(starts[short], ends[short]):
+            print(f"Outlier run at indices {matched[start][0]}..{matched[end][0]}: {pos[start:end + 1].tolist()}")
+        good = ~outliers
+        pos[outliers, 0] = np.interp(order[outliers], order[good], pos[good, 0])
+        pos[outliers, 1] = np.interp(order[outliers], order[good], pos[good, 1])
+        corrected_mask |= outliers
+
+    dists, median_dist, sigma, threshold = link_stats(pos)
+    # worst adjacent link for every LED, scored against the robust threshold
+    worst = np.zeros(len(pos))
+    worst[:-1] = dists
+    worst[1:] = np.maximum(worst[1:], dists)
+    excess = np.maximum(worst - median_dist, 0) / max(threshold - median_dist, 1e-9)
+    quality = 1.0 / (1.0 + excess ** 2)
+    quality[corrected_mask] *= 0.5
+
+    corrected = [(i, (float(pos[k, 0]), float(pos[k, 1]))) if corrected_mask[k] else (i, p)
+                 for k, (i, p) in enumerate(matched)]
+    return corrected, quality
 
+def correct_outliers(matched, distance_threshold_factor=2.0):
+    """
+    Detect and correct outlier LED positions that are too far from their neighbors.
+    """
+    corrected, _ = correct_outliers_with_quality(matched, distance_threshold_factor)
     return corrected
 
 
@@ -425,9 +587,6 @@ def draw_leds_on_frame(matched, save_dir="led_debug_frames", base_frame_path="le
         pass
 
 def led_calibration(video_path, debug=False):
-    results = analyze_video(video_path, debug)
-
-    grouped = group_detections(results)
     # Resolve paths relative to the server/ folder (two levels up from this file: server/calibration -> server)
     base_dir = Path(__file__).resolve().parent.parent
     jsons_dir = base_dir / 'jsons'
@@ -442,14 +601,29 @@ def led_calibration(video_path, debug=False):
 
     with open(mappings_path, 'r') as fh:
         mappings = json.load(fh)
-    
-    matched = match_leds(mappings,grouped)
 
-    corrected_matched = correct_outliers(matched)
+    with span("calibration.analyze_video"):
+        results = analyze_video(video_path, debug, num_steps=calibration_steps(mappings))
+    with span("calibration.group_detections"):
+        grouped = group_detections(results)
+
+    with span("calibration.match_leds"):
+        matched = match_calibration_codes(mappings, grouped, debug)
+
+    with span("calibration.correct_outliers"):
+        corrected_matched, outlier_quality = correct_outliers_with_quality(matched)
 
-    all_leds = fill_missing_leds(corrected_matched, len(mappings))
+    with span("calibration.fill_missing_leds"):
+        all_leds, confidence = fill_missing_leds_with_confidence(corrected_matched, len(mappings))
+    quality = confidence.copy()
+    for (i, _), q in zip(corrected_matched, outlier_quality):
+        quality[i] *= q
 
     led_positions_path = jsons_dir / 'led_positions.json'
-    with open(led_positions_path, 'w') as fh:
-        json.dump(all_leds, fh)
+    # Both files are replaced atomically under one lock, so other server workers
+    # never read a half-written layout or a quality list from another calibration
+    with shared_state.file_lock(led_positions_path):
+        shared_state.write_json(led_positions_path, all_leds, locked=True)
+        # per-LED quality (0..1) so previews and effects can down-weight doubtful positions
+        shared_state.write_json(jsons_dir / 'led_quality.json', [round(float(q), 3) for q in quality], locked=True)
     return all_leds
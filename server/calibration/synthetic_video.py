@@ -0,0 +1,278 @@
+"""
+Render synthetic calibration videos, so the calibration pipeline can be benchmarked
+and regression-tested without a tree and a phone.
+
+The video reproduces playCalibrationSequence() in main.cpp: R/G/B sync flashes, a
+2 s settle pause, NUM_CAL_STEPS passes over the code frames, then B/G/R end flashes.
+Camera effects (resolution, sensor noise, defocus blur, hand shake, LEDs hidden by
+branches) are configurable.
+
+    python -m calibration.synthetic_video out.mp4 --leds 1000 --size 1080x1920 --noise 4 --blur 1.5 --shake 2 --check
+"""
+import argparse
+import json
+import os
+import time
+
+import cv2
+import numpy as np
+
+from calibration import codebook, image_processing
+
+# Timing of playCalibrationSequence() in main.cpp (ms)
+LEAD_MS = 500
+FLASH_MS = 400
+FLASH_GAP_MS = 200
+SETTLE_MS = 2000
+FRAME_DELAY_MS = 300
+
+# How a phone camera sees each LED color (BGR), inside image_processing.default_ranges
+CAMERA_COLORS = {'R': (85, 0, 255), 'G': (0, 200, 0), 'B': (230, 60, 25)}
+
+SERVER_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def spiral_layout(num_leds, width=720, height=1280, turns=12):
+    """LEDs wound in a spiral around a cone, as seen by a camera: [[index, [x, y]], ...]."""
+    h = np.linspace(0.0, 1.0, num_leds)
+    radius = (1.0 - h) * width * 0.4
+    angle = 2 * np.pi * turns * h
+    xs = width / 2 + radius * np.cos(angle)
+    ys = height * 0.9 - h * height * 0.8
+    return [[i, [round(float(x), 1), round(float(y), 1)]] for i, (x, y) in enumerate(zip(xs, ys))]
+
+
+def fit_layout(coords, size, margin=0.1):
+    """Scale and center (N, 2) layout coordinates into a width x height frame, keeping the aspect ratio."""
+    width, height = size
+    coords = np.asarray(coords, dtype=float)
+    lo, hi = coords.min(axis=0), coords.max(axis=0)
+    extent = np.maximum(hi - lo, 1e-9)
+    scale = min(width * (1 - 2 * margin) / extent[0], height * (1 - 2 * margin) / extent[1])
+    return (coords - (lo + hi) / 2) * scale + (width / 2, height / 2)
+
+
+def calibration_timeline(code_len, num_steps=image_processing.NUM_CAL_STEPS):
+    """
+    [(state, duration_ms), ...] for one calibration run. state is None (LEDs off),
+    ("flash", color) for the whole tree in one color, or ("code", step, frame).
+    """
+    timeline = [(None, LEAD_MS)]
+    for color in "RGB":
+        timeline += [(("flash", color), FLASH_MS), (None, FLASH_GAP_MS)]
+    timeline[-1] = (None, SETTLE_MS)
+    for step in range(num_steps):
+        for f in range(code_len):
+            timeline.append((("code", step, f), FRAME_DELAY_MS))
+    for color in "BGR":
+        timeline += [(("flash", color), FLASH_MS), (None, FLASH_GAP_MS)]
+    return timeline
+
+
+def _background(size, ambient, rng):
+    """Dim, uneven room light: a vertical gradient with soft blotches."""
+    width, height = size
+    if ambient <= 0:
+        return np.zeros((height, width, 3), dtype=np.uint8)
+    gradient = np.linspace(0.6, 1.0, height, dtype=np.float32)[:, None]
+    blotches = cv2.resize(rng.random((9, 16)).astype(np.float32), (width, height), interpolation=cv2.INTER_CUBIC)
+    light = ambient * gradient * (0.7 + 0.6 * blotches)
+    tint = np.array([1.0, 0.9, 0.8], dtype=np.float32)  # warm room light (BGR)
+    return np.clip(light[:, :, None] * tint, 0, 255).astype(np.uint8)
+
+
+def _draw_leds(size, points, colors, gains, radius, halo):
+    """LED cores as filled circles plus a Gaussian glow around them."""
+    width, height = size
+    core = np.zeros((height, width, 3), dtype=np.uint8)
+    for (x, y), color, gain in zip(points, colors, gains):
+        if color is None:
+            continue
+        bgr = tuple(int(c * gain) for c in CAMERA_COLORS[color])
+        cv2.circle(core, (int(round(x)), int(round(y))), radius, bgr, -1, lineType=cv2.LINE_AA)
+    if halo > 0:
+        glow = cv2.GaussianBlur(core, (0, 0), radius * 1.5)
+        core = cv2.addWeighted(core, 1.0, glow, halo, 0)
+    return core
+
+
+def render_calibration_video(output_path, coords, mappings, size=(720, 1280), fps=30.0, noise=3.0, blur=0.0,
+                             shake=0.0, dropout=0.0, ambient=12, dot_radius=None, halo=0.6,
+                             num_steps=image_processing.NUM_CAL_STEPS, seed=0):
+    """
+    Render a calibration recording of the LEDs at `coords` showing `mappings`.
+
+    coords: (N, 2) layout coordinates (any units, fitted into the frame)
+    size: (width, height) of the video; fps: camera frame rate
+    noise: sensor noise standard deviation (0..255 scale)
+    blur: defocus blur sigma in pixels
+    shake: hand-shake standard deviation in pixels (smooth random walk)
+    dropout: probability that an LED is hidden in a code frame (branches, reflections)
+    ambient: background light level (0 = dark room)
+
+    Returns a dict with the ground-truth pixel position of every LED ("positions",
+    [[index, [x, y]], ...]), frame count and render time.
+    """
+    if len(coords) != len(mappings):
+        raise ValueError(f"{len(coords)} LED positions but {len(mappings)} codes")
+    start = time.perf_counter()
+    rng = np.random.default_rng(seed)
+    width, height = size
+    points = fit_layout(coords, size)
+    if dot_radius is None:
+        dot_radius = max(2, round(min(width, height) / 360))
+    # LEDs are not equally bright, and never brighter than the camera colors
+    gains = rng.uniform(0.75, 1.0, len(points))
+
+    background = _background(size, ambient, rng)
+    timeline = calibration_timeline(len(mappings[0]), num_steps)
+
+    shared = {}  # off / flash images, reused by every occurrence
+    rendered = {}  # timeline index -> image of a code frame, dropped once it has passed
+
+    def render_state(state):
+        if state is None:
+            colors = [None] * len(points)
+        elif state[0] == "flash":
+            colors = [state[1]] * len(points)
+        else:
+            f = state[2]
+            hidden = rng.random(len(points)) < dropout
+            colors = [None if h else code[f] for code, h in zip(mappings, hidden)]
+        # Sync flashes run at MAX_BRIGHTNESS, code frames at brightness 1
+        radius = dot_radius * 2 if state and state[0] == "flash" else dot_radius
+        image = cv2.add(background, _draw_leds(size, points, colors, gains, radius, halo))
+        if blur > 0:
+            image = cv2.GaussianBlur(image, (0, 0), blur)
+        return image
+
+    def state_image(k):
+        state = timeline[k][0]
+        if state is not None and state[0] == "code":
+            # Hidden LEDs differ per code frame, so these are rendered once per occurrence
+            if k not in rendered:
+                for old in [j for j in rendered if j < k]:
+                    del rendered[old]
+                rendered[k] = render_state(state)
+            return rendered[k]
+        if state not in shared:
+            shared[state] = render_state(state)
+        return shared[state]
+
+    # State boundaries in ms, so each camera frame can find the states its exposure covers
+    ends = np.cumsum([duration for _, duration in timeline])
+    frame_ms = 1000.0 / fps
+    num_frames = int(ends[-1] // frame_ms)
+
+    writer = cv2.VideoWriter(output_path, cv2.VideoWriter_fourcc(*'mp4v'), float(fps), (width, height))
+    if not writer.isOpened():
+        raise RuntimeError(f"Failed to open video writer for {output_path}")
+    offset = np.zeros(2)
+    # A few noise fields, picked and flipped at random per frame (fresh noise per frame is the slowest part)
+    noise_bank = [np.clip(rng.normal(0, noise, (height, width, 3)), -127, 127).astype(np.int8)
+                  for _ in range(4 if noise > 0 else 0)]
+    try:
+        for i in range(num_frames):
+            t0, t1 = i * frame_ms, (i + 1) * frame_ms
+            k = int(np.searchsorted(ends, t0, side="right"))
+            frame = state_image(k)
+            # A frame whose exposure spans a state change shows a mix of both
+            if k + 1 < len(timeline) and t1 > ends[k]:
+                weight = (t1 - ends[k]) / frame_ms
+                frame = cv2.addWeighted(frame, 1 - weight, state_image(k + 1), weight, 0)
+
+            if shake > 0:
+                offset = np.clip(0.8 * offset + rng.normal(0, shake * 0.6, 2), -4 * shake, 4 * shake)
+                matrix = np.float32([[1, 0, offset[0]], [0, 1, offset[1]]])
+                frame = cv2.warpAffine(frame, matrix, (width, height), borderMode=cv2.BORDER_REFLECT)
+            if noise_bank:
+                grain = noise_bank[rng.integers(len(noise_bank))]
+                flip = rng.integers(-1, 3)
+                if flip < 2:
+                    grain = cv2.flip(grain, int(flip))
+                frame = cv2.add(frame, grain, dtype=cv2.CV_8U)
+            writer.write(frame)
+    finally:
+        writer.release()
+
+    return {
+        "positions": [[i, [round(float(x), 1), round(float(y), 1)]] for i, (x, y) in enumerate(points)],
+        "frames": num_frames,
+        "fps": fps,
+        "size": [width, height],
+        "render_seconds": round(time.perf_counter() - start, 3),
+    }
+
+
+def match_accuracy(matched, positions, tolerance=5.0):
+    """Fraction of LEDs whose matched position lies within `tolerance` pixels of the truth."""
+    truth = {i: p for i, p in positions}
+    correct = sum(1 for i, pos in matched if i in truth and np.hypot(*np.subtract(pos, truth[i])) <= tolerance)
+    return correct / len(positions) if positions else 0.0
+
+
+def check_video(video_path, mappings, positions):
+    """Run analyze_video -> group_detections -> match on a rendered video; returns timings and accuracy."""
+    report = {}
+    start = time.perf_counter()
+    results = image_processing.analyze_video(video_path, num_steps=image_processing.calibration_steps(mappings))
+    report["analyze_video"] = time.perf_counter() - start
+    start = time.perf_counter()
+    grouped = image_processing.group_detections(results)
+    report["group_detections"] = time.perf_counter() - start
+    start = time.perf_counter()
+    matched = image_processing.match_calibration_codes(mappings, grouped)
+    report["match_leds"] = time.perf_counter() - start
+    report["tracks"] = len(grouped)
+    report["matched"] = len(matched)
+    report["accuracy"] = match_accuracy(matched, positions)
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Render a synthetic calibration video")
+    parser.add_argument("output", help="Output .mp4 path")
+    parser.add_argument("--leds", type=int, help="Use a synthetic spiral layout and a fresh codebook for this many LEDs")
+    parser.add_argument("--layout", default=os.path.join(SERVER_DIR, "jsons", "led_positions.json"))
+    parser.add_argument("--mappings", default=os.path.join(SERVER_DIR, "jsons", "mappings.json"))
+    parser.add_argument("--size", default="720x1280", help="WIDTHxHEIGHT, e.g. 1080x1920 or 2160x3840 (portrait)")
+    parser.add_argument("--fps", type=float, default=30.0)
+    parser.add_argument("--noise", type=float, default=3.0)
+    parser.add_argument("--blur", type=float, default=0.0)
+    parser.add_argument("--shake", type=float, default=0.0)
+    parser.add_argument("--dropout", type=float, default=0.0)
+    parser.add_argument("--ambient", type=float, default=12)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--truth", help="Write ground-truth LED pixel positions to this JSON file")
+    parser.add_argument("--check", action="store_true", help="Run the calibration pipeline on the result")
+    args = parser.parse_args()
+
+    if args.leds:
+        layout = spiral_layout(args.leds)
+        mappings = codebook.generate_codebook(args.leds)
+    else:
+        with open(args.layout) as fh:
+            layout = json.load(fh)
+        with open(args.mappings) as fh:
+            mappings = json.load(fh)
+    width, height = (int(v) for v in args.size.lower().split("x"))
+
+    info = render_calibration_video(
+        args.output, [p for _, p in layout], mappings, size=(width, height), fps=args.fps, noise=args.noise,
+        blur=args.blur, shake=args.shake, dropout=args.dropout, ambient=args.ambient, seed=args.seed)
+    print(f"🎬 {args.output}: {len(layout)} LEDs, {info['frames']} frames at {width}x{height}, "
+          f"rendered in {info['render_seconds']:.1f}s")
+    if args.truth:
+        with open(args.truth, "w") as fh:
+            json.dump(info["positions"], fh)
+
+    if args.check:
+        report = check_video(args.output, mappings, info["positions"])
+        print(f"⏱️ analyze_video {report['analyze_video']:.2f}s, group_detections {report['group_detections']:.2f}s, "
+              f"match_leds {report['match_leds'] * 1000:.1f}ms")
+        print(f"🎯 {report['matched']}/{len(layout)} matched from {report['tracks']} tracks, "
+              f"{report['accuracy']:.1%} within 5 px")
+
+
+if __name__ == "__main__":
+    main()
@@ -2,12 +2,20 @@ import json
 from multiprocessing.util import debug
 import cv2
 import os
-import image_processing
+import sys
+from pathlib import Path
 import requests, json, os
 
+# Run from calibration/: make the `calibration` package importable
+sys.path.insert(0, str(Path(__file__).parent.parent))
+from calibration import image_processing
+
 def test_led_detection(video_path, debug=False):
     # Run analysis
-    results = image_processing.analyze_video(video_path, debug)
+    with open("../jsons/mappings.json", 'r') as fh:
+        mappings = json.load(fh)
+
+    results = image_processing.analyze_video(video_path, debug, num_steps=image_processing.calibration_steps(mappings))
 
     for step_id, detections in results:
         print(f"Detections for step {step_id}: {len(detections)} LEDs detected.")
@@ -44,10 +52,7 @@ def test_led_detection(video_path, debug=False):
 
     print(f"Matching detections: {matching_detections}")
 
-    with open("../jsons/mappings.json", 'r') as fh:
-        mappings = json.load(fh)
-    
-    matched = image_processing.match_leds(mappings,grouped)
+    matched = image_processing.match_calibration_codes(mappings, grouped, debug)
 
     print(f"Right detections: {len(matched)} out of {len(mappings)}")
 
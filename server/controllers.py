@@ -0,0 +1,178 @@
+"""
+Several trees (ESP controllers) driven as one display.
+
+jsons/controllers.json lists the controllers in string order, each with its own
+calibrated layout and where that tree stands in the shared scene:
+
+    {"controllers": [
+        {"name": "left",  "url": "http://192.168.1.200", "layout": "jsons/led_positions.json"},
+        {"name": "right", "url": "http://192.168.1.201", "layout": "jsons/right_positions.json",
+         "offset": [800, 0]}
+    ]}
+
+Effects and GIFs render once on the combined layout (jsons/combined_layout.json,
+rebuilt when a layout changes); each controller then gets its own slice of every
+frame. Without controllers.json there is a single controller at ESP_URL using
+jsons/led_positions.json, exactly as before.
+"""
+import os
+import struct
+
+import numpy as np
+
+import shared_state
+
+REGISTRY_PATH = os.path.join("jsons", "controllers.json")
+COMBINED_LAYOUT_PATH = os.path.join("jsons", "combined_layout.json")
+
+
+class Controller:
+    def __init__(self, name, url, layout, offset=(0, 0)):
+        self.name = name
+        self.url = url.rstrip("/")
+        self.layout = layout
+        self.offset = tuple(offset)
+        self.start = 0  # first LED of this controller in the combined layout
+        self.count = 0
+
+    def to_dict(self):
+        return {"name": self.name, "url": self.url, "layout": self.layout, "offset": list(self.offset),
+                "leds": [self.start, self.start + self.count]}
+
+
+class Registry:
+    def __init__(self, controllers, layout_path):
+        self.controllers = controllers
+        self.layout_path = layout_path  # layout every animation is rendered on
+        self.led_count = sum(c.count for c in controllers)
+
+    def __len__(self):
+        return len(self.controllers)
+
+    def names(self):
+        return [c.name for c in self.controllers]
+
+    def select(self, names=None):
+        """Controllers by name, in registry order; all of them when names is empty."""
+        return select(self.controllers, names)
+
+    def split_payload(self, payload, controllers=None):
+        """
+        Per-controller payloads ([2-byte frame count][RGB data]) from one payload
+        rendered on the combined layout. A single controller gets `payload` unchanged.
+        """
+        controllers = controllers or self.controllers
+        if len(self.controllers) == 1:
+            return [(c, payload) for c in controllers]
+        num_frames = struct.unpack("<H", payload[:2])[0]
+        frames = np.frombuffer(memoryview(payload)[2:], dtype=np.uint8).reshape(num_frames, self.led_count, 3)
+        header = payload[:2]
+        return [(c, bytes(header) + frames[:, c.start:c.start + c.count].tobytes()) for c in controllers]
+
+
+def select(controllers, names=None):
+    """Controllers by name, in list order; all of them when names is empty."""
+    if not names:
+        return list(controllers)
+    known = [c.name for c in controllers]
+    unknown = sorted(set(names) - set(known))
+    if unknown:
+        raise ValueError(f"Unknown controller(s) {unknown}, known: {known}")
+    return [c for c in controllers if c.name in names]
+
+
+def _read_layout(path):
+    layout = shared_state.read_json(path)
+    if not isinstance(layout, list) or not layout:
+        raise ValueError(f"{path} is missing or not a calibrated layout")
+    return layout
+
+
+def _combine(controllers):
+    """Concatenate the controllers' layouts, shifted by their offsets and renumbered."""
+    combined = []
+    for c in controllers:
+        c.start = len(combined)
+        dx, dy = c.offset
+        for _, (x, y) in _read_layout(c.layout):
+            combined.append([len(combined), [x + dx, y + dy]])
+        c.count = len(combined) - c.start
+    return combined
+
+
+def _stamp(paths):
+    stamps = []
+    for path in paths:
+        try:
+            st = os.stat(path)
+            stamps.append((path, st.st_mtime_ns, st.st_size))
+        except OSError:
+            stamps.append((path, None, None))
+    return tuple(stamps)
+
+
+_cache = {}  # (registry path, default url, default layout) -> (file stamps, Registry)
+
+
+def configured(default_url, default_layout, path=REGISTRY_PATH):
+    """
+    The controllers in controllers.json (or the one at default_url), without reading
+    their layouts: start and count stay 0. Enough to control them (pause, speed, ...)
+    before any tree is calibrated. Raises ValueError for an invalid controllers.json.
+    """
+    config = shared_state.read_json(path)
+    if config is None:
+        if os.path.exists(path):
+            raise ValueError(f"{path} is not valid JSON")
+        entries = [{"name": "tree", "url": default_url, "layout": default_layout}]
+    else:
+        entries = config.get("controllers") if isinstance(config, dict) else None
+        if not entries or not isinstance(entries, list):
+            raise ValueError(f"{path} needs a non-empty \"controllers\" list")
+
+    controllers = []
+    for i, entry in enumerate(entries):
+        if not isinstance(entry, dict) or not entry.get("url"):
+            raise ValueError(f"{path}: controller {i} needs a \"url\"")
+        offset = entry.get("offset", [0, 0])
+        if not (isinstance(offset, list) and len(offset) == 2 and all(isinstance(v, (int, float)) for v in offset)):
+            raise ValueError(f"{path}: \"offset\" of controller {i} must be [dx, dy]")
+        controllers.append(Controller(str(entry.get("name", f"tree{i + 1}")), entry["url"],
+                                      entry.get("layout", default_layout), offset))
+    if len(set(c.name for c in controllers)) != len(controllers):
+        raise ValueError(f"{path}: controller names must be unique")
+    return controllers
+
+
+def load(default_url, default_layout, path=REGISTRY_PATH, combined_path=COMBINED_LAYOUT_PATH):
+    """
+    The controller registry with every layout read, for rendering and slicing payloads;
+    re-read only when controllers.json or one of the layouts changes.
+    Raises ValueError for an invalid controllers.json or a missing layout.
+    """
+    key = (path, default_url, default_layout)
+    controllers = configured(default_url, default_layout, path=path)
+    stamp = _stamp([path] + [c.layout for c in controllers])
+    cached = _cache.get(key)
+    if cached and cached[0] == stamp:
+        return cached[1]
+
+    if len(controllers) == 1 and controllers[0].offset == (0, 0):
+        # Render straight on the tree's own layout, so caches and previews stay shared with it
+        controllers[0].count = len(_read_layout(controllers[0].layout))
+        registry = Registry(controllers, controllers[0].layout)
+    else:
+        combined = _combine(controllers)
+        with shared_state.file_lock(combined_path):
+            if shared_state.read_json(combined_path) != combined:
+                shared_state.write_json(combined_path, combined, locked=True)
+        registry = Registry(controllers, combined_path)
+    _cache[key] = (stamp, registry)
+    return registry
+
+
+if __name__ == "__main__":
+    registry = load(os.getenv("ESP_URL", "http://192.168.1.200"), os.path.join("jsons", "led_positions.json"))
+    print(f"🎄 {len(registry)} controller(s), {registry.led_count} LEDs, rendering on {registry.layout_path}")
+    for c in registry.controllers:
+        print(f"   {c.name:<10} {c.url:<28} LEDs {c.start}-{c.start + c.count - 1}  ({c.layout})")
@@ -3,7 +3,207 @@ import numpy as np
 import math
 import random
 import colorsys
+import inspect
 import os
+from itertools import islice
+
+class Param:
+    """
+    Declared type and range of one effect parameter. The default comes from the
+    effect method's signature so there is a single source of truth.
+    kind: "int", "float", "color" ([r, g, b]), "palette" (list of colors) or "point" ([x, y])
+    """
+    def __init__(self, kind, min=None, max=None, description=""):
+        self.kind = kind
+        self.min = min
+        self.max = max
+        self.description = description
+
+    def _check_range(self, name, value):
+        if self.min is not None and value < self.min:
+            raise ValueError(f"{name} must be >= {self.min}, got {value}")
+        if self.max is not None and value > self.max:
+            raise ValueError(f"{name} must be <= {self.max}, got {value}")
+        return value
+
+    def _color(self, name, value):
+        if isinstance(value, str):
+            hex_value = value.lstrip('#')
+            if len(hex_value) != 6:
+                raise ValueError(f"{name} must be a #rrggbb color, got {value!r}")
+            value = [int(hex_value[i:i + 2], 16) for i in (0, 2, 4)]
+        if len(value) != 3:
+            raise ValueError(f"{name} must be [r, g, b], got {value!r}")
+        color = [int(c) for c in value]
+        if any(c < 0 or c > 255 for c in color):
+            raise ValueError(f"{name} channels must be in 0..255, got {color}")
+        return color
+
+    def normalize(self, name, value):
+        """Coerce a user value to its canonical JSON form; raises ValueError when invalid."""
+        try:
+            if self.kind == "int":
+                if float(value) != int(float(value)):
+                    raise ValueError(f"{name} must be an integer, got {value!r}")
+                return self._check_range(name, int(float(value)))
+            if self.kind == "float":
+                return self._check_range(name, float(value))
+            if self.kind == "color":
+                return self._color(name, value)
+            if self.kind == "palette":
+                colors = [self._color(name, c) for c in value]
+                self._check_range(f"{name} length", len(colors))
+                return colors
+            if self.kind == "point":
+                if len(value) != 2:
+                    raise ValueError(f"{name} must be [x, y], got {value!r}")
+                return [float(v) for v in value]
+        except (TypeError, ValueError) as e:
+            if str(e).startswith(name):
+                raise
+            raise ValueError(f"{name}: invalid {self.kind} value {value!r}")
+        raise ValueError(f"Unknown parameter kind {self.kind}")
+
+    def schema(self, name, default):
+        entry = {"name": name, "type": self.kind, "default": self.normalize(name, default)}
+        if self.min is not None:
+            entry["min"] = self.min
+        if self.max is not None:
+            entry["max"] = self.max
+        if self.description:
+            entry["description"] = self.description
+        return entry
+
+
+def effect_params(**params):
+    """Declare the tunable parameters of an effect method (see Param)."""
+    def decorate(fn):
+        fn.params = params
+        return fn
+    return decorate
+
+COST_CLASSES = ("cheap", "moderate", "heavy")
+
+# Effect name -> EffectInfo, filled by @effect in declaration order
+EFFECTS = {}
+
+
+class EffectInfo:
+    """
+    Metadata recorded by @effect, used to pick the fast path for an effect:
+    - stateful: frames depend on the previous frame (trails, particles), so they
+      cannot be computed independently or out of order
+    - randomized: output changes between runs, so rendered frames are not cached
+    - cost: rough render cost class ("cheap", "moderate", "heavy")
+    - frames: name of the parameter holding the frame count, a fixed count, or
+      a function of the normalized parameters
+    - spatial: the effect draws from LED positions (not just indices), so LEDs
+      whose calibrated position is doubtful are dimmed (see led_quality.json)
+    """
+    def __init__(self, name, stateful, randomized, cost, frames, params, spatial=False):
+        self.name = name
+        self.stateful = stateful
+        self.randomized = randomized
+        self.cost = cost
+        self.frames = frames
+        self.params = params
+        self.spatial = spatial
+
+    @property
+    def cacheable(self):
+        return not self.randomized
+
+    def frame_count(self, params):
+        if callable(self.frames):
+            return self.frames(params)
+        if isinstance(self.frames, str):
+            return params[self.frames]
+        return self.frames
+
+    def to_dict(self, params):
+        return {
+            "stateful": self.stateful,
+            "randomized": self.randomized,
+            "cacheable": self.cacheable,
+            "cost": self.cost,
+            "spatial": self.spatial,
+            "frames": self.frame_count(params),
+        }
+
+
+class EffectFrames:
+    """
+    Lazy frames of one effect run: each frame is computed when it is consumed,
+    so stopping early skips the rest of the work. frame_count is the expected
+    length (also the length hint, so list() can preallocate).
+    """
+    def __init__(self, frames, frame_count):
+        self._frames = frames
+        self.frame_count = frame_count
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        return next(self._frames)
+
+    def __length_hint__(self):
+        return self.frame_count
+
+
+def effect(stateful=False, randomized=False, cost="cheap", frames="num_frames", spatial=False):
+    """Register a LEDEffectGenerator method as an effect. Put it above @effect_params."""
+    if cost not in COST_CLASSES:
+        raise ValueError(f"cost must be one of {COST_CLASSES}, got {cost!r}")
+
+    def decorate(fn):
+        EFFECTS[fn.__name__] = EffectInfo(fn.__name__, stateful, randomized, cost, frames,
+                                          getattr(fn, "params", {}), spatial)
+        return fn
+    return decorate
+
+# Shared parameter declarations
+FRAMES = Param("int", 10, 2000, "Number of frames rendered")
+COLOR = Param("color")
+PALETTE = Param("palette", 1, 16)
+CENTER = Param("point", description="Effect center, [0, 0] top left to [1, 1] bottom right of the layout")
+
+# Lengths below are fractions of the layout size (the larger side of its bounding box),
+# so an effect looks the same on any layout, whatever its pixel size or LED count
+DEFAULT_CENTER = (0.5, 0.5)
+
+# Growth per frame of the expanding effects, as a fraction of the layout size
+RADIUS_STEP = 0.008
+RING_STEP = 0.016
+
+
+# Brightness kept by an LED with quality 0; quality 1 keeps full brightness
+QUALITY_FLOOR = 0.4
+
+
+def load_quality_weights(json_path, num_leds):
+    """
+    Per-LED brightness weights (N, 1) from the led_quality.json calibration writes
+    next to the layout, or None when there is none for this layout (e.g. a
+    combined multi-tree layout, or a calibration from before quality scores).
+    """
+    quality_path = os.path.join(os.path.dirname(json_path), "led_quality.json")
+    if os.path.basename(json_path) != "led_positions.json" or not os.path.exists(quality_path):
+        return None
+    try:
+        with open(quality_path) as f:
+            quality = np.array(json.load(f), dtype=np.float32)
+    except (OSError, ValueError):
+        return None
+    if quality.shape != (num_leds,):
+        return None
+    return (QUALITY_FLOOR + (1.0 - QUALITY_FLOOR) * np.clip(quality, 0.0, 1.0))[:, None]
+
+
+def radius_steps(max_radius, step=RADIUS_STEP):
+    """Radii 0, step, 2 * step, ... below max_radius, like range(0, max_radius, step) for floats."""
+    return np.arange(math.ceil(round(max_radius / step, 6))) * step
+
 
 class LEDEffectGenerator:
     def __init__(self, json_path="jsons/led_positions.json"):
@@ -28,47 +228,87 @@ class LEDEffectGenerator:
         # Create separate arrays for X and Y for fast vectorized math
         self.x = self.coords[:, 0]
         self.y = self.coords[:, 1]
-        
+
+        # Effect geometry is given in normalized coordinates, so effects look the same for
+        # any camera, tree size or LED count: points as fractions of the layout's bounding
+        # box, lengths as fractions of its larger side (see to_layout / to_length)
+        self.min_xy = self.coords.min(axis=0) if self.num_leds else np.zeros(2)
+        self.size = np.ptp(self.coords, axis=0) if self.num_leds else np.zeros(2)
+        self.scale = float(self.size.max()) or 1.0
+        # Positions from the bounding box's top left, for patterns of x + y (stripes,
+        # plasma, twinkles), so the same tree elsewhere in the frame looks the same
+        self.local_x = self.x - self.min_xy[0]
+        self.local_y = self.y - self.min_xy[1]
+        
+        # Doubtful positions (interpolated or outlier-corrected during calibration) are
+        # dimmed in spatial effects, so a misplaced LED does not stand out of the pattern
+        self.quality_weights = load_quality_weights(json_path, self.num_leds)
+
         # The main LED buffer (N, 3) initialized to Black
         self.leds = np.zeros((self.num_leds, 3), dtype=np.uint8)
 
-    def get_effect_names():
-        return [
-            "conical_spiral_effect",
-            "waving_stripe",
-            "down_to_up",
-            "pulsating_glow",
-            "color_waves",
-            "wrapping_spiral_effect",
-            "ripple_effect",
-            "color_pulses",
-            "radial_pulse",
-            "dynamic_circular_gradient",
-            "coordinate_twinkling",
-            "candy_cane_effect",
-            "right_to_left",
-            "wave_ripple_effect",
-            "fireworks",
-            "falling_snow",
-            "plasma_cloud",
-            "radar_sweep",
-            "glitter_sparkles",
-            "green_glitter",
-            "bouncing_balls",
-            "concentric_rings",
-            "dual_rotation",
-            "gradient_wipe",
-            "christmas_twinkle",
-            "red_green_march",
-            "snow_glitter",
-            "vintage_bulb_breathe",
-            "icicle_drops_loop",
-            "multicolor_smooth_twinkle",
-            "holly_jolly_fade_loop",
-            "gold_silver_shimmer_loop",
-            "rgb_tri_chase",
-            "gentle_pulse_twinkle"
-        ]
+    @classmethod
+    def get_effect_names(cls):
+        """Names of all registered effects, in declaration order."""
+        return list(EFFECTS)
+
+    @classmethod
+    def effect_info(cls, effect_name):
+        """Registry entry for an effect; raises ValueError for unknown names."""
+        if effect_name not in EFFECTS:
+            raise ValueError(f"Unknown effect: {effect_name}")
+        return EFFECTS[effect_name]
+
+    @classmethod
+    def param_schema(cls, effect_name):
+        """List of {name, type, default, min, max} for every declared parameter of an effect."""
+        declared = cls.effect_info(effect_name).params
+        signature = inspect.signature(getattr(cls, effect_name)).parameters
+        return [spec.schema(name, signature[name].default) for name, spec in declared.items()]
+
+    @classmethod
+    def normalize_params(cls, effect_name, overrides=None):
+        """
+        Validate user overrides and fill in defaults.
+        Returns the full parameter set in canonical form, suitable as a cache key.
+        """
+        declared = cls.effect_info(effect_name).params
+        overrides = overrides or {}
+        if not isinstance(overrides, dict):
+            raise ValueError("Effect parameters must be an object of name: value")
+        unknown = set(overrides) - set(declared)
+        if unknown:
+            raise ValueError(f"Unknown parameters for {effect_name}: {', '.join(sorted(unknown))}")
+
+        signature = inspect.signature(getattr(cls, effect_name)).parameters
+        return {name: spec.normalize(name, overrides.get(name, signature[name].default))
+                for name, spec in declared.items()}
+
+    @classmethod
+    def frame_count(cls, effect_name, params=None):
+        """Number of frames an effect produces with the given parameters, without rendering it."""
+        return cls.effect_info(effect_name).frame_count(cls.normalize_params(effect_name, params))
+
+    def iter_frames(self, effect_name, params=None, max_frames=None):
+        """
+        Run an effect lazily with validated parameters, stopping after max_frames.
+        Effects draw into self.leds, so consume one iterator per generator at a time.
+        """
+        params = self.normalize_params(effect_name, params)
+        info = self.effect_info(effect_name)
+        count = info.frame_count(params)
+        frames = getattr(self, effect_name)(**params)
+        if info.spatial and self.quality_weights is not None:
+            # Applied to the recorded frames only: stateful effects keep reading undimmed self.leds
+            frames = ((frame * self.quality_weights).astype(np.uint8) for frame in frames)
+        if max_frames is not None:
+            frames = islice(frames, max_frames)
+            count = min(count, max_frames)
+        return EffectFrames(frames, count)
+
+    def render(self, effect_name, params=None, max_frames=None):
+        """Run an effect with validated parameters and return its frames as a list of (N, 3) arrays."""
+        return list(self.iter_frames(effect_name, params, max_frames))
 
     # --- Helpers to mimic FastLED ---
     def fill_solid(self, color):
@@ -90,29 +330,67 @@ class LEDEffectGenerator:
         r, g, b = colorsys.hsv_to_rgb(h/255.0, s/255.0, v/255.0)
         return [int(r*255), int(g*255), int(b*255)]
 
+    def hsv_to_rgb_arrays(self, h, s=255, v=255):
+        """Vectorized hsv_to_rgb_array: hue/saturation/value arrays (0-255) to an (N, 3) uint8 array"""
+        # Same arithmetic as colorsys.hsv_to_rgb, one numpy operation per step instead of one call per LED
+        h = np.asarray(h, dtype=float) / 255.0
+        s = np.broadcast_to(np.asarray(s, dtype=float) / 255.0, h.shape)
+        v = np.broadcast_to(np.asarray(v, dtype=float) / 255.0, h.shape)
+        i = np.floor(h * 6.0)
+        f = h * 6.0 - i
+        p = v * (1.0 - s)
+        q = v * (1.0 - s * f)
+        t = v * (1.0 - s * (1.0 - f))
+        i = i.astype(int) % 6
+        r = np.choose(i, [v, q, p, p, t, v])
+        g = np.choose(i, [t, v, v, q, p, p])
+        b = np.choose(i, [p, p, t, v, v, q])
+        rgb = np.stack([r, g, b], axis=-1)
+        rgb[s == 0] = v[s == 0, None]
+        return (rgb * 255).astype(np.uint8)
+
+    def to_layout(self, point):
+        """Layout coordinates of a normalized point ([0, 0] top left, [1, 1] bottom right)"""
+        return self.min_xy + np.asarray(point, dtype=float) * self.size
+
+    def to_length(self, fraction):
+        """Layout distance of a length given as a fraction of the layout size"""
+        return fraction * self.scale
+
+    def near_points(self, points, radius, chunk=64):
+        """(P, N) bool array: LEDs within `radius` (layout units) of each of the (P, 2) points"""
+        # One vectorized test per chunk of points instead of one per point; chunks bound the memory at 10k+ LEDs
+        points = np.asarray(points, dtype=float).reshape(-1, 2)
+        hits = np.empty((len(points), self.num_leds), dtype=bool)
+        for i in range(0, len(points), chunk):
+            p = points[i:i + chunk]
+            hits[i:i + chunk] = (self.x - p[:, :1]) ** 2 + (self.y - p[:, 1:]) ** 2 < radius * radius
+        return hits
+
     def record_frame(self):
-        """Returns the current state of LEDs as a standard list format"""
-        return self.leds.copy().tolist()
+        """Returns a copy of the current state of LEDs as an (N, 3) uint8 array"""
+        # An array, not nested lists: boxing 3 ints per LED dominated rendering at thousands of LEDs
+        return self.leds.copy()
 
     # ==========================================
     #               THE EFFECTS
     # ==========================================
 
-    def gentle_pulse_twinkle(self):
+    @effect(randomized=True)
+    @effect_params(num_frames=FRAMES, palette=PALETTE,
+                   breath_cycles=Param("int", 1, 10, "Fade in/out cycles per loop"),
+                   breath_power=Param("float", 1.0, 16.0, "Higher = longer dark pauses"))
+    def gentle_pulse_twinkle(self, num_frames=400, breath_cycles=2, breath_power=4,
+                             palette=((255, 0, 0), (0, 255, 0), (0, 0, 255), (255, 220, 0), (200, 0, 200))):
         """
         A sophisticated 'Breathing' Twinkle.
         The entire tree slowly fades in to a sparkling crescendo,
         then smoothly fades back out to darkness.
         """
-        frames = []
-        num_frames = 400 # The total loop length
         
         # 1. Setup Colors (Classic Mix)
-        palette = np.array([
-            [255, 0, 0], [0, 255, 0], [0, 0, 255], 
-            [255, 220, 0], [200, 0, 200]
-        ])
-        pixel_colors = palette[np.random.randint(0, 5, self.num_leds)]
+        palette = np.array(palette)
+        pixel_colors = palette[np.random.randint(0, len(palette), self.num_leds)]
         
         # 2. Individual Twinkle Settings
         phases = np.random.uniform(0, 2*np.pi, self.num_leds)
@@ -124,7 +402,7 @@ class LEDEffectGenerator:
             
             # A. Create a base wave that goes 0 -> 1 -> 0 two times in the loop
             # (t / num_frames) * 2 * PI * 2 = 2 full cycles
-            theta = (t / num_frames) * 2 * np.pi * 2
+            theta = (t / num_frames) * 2 * np.pi * breath_cycles
             
             # B. Shift sine so it goes from 0.0 to 1.0 (starts at 0)
             base_wave = (np.sin(theta - np.pi/2) + 1) / 2.0
@@ -133,7 +411,7 @@ class LEDEffectGenerator:
             # By raising the wave to the power of 4, we squash the low values.
             # This creates a long pause of darkness, followed by a smooth mountain.
             # Change '4' to '2' for shorter pauses, or '8' for longer pauses.
-            global_energy = base_wave ** 4
+            global_energy = base_wave ** breath_power
             
             # --- THE INDIVIDUAL TWINKLE ---
             individual_brightness = (np.sin(phases + (t * speeds)) + 1) / 2.0
@@ -147,18 +425,17 @@ class LEDEffectGenerator:
             current_leds = pixel_colors * final_brightness[:, np.newaxis]
             self.leds[:] = current_leds.astype(np.uint8)
             
-            frames.append(self.record_frame())
-            
-        return frames
+            yield self.record_frame()
 
-    def rgb_tri_chase(self):
+    @effect(frames=lambda p: 3 * p["cycles"] * p["speed_delay"])
+    @effect_params(speed_delay=Param("int", 1, 100, "Frames each color is held"),
+                   cycles=Param("int", 1, 50))
+    def rgb_tri_chase(self, speed_delay=10, cycles=6):
         """
         Refined Request: 
         - Pattern: LED 0=Red, 1=Green, 2=Blue...
         - Animation: Light up only Red, then only Green, then only Blue.
         """
-        frames = []
-        speed_delay = 10 # Hold each color for 10 frames (controls speed)
         
         # Define the 3 Colors
         colors = np.array([
@@ -177,7 +454,7 @@ class LEDEffectGenerator:
         # Total loop for a seamless cycle
         # We need to cycle through 0, 1, 2. 
         # Let's do 6 full cycles of the pattern.
-        total_steps = 3 * 6 
+        total_steps = 3 * cycles
         
         for step in range(total_steps):
             # Which group is active? 0, 1, or 2
@@ -197,16 +474,14 @@ class LEDEffectGenerator:
             # Record this frame multiple times to control speed
             # (Instead of one fast frame, we duplicate it)
             for _ in range(speed_delay):
-                frames.append(self.record_frame())
-                
-        return frames
+                yield self.record_frame()
 
-    def holly_jolly_fade_loop(self):
+    @effect()
+    @effect_params(num_frames=FRAMES)
+    def holly_jolly_fade_loop(self, num_frames=200):
         """
         Seamlessly loops Red -> Green -> Red using a perfect Sine Wave.
         """
-        frames = []
-        num_frames = 200 # Fixed length for perfect loop
         
         for t in range(num_frames):
             # 1. Calculate Loop Progress (0.0 to 2*PI)
@@ -221,19 +496,18 @@ class LEDEffectGenerator:
             green_val = int(255 * (1.0 - mix))
             
             self.fill_solid([red_val, green_val, 0])
-            frames.append(self.record_frame())
-            
-        return frames
+            yield self.record_frame()
 
-    def gold_silver_shimmer_loop(self):
+    @effect()
+    @effect_params(num_frames=FRAMES, gold=COLOR, silver=COLOR,
+                   wavelength=Param("float", 1.0, 100.0, "LEDs per radian of the wave"))
+    def gold_silver_shimmer_loop(self, num_frames=200, wavelength=10.0, gold=(255, 200, 50), silver=(200, 200, 255)):
         """
         Seamless metallic shimmer.
         """
-        frames = []
-        num_frames = 200
         
-        gold = np.array([255, 200, 50])
-        silver = np.array([200, 200, 255])
+        gold = np.array(gold)
+        silver = np.array(silver)
         
         indices = np.arange(self.num_leds)
         
@@ -244,7 +518,7 @@ class LEDEffectGenerator:
             # Wave moves along the strip
             # (indices / 10.0) creates the spatial wave
             # progress creates the movement
-            wave_val = np.sin((indices / 10.0) + progress)
+            wave_val = np.sin((indices / wavelength) + progress)
             
             # Map -1..1 to 0..1
             wave = (wave_val + 1) / 2.0
@@ -254,17 +528,17 @@ class LEDEffectGenerator:
             c2 = silver * (1.0 - wave)[:, np.newaxis]
             
             self.leds[:] = (c1 + c2).astype(np.uint8)
-            frames.append(self.record_frame())
-            
-        return frames
+            yield self.record_frame()
 
-    def icicle_drops_loop(self):
+    @effect(stateful=True, randomized=True, cost="moderate")
+    @effect_params(num_frames=FRAMES, color=COLOR,
+                   spawn_chance=Param("float", 0.0, 1.0, "Chance of a new drop per frame"),
+                   drop_speed=Param("float", 0.1, 20.0, "LEDs per frame"))
+    def icicle_drops_loop(self, num_frames=300, spawn_chance=0.05, drop_speed=1.5, color=(255, 255, 255)):
         """
         Drops icicles, but stops spawning them near the end
         so the strip is clear when the loop restarts.
         """
-        frames = []
-        num_frames = 300
         drops = []
         
         # We stop adding new drops at 80% of the animation
@@ -276,51 +550,41 @@ class LEDEffectGenerator:
             
             # Only spawn if we are in the safe zone
             if t < stop_spawning_frame:
-                if random.random() < 0.05:
+                if random.random() < spawn_chance:
                     drops.append(0.0)
                 
             active_drops = []
             for pos in drops:
                 idx = int(pos)
                 if 0 <= idx < self.num_leds:
-                    self.leds[idx] = [255, 255, 255]
-                    new_pos = pos + 1.5
+                    self.leds[idx] = color
+                    new_pos = pos + drop_speed
                     if new_pos < self.num_leds:
                         active_drops.append(new_pos)
             
             drops = active_drops
-            frames.append(self.record_frame())
-            
-        return frames
+            yield self.record_frame()
 
-    def multicolor_smooth_twinkle(self):
+    @effect(randomized=True)
+    @effect_params(num_frames=FRAMES, palette=PALETTE, speed=Param("float", 0.01, 2.0, "Fade speed"))
+    def multicolor_smooth_twinkle(self, num_frames=300, speed=0.1,
+                                  palette=((255, 0, 0), (0, 255, 0), (0, 0, 255), (255, 220, 0), (200, 0, 200))):
         """
         Replaces the harsh 'blinking' with a smooth, organic fade-in/fade-out
         for every individual bulb.
         """
-        frames = []
-        num_frames = 300
-        
-        # 1. Define Palette
-        palette = np.array([
-            [255, 0, 0],    # Red
-            [0, 255, 0],    # Green
-            [0, 0, 255],    # Blue
-            [255, 220, 0],  # Gold
-            [200, 0, 200]   # Purple
-        ])
+        
+        # 1. Define Palette (default: Red, Green, Blue, Gold, Purple)
+        palette = np.array(palette)
         
         # 2. Assign permanent colors to LEDs
-        pixel_colors = palette[np.random.randint(0, 5, self.num_leds)]
+        pixel_colors = palette[np.random.randint(0, len(palette), self.num_leds)]
         
         # 3. Assign Random Offsets (Phases)
         # This ensures every LED starts at a different brightness level
         # and fades at a slightly different time in the cycle.
         phases = np.random.uniform(0, 2*np.pi, self.num_leds)
         
-        # Speed of the fade pulse
-        speed = 0.1 
-        
         for t in range(num_frames):
             # Calculate Brightness based on Time and Phase
             # sin() gives -1 to 1.
@@ -336,45 +600,43 @@ class LEDEffectGenerator:
             current_leds = pixel_colors * brightness[:, np.newaxis]
             
             self.leds[:] = current_leds.astype(np.uint8)
-            frames.append(self.record_frame())
-            
-        return frames
+            yield self.record_frame()
 
-    def christmas_twinkle(self):
-        frames = []
-        # Warm White color
-        warm_white = np.array([255, 230, 150]) 
+    @effect(stateful=True, randomized=True)
+    @effect_params(num_frames=FRAMES, color=COLOR,
+                   decay=Param("float", 0.5, 0.99, "Brightness kept per frame"),
+                   sparkle_fraction=Param("float", 0.0, 0.5, "Share of LEDs lit per frame"))
+    def christmas_twinkle(self, num_frames=300, color=(255, 230, 150), decay=0.93, sparkle_fraction=0.05):
+        # Warm White color by default
+        warm_white = np.array(color)
         
-        for _ in range(300):
+        for _ in range(num_frames):
             # 1. Fade ALL LEDs by a small amount (creates the tail/fade out)
             # Multiplying by 0.93 makes them dim slowly
-            self.leds = (self.leds * 0.93).astype(np.uint8)
+            self.leds = (self.leds * decay).astype(np.uint8)
             
             # 2. Pick random LEDs to light up
             # 5% chance per frame for each LED to ignite? Too heavy.
             # Let's pick a fixed number of random LEDs per frame.
-            num_sparkles = int(self.num_leds * 0.05) # 5% of strip
+            num_sparkles = int(self.num_leds * sparkle_fraction) # 5% of strip by default
             indices = np.random.choice(self.num_leds, num_sparkles, replace=False)
             
             # Set them to full brightness
             self.leds[indices] = warm_white
             
-            frames.append(self.record_frame())
-        return frames
+            yield self.record_frame()
     
-    def red_green_march(self):
-        frames = []
-        block_size = 10 # How many LEDs per color block
-        speed = 1       # How fast it moves
+    @effect()
+    @effect_params(num_frames=FRAMES, red=COLOR, green=COLOR,
+                   block_size=Param("int", 1, 100, "LEDs per color block"),
+                   speed=Param("int", 1, 20, "LEDs moved per frame"))
+    def red_green_march(self, num_frames=200, block_size=10, speed=1, red=(255, 0, 0), green=(0, 255, 0)):
         offset = 0
         
-        red = [255, 0, 0]
-        green = [0, 255, 0]
-        
         # Create an index array [0, 1, 2, ... N]
         indices = np.arange(self.num_leds)
         
-        for _ in range(200):
+        for _ in range(num_frames):
             # Math: ((i + offset) // block_size) % 2
             # This creates a 0, 1, 0, 1 pattern for blocks
             
@@ -386,17 +648,17 @@ class LEDEffectGenerator:
             # Where pattern is 1, set Green
             self.leds[pattern == 1] = green
             
-            frames.append(self.record_frame())
+            yield self.record_frame()
             offset += speed
-            
-        return frames
     
-    def snow_glitter(self):
-        frames = []
-        bg_color = np.array([0, 0, 50]) # Deep dim blue
-        white = np.array([255, 255, 255])
+    @effect(stateful=True, randomized=True)
+    @effect_params(num_frames=FRAMES, bg_color=COLOR, color=COLOR,
+                   flash_chance=Param("float", 0.0, 1.0, "Chance of a flash group per frame"))
+    def snow_glitter(self, num_frames=300, bg_color=(0, 0, 50), color=(255, 255, 255), flash_chance=0.5):
+        bg_color = np.array(bg_color) # Deep dim blue by default
+        white = np.array(color)
         
-        for _ in range(300):
+        for _ in range(num_frames):
             # 1. Reset to background
             # We want flashes to disappear instantly, or fade? 
             # Let's fade strictly towards blue
@@ -409,39 +671,35 @@ class LEDEffectGenerator:
             self.leds = (current * 0.8 + target * 0.2).astype(np.uint8)
             
             # 2. Random white flashes
-            if random.random() < 0.5: # 50% chance per frame to spawn a group
+            if random.random() < flash_chance: # 50% chance per frame by default
                 num = random.randint(1, 5)
                 idx = np.random.choice(self.num_leds, num)
                 self.leds[idx] = white
                 
-            frames.append(self.record_frame())
-        return frames
+            yield self.record_frame()
     
-    def vintage_bulb_breathe(self):
-        frames = []
+    @effect(randomized=True)
+    @effect_params(num_frames=FRAMES, palette=PALETTE, speed=Param("float", 0.01, 2.0),
+                   min_brightness=Param("float", 0.0, 1.0))
+    def vintage_bulb_breathe(self, num_frames=300, speed=0.1, min_brightness=0.2,
+                             palette=((255, 0, 0), (0, 255, 0), (0, 0, 255), (255, 200, 0))):
         
         # 1. Assign a permanent color to every LED randomly
-        # Palette: Red, Green, Blue, Gold
-        palette = np.array([
-            [255, 0, 0],   # Red
-            [0, 255, 0],   # Green
-            [0, 0, 255],   # Blue
-            [255, 200, 0]  # Gold
-        ])
+        # Default palette: Red, Green, Blue, Gold
+        palette = np.array(palette)
         
-        # Assign random color index (0-3) to each LED
-        color_assignments = np.random.randint(0, 4, self.num_leds)
+        # Assign random color index to each LED
+        color_assignments = np.random.randint(0, len(palette), self.num_leds)
         base_colors = palette[color_assignments] # Array of (N, 3)
         
         # 2. Assign a random "phase" to each LED so they breathe independently
         phases = np.random.uniform(0, 2*np.pi, self.num_leds)
-        speed = 0.1
         
-        for t in range(300):
-            # Calculate brightness sine wave (0.2 to 1.0)
+        for t in range(num_frames):
+            # Calculate brightness sine wave (min_brightness to 1.0)
             # sin returns -1 to 1. We map it.
             brightness = (np.sin(phases + (t * speed)) + 1) / 2 # 0.0 to 1.0
-            brightness = (brightness * 0.8) + 0.2 # Minimum brightness 0.2
+            brightness = (brightness * (1 - min_brightness)) + min_brightness
             
             # Apply brightness to base colors
             # base_colors is (N,3), brightness is (N,). We need to broadcast.
@@ -449,19 +707,15 @@ class LEDEffectGenerator:
             
             self.leds[:] = final_colors.astype(np.uint8)
             
-            frames.append(self.record_frame())
-            
-        return frames
+            yield self.record_frame()
 
-    def conical_spiral_effect(self):
-        frames = []
-        num_frames = 400
-        
-        # --- Settings ---
-        spiral_loops = 4.0    # How many times it wraps around the tree
-        speed = 0.2           # Rotation speed
-        stripe_thickness = 40 # Thickness of the line in pixels/coords
-        color_speed = 5       # How fast the rainbow cycles
+    @effect(spatial=True)
+    @effect_params(num_frames=FRAMES,
+                   spiral_loops=Param("float", 0.5, 20.0, "How many times it wraps around the tree"),
+                   speed=Param("float", 0.01, 2.0, "Rotation speed"),
+                   stripe_thickness=Param("float", 0.002, 1.0, "Thickness of the line, fraction of the layout size"),
+                   color_speed=Param("int", 0, 50, "How fast the rainbow cycles"))
+    def conical_spiral_effect(self, num_frames=400, spiral_loops=4.0, speed=0.2, stripe_thickness=0.06, color_speed=5):
         
         # 1. Analyze the Tree Shape
         min_y = np.min(self.y)
@@ -529,7 +783,7 @@ class LEDEffectGenerator:
             
             # Mask: LED is inside the stripe width
             # We scale thickness by taper too, so the line gets thinner at the top
-            current_thickness = stripe_thickness * (0.3 + 0.7 * taper_factor)
+            current_thickness = self.to_length(stripe_thickness) * (0.3 + 0.7 * taper_factor)
             mask_hit = dist < current_thickness
 
             # --- Masking for "Behind the Tree" ---
@@ -556,20 +810,19 @@ class LEDEffectGenerator:
             self.leds[mask_back] = dim_color
             """
 
-            frames.append(self.record_frame())
+            yield self.record_frame()
             
             time += speed
             hue += color_speed
 
-        return frames
+    @effect(spatial=True, stateful=True, frames=60)
+    @effect_params(color=COLOR, strip_width=Param("float", 0.002, 1.0, "Fraction of the layout size"))
+    def waving_stripe(self, strip_width=0.08, color=(255, 0, 0)):
+        strip_width = self.to_length(strip_width)
 
-    def waving_stripe(self):
-        frames = []
-        strip_width = 50
-        color = [255, 0, 0] # Red
-
-        # C++: for (int x = 0; x < 600; x += 10)
-        for x in range(0, 600, 10):
+        # C++: for (int x = 0; x < 600; x += 10), across the layout
+        for u in np.linspace(0, 1, 60):
+            x = self.to_layout((u, 0))[0]
             # 1. Fade entire strip
             self.fade_to_black_by(20)
 
@@ -578,94 +831,80 @@ class LEDEffectGenerator:
             mask = (self.x > x - strip_width/2) & (self.x < x + strip_width/2)
             self.leds[mask] = color
 
-            frames.append(self.record_frame())
-        return frames
+            yield self.record_frame()
 
-    def down_to_up(self):
-        frames = []
-        color = [255, 0, 0] # Red
-        bg_color = [255, 255, 255] # White (based on your 2nd version)
+    @effect(spatial=True, frames=lambda p: 1 + p["repeats"] * 28)
+    @effect_params(color=COLOR, bg_color=COLOR, repeats=Param("int", 1, 20))
+    def down_to_up(self, color=(255, 0, 0), bg_color=(255, 255, 255), repeats=5):
+        half_width = self.to_length(0.08)
 
         # C++: fill_solid(White)
         self.fill_solid(bg_color)
-        frames.append(self.record_frame())
+        yield self.record_frame()
 
         # C++ loops 5 times
-        for _ in range(5):
-            for x in range(50, 600, 20):
+        for _ in range(repeats):
+            for u in np.linspace(0, 1, 28):
+                x = self.to_layout((u, 0))[0]
                 # We calculate the strip on top of the existing background
                 # But C++ snippet had logic: if in range RED, else WHITE.
-                mask = (self.x > x - 50) & (self.x < x + 50)
+                mask = (self.x > x - half_width) & (self.x < x + half_width)
                 
                 self.leds[mask] = color
                 self.leds[~mask] = bg_color # The "else" part
 
-                frames.append(self.record_frame())
+                yield self.record_frame()
                 
                 # C++ delay(100) -> 1 frame
-        return frames
 
-    def pulsating_glow(self):
-        frames = []
-        color = [255, 0, 0]
-        max_radius = 260
-        center_x = 360
+    @effect(spatial=True, frames=lambda p: 2 * len(radius_steps(p["max_radius"])))
+    @effect_params(color=COLOR, bg_color=COLOR, max_radius=Param("float", 0.01, 3.0, "Fraction of the layout size"),
+                   center_x=Param("float", 0.0, 1.0, "Center column, fraction of the layout width"))
+    def pulsating_glow(self, color=(255, 0, 0), bg_color=(0, 0, 255), max_radius=0.4, center_x=0.5):
         
-        # Calculate distances from center X (Pre-calculated for speed)
-        dists = np.abs(self.x - center_x)
+        # Calculate distances from center X (Pre-calculated for speed), in layout sizes
+        dists = np.abs(self.x - self.to_layout((center_x, 0))[0]) / self.scale
 
         # Expand
-        for radius in range(0, max_radius, 5): # Step 5 to reduce frame count
-            self.fill_solid([0, 0, 255]) # Blue
+        for radius in radius_steps(max_radius): # Step RADIUS_STEP to reduce frame count
+            self.fill_solid(bg_color)
             self.leds[dists < radius] = color
-            frames.append(self.record_frame())
+            yield self.record_frame()
 
         # Contract
-        for radius in range(max_radius, 0, -5):
-            self.fill_solid([0, 0, 255]) # Blue
+        for radius in max_radius - radius_steps(max_radius):
+            self.fill_solid(bg_color)
             self.leds[dists < radius] = color
-            frames.append(self.record_frame())
-            
-        return frames
+            yield self.record_frame()
 
-    def color_waves(self):
-        frames = []
+    @effect(spatial=True, frames=60)
+    @effect_params(band_width=Param("float", 0.002, 1.0, "Half width of the band, fraction of the layout size"),
+                   hue_step=Param("int", 0, 50))
+    def color_waves(self, band_width=0.08, hue_step=5):
         hue = 0
+        band_width = self.to_length(band_width)
         
-        # C++: x from 0 to 600
-        for x in range(0, 600, 10):
+        # C++: x from 0 to 600, across the layout
+        for u in np.linspace(0, 1, 60):
+            x = self.to_layout((u, 0))[0]
             self.fill_solid([0,0,0])
             
-            mask = (self.x > x - 50) & (self.x < x + 50)
+            mask = (self.x > x - band_width) & (self.x < x + band_width)
             
             # C++ applies CHSV(hue, 255, 255) to the band
             rgb = self.hsv_to_rgb_array(hue % 255, 255, 255)
             self.leds[mask] = rgb
             
-            hue += 5
-            frames.append(self.record_frame())
-        return frames
+            hue += hue_step
+            yield self.record_frame()
     
-    def wrapping_spiral_effect(self):
-        frames = []
-        num_frames = 400 # Longer animation loop
-        
-        # ================= PARAMETERS TO TWEAK =================
-        # Speed of vertical movement/rotation
-        # Positive = downwards wrapping, Negative = upwards wrapping
-        speed = 0.15         
-        
-        # How tightly coiled the spiral is. 
-        # Higher number = more wraps around the tree.
-        frequency = 8.0    
-        
-        # Thickness of the spiral stripe in coordinate units.
-        # If your coordinates are 0-600, try approx 20-40.
-        stripe_thickness = 30.0    
-
-        # Speed of the rainbow color shifting
-        hue_increment = 3   
-        # =======================================================
+    @effect(spatial=True, stateful=True)
+    @effect_params(num_frames=FRAMES,
+                   speed=Param("float", -2.0, 2.0, "Positive = downwards wrapping, negative = upwards"),
+                   frequency=Param("float", 0.5, 50.0, "Higher = more wraps around the tree"),
+                   stripe_thickness=Param("float", 0.002, 1.0, "Thickness of the stripe, fraction of the layout size"),
+                   hue_increment=Param("int", 0, 50, "Speed of the rainbow color shifting"))
+    def wrapping_spiral_effect(self, num_frames=400, speed=0.15, frequency=8.0, stripe_thickness=0.05, hue_increment=3):
 
 
         # 1. Calculate Tree Dimensions once (Vectorized)
@@ -716,7 +955,7 @@ class LEDEffectGenerator:
             dist_from_stripe_center = np.abs(self.x - target_x_at_height)
             
             # Create boolean mask for LEDs inside the stripe thickness
-            mask = dist_from_stripe_center < (stripe_thickness / 2.0)
+            mask = dist_from_stripe_center < (self.to_length(stripe_thickness) / 2.0)
             
             # --- Color Logic ---
             # Calculate current rainbow color
@@ -727,56 +966,50 @@ class LEDEffectGenerator:
             self.leds[mask] = rainbow_color
 
             # Record and advance state
-            frames.append(self.record_frame())
+            yield self.record_frame()
             time += speed
             hue += hue_increment
-            
-        return frames
 
-    def ripple_effect(self):
-        frames = []
-        color = [255, 0, 0]
-        max_radius = 300
+    @effect(spatial=True, randomized=True, frames=lambda p: p["repeats"] * (1 + len(radius_steps(p["max_radius"], RING_STEP))))
+    @effect_params(color=COLOR, bg_color=COLOR, max_radius=Param("float", 0.02, 3.0, "Fraction of the layout size"),
+                   repeats=Param("int", 1, 20))
+    def ripple_effect(self, color=(255, 0, 0), bg_color=(0, 0, 255), max_radius=0.5, repeats=5):
         
-        for _ in range(5): # Number of times
+        for _ in range(repeats): # Number of times
             self.fill_solid([0, 0, 0])
-            frames.append(self.record_frame())
+            yield self.record_frame()
             
             # Random center
-            cx = random.randint(0, 600)
-            cy = random.randint(0, 400)
+            cx, cy = self.to_layout((random.random(), random.random()))
             
-            # Pre-calculate distances for this ripple
-            dists = np.sqrt((self.x - cx)**2 + (self.y - cy)**2)
+            # Pre-calculate distances for this ripple, in layout sizes
+            dists = np.sqrt((self.x - cx)**2 + (self.y - cy)**2) / self.scale
             
-            for radius in range(0, max_radius, 10):
-                # Ring logic: dist < radius+10 AND dist > radius-10
-                mask = (dists < radius + 10) & (dists > radius - 10)
+            for radius in radius_steps(max_radius, RING_STEP):
+                # Ring logic: dist < radius+step AND dist > radius-step
+                mask = (dists < radius + RING_STEP) & (dists > radius - RING_STEP)
                 
                 # C++ logic: if ring Color, else Blue
-                self.leds[:] = [0, 0, 255] # Set all Blue
+                self.leds[:] = bg_color    # Set all Blue
                 self.leds[mask] = color    # Set ring Red
                 
-                frames.append(self.record_frame())
-        return frames
-
-    def color_pulses(self):
-        frames = []
-        
-        # Settings
-        center = [360, 250]   # Adjust to your actual center
-        num_frames = 300      # How long the animation runs
-        rotation_speed = 0.2  # How fast it spins
-        tightness = 30.0      # Higher = "looser" spiral coils
-        arm_thickness = 0.6   # How thick the spiral line is (in radians)
+                yield self.record_frame()
+
+    @effect(spatial=True)
+    @effect_params(num_frames=FRAMES, center=CENTER,
+                   rotation_speed=Param("float", -2.0, 2.0, "How fast it spins"),
+                   tightness=Param("float", 0.002, 1.0, "Higher = looser spiral coils, fraction of the layout size"),
+                   arm_thickness=Param("float", 0.05, 6.28, "Spiral line thickness in radians"))
+    def color_pulses(self, center=DEFAULT_CENTER, num_frames=300, rotation_speed=0.2, tightness=0.05, arm_thickness=0.6):
         hue = 0               # Starting color hue
 
         # 1. Pre-calculate Polar Coordinates (Vectorized)
         # We do this once outside the loop for performance
-        dx = self.x - center[0]
-        dy = self.y - center[1]
+        cx, cy = self.to_layout(center)
+        dx = self.x - cx
+        dy = self.y - cy
         
-        radii = np.sqrt(dx**2 + dy**2)
+        radii = np.sqrt(dx**2 + dy**2) / self.scale
         
         # Get angles and force them into 0 -> 2PI range (0 to 6.28)
         # This prevents the "cut" effect where negative angles mess up the modulo
@@ -808,97 +1041,84 @@ class LEDEffectGenerator:
             self.leds[mask] = current_color
             
             # Record frame
-            frames.append(self.record_frame())
+            yield self.record_frame()
             
             # Increment Animation State
             time -= rotation_speed # Change to += to spin the other way
             hue += 5               # Cycle through the rainbow
-            
-        return frames
 
-    def radial_pulse(self):
-        frames = []
-        center = [360, 250]
-        max_radius = 250
+    @effect(spatial=True, frames=lambda p: 2 * len(radius_steps(p["max_radius"])))
+    @effect_params(center=CENTER, max_radius=Param("float", 0.01, 3.0, "Fraction of the layout size"))
+    def radial_pulse(self, center=DEFAULT_CENTER, max_radius=0.4):
         
-        dists = np.sqrt((self.x - center[0])**2 + (self.y - center[1])**2)
+        cx, cy = self.to_layout(center)
+        dists = np.sqrt((self.x - cx)**2 + (self.y - cy)**2) / self.scale
+        # Map distances to Hue (0-255); the colors never change, only how far they reach
+        gradient = self.hsv_to_rgb_arrays(((dists / max_radius) * 255).astype(int) % 256)
         
         # Helper to apply gradient based on distance
         def apply_gradient(radius_limit):
             self.fill_solid([0, 0, 0])
             mask = dists < radius_limit
-            
-            if np.any(mask):
-                # Map distances to Hue (0-255)
-                # mask_dists = dists[mask]
-                # hues = (mask_dists / max_radius) * 255
-                # This requires per-pixel color conversion which is tricky to vectorize simply 
-                # without opencv, so we iterate just the active pixels for color conversion.
-                
-                active_indices = np.where(mask)[0]
-                for idx in active_indices:
-                    d = dists[idx]
-                    h = int((d / max_radius) * 255)
-                    self.leds[idx] = self.hsv_to_rgb_array(h, 255, 255)
-                    
-            frames.append(self.record_frame())
+            self.leds[mask] = gradient[mask]
+            return self.record_frame()
 
         # Expand
-        for r in range(0, max_radius, 5):
-            apply_gradient(r)
+        for r in radius_steps(max_radius):
+            yield apply_gradient(r)
             
         # Contract
-        for r in range(max_radius, 0, -5):
-            apply_gradient(r)
-            
-        return frames
-
-    def dynamic_circular_gradient(self):
-        frames = []
-        max_radius = 300
-        cx, cy = 360, 250
-        dx, dy = 2, 1
+        for r in max_radius - radius_steps(max_radius):
+            yield apply_gradient(r)
+
+    @effect(spatial=True, stateful=True, cost="moderate")
+    @effect_params(num_frames=FRAMES, center=CENTER, bg_color=COLOR,
+                   max_radius=Param("float", 0.02, 3.0, "Fraction of the layout size"))
+    def dynamic_circular_gradient(self, num_frames=300, center=DEFAULT_CENTER, max_radius=0.5, bg_color=(0, 0, 255)):
+        cx, cy = center
+        # Bounces around the layout's bounding box
+        dx, dy = 0.004, 0.002  # fractions of the layout size per frame
         hue_offset = 0
         
         # Simulate 300 frames (since C++ is infinite)
-        for _ in range(300):
-            self.fill_solid([0, 0, 255]) # Blue
+        for _ in range(num_frames):
+            self.fill_solid(bg_color)
             
-            dists = np.sqrt((self.x - cx)**2 + (self.y - cy)**2)
+            x, y = self.to_layout((cx, cy))
+            dists = np.sqrt((self.x - x)**2 + (self.y - y)**2) / self.scale
             mask = dists < max_radius
             
             # Apply color gradient
-            active_indices = np.where(mask)[0]
-            for idx in active_indices:
-                d = dists[idx]
-                # map distance to 0-255, add offset, mod 255
-                h = (int((d / max_radius) * 255) + hue_offset) % 255
-                self.leds[idx] = self.hsv_to_rgb_array(h, 255, 255)
+            # map distance to 0-255, add offset, mod 255
+            hues = (((dists[mask] / max_radius) * 255).astype(int) + hue_offset) % 255
+            self.leds[mask] = self.hsv_to_rgb_arrays(hues)
 
-            frames.append(self.record_frame())
+            yield self.record_frame()
             
             # Move center
             cx += dx
             cy += dy
-            if cx < 0 or cx > 720: dx = -dx
-            if cy < 0 or cy > 500: dy = -dy
+            if cx < 0 or cx > 1: dx = -dx
+            if cy < 0 or cy > 1: dy = -dy
             hue_offset += 5
-            
-        return frames
 
-    def coordinate_twinkling(self):
-        frames = []
+    @effect(spatial=True, stateful=True)
+    @effect_params(num_frames=FRAMES, color=COLOR, fade=Param("float", 0.5, 0.99, "Brightness kept per frame"))
+    def coordinate_twinkling(self, num_frames=100, color=(255, 255, 255), fade=0.9):
+        
+        # C++ (x + y + t) % 100, with the period as a fraction of the layout size
+        period = self.to_length(0.15)
         
         # C++ loop t < 100
-        for t in range(100):
+        for t in range(num_frames):
             # Calculate twinkle chance vectorized
-            # (x + y + t) % 100
-            val = (self.x + self.y + t) % 100
+            # (x + y + t) % period
+            val = (self.local_x + self.local_y + t * period / 100) % period
             
-            twinkle_mask = val < 10
+            twinkle_mask = val < period / 10
             
             # If twinkle, set White
-            self.leds[twinkle_mask] = [255, 255, 255]
+            self.leds[twinkle_mask] = color
             
             # Else fade
             # We must apply fade to ONLY non-twinkling, or all? 
@@ -910,57 +1130,56 @@ class LEDEffectGenerator:
             current_fading = self.leds[fade_mask]
             
             # Apply fade (approx 20/255 ~= 0.92 multiplier)
-            self.leds[fade_mask] = (current_fading * 0.9).astype(np.uint8)
-            
-            frames.append(self.record_frame())
+            self.leds[fade_mask] = (current_fading * fade).astype(np.uint8)
             
-        return frames
+            yield self.record_frame()
 
-    def candy_cane_effect(self):
-        frames = []
-        stripe_width = 150
-        speed = 6
+    @effect(spatial=True)
+    @effect_params(num_frames=FRAMES, color=COLOR, bg_color=COLOR,
+                   stripe_width=Param("float", 0.005, 2.0, "Fraction of the layout size"),
+                   speed=Param("float", -0.2, 0.2, "Fraction of the layout size per frame"))
+    def candy_cane_effect(self, num_frames=200, stripe_width=0.25, speed=0.01, color=(255, 0, 0), bg_color=(255, 255, 255)):
         offset = 0
+        stripe_width, speed = self.to_length(stripe_width), self.to_length(speed)
         
         # C++ 200 frames
-        for _ in range(200):
+        for _ in range(num_frames):
             self.fill_solid([0,0,0])
             
             # pos = x + y + offset
-            diag = self.x + self.y + offset
+            diag = self.local_x + self.local_y + offset
             
             # (pos / width) % 2 == 0
             # np.floor to simulate integer division behavior
             mask = (np.floor(diag / stripe_width) % 2 == 0)
             
-            self.leds[mask] = [255, 0, 0] # Red
-            self.leds[~mask] = [255, 255, 255] # White
+            self.leds[mask] = color # Red
+            self.leds[~mask] = bg_color # White
             
-            frames.append(self.record_frame())
+            yield self.record_frame()
             offset += speed
-            
-        return frames
 
-    def right_to_left(self):
+    @effect(spatial=True)
+    @effect_params(num_frames=FRAMES, color=COLOR, bg_color=COLOR,
+                   stripe_width=Param("float", 0.005, 2.0, "Fraction of the layout size"),
+                   speed=Param("float", -0.2, 0.2, "Fraction of the layout size per frame"))
+    def right_to_left(self, num_frames=200, stripe_width=0.25, speed=0.01, color=(255, 0, 0), bg_color=(255, 255, 255)):
         # Diagonal stripes based on X + offset
-        frames = []
-        stripe_width = 150
-        speed = 6
         offset = 0
+        stripe_width, speed = self.to_length(stripe_width), self.to_length(speed)
         
-        for _ in range(200):
-            diag = self.x + offset
+        for _ in range(num_frames):
+            diag = self.local_x + offset
             mask = (np.floor(diag / stripe_width) % 2 == 0)
-            self.leds[mask] = [255, 0, 0]
-            self.leds[~mask] = [255, 255, 255]
-            frames.append(self.record_frame())
+            self.leds[mask] = color
+            self.leds[~mask] = bg_color
+            yield self.record_frame()
             offset += speed
-        return frames
 
-    def wave_ripple_effect(self):
-        frames = []
-        color = [255, 0, 0]
-        max_radius = 400
+    @effect(spatial=True, stateful=True, randomized=True, cost="moderate")
+    @effect_params(num_frames=FRAMES, color=COLOR, bg_color=COLOR,
+                   max_radius=Param("float", 0.02, 3.0, "Fraction of the layout size"), max_waves=Param("int", 1, 20))
+    def wave_ripple_effect(self, num_frames=500, color=(255, 0, 0), bg_color=(255, 255, 255), max_radius=0.6, max_waves=5):
         waves = [] # List of dicts {cx, cy, r}
         
         # Timing simulation
@@ -970,27 +1189,28 @@ class LEDEffectGenerator:
         frame_dt = 50 # ms per frame
         
         # Run loop (approx 50 "times" * cycles) -> lets do 500 frames
-        for _ in range(500):
+        for _ in range(num_frames):
             # 1. Spawn Wave
-            if len(waves) < 5 and (sim_time - last_wave_time > delay_between):
+            if len(waves) < max_waves and (sim_time - last_wave_time > delay_between):
+                cx, cy = self.to_layout((random.random(), random.random()))
                 waves.append({
-                    'cx': random.randint(0, 600),
-                    'cy': random.randint(0, 400),
+                    'cx': cx,
+                    'cy': cy,
                     'r': 0
                 })
                 last_wave_time = sim_time
             
             # 2. Reset Background
-            self.fill_solid([255, 255, 255]) # White
+            self.fill_solid(bg_color) # White
             
             # 3. Process Waves
             active_waves = []
             for w in waves:
-                w['r'] += 10
+                w['r'] += RING_STEP
                 
                 # Draw Wave
-                dists = np.sqrt((self.x - w['cx'])**2 + (self.y - w['cy'])**2)
-                mask = (dists < w['r'] + 10) & (dists > w['r'] - 10)
+                dists = np.sqrt((self.x - w['cx'])**2 + (self.y - w['cy'])**2) / self.scale
+                mask = (dists < w['r'] + RING_STEP) & (dists > w['r'] - RING_STEP)
                 
                 # Apply color (Overwriting white)
                 self.leds[mask] = color
@@ -1000,30 +1220,31 @@ class LEDEffectGenerator:
             
             waves = active_waves
             
-            frames.append(self.record_frame())
+            yield self.record_frame()
             sim_time += frame_dt
-            
-        return frames
 
-    def fireworks(self):
-        frames = []
-        num_frames = 400
-        gravity = 0.5
+    @effect(spatial=True, stateful=True, randomized=True, cost="heavy")
+    @effect_params(num_frames=FRAMES, gravity=Param("float", 0.0, 0.01, "Fraction of the layout size per frame²"),
+                   launch_chance=Param("float", 0.0, 1.0, "Chance of a launch per frame"),
+                   particles_per_burst=Param("int", 1, 100))
+    def fireworks(self, num_frames=400, gravity=0.0008, launch_chance=0.1, particles_per_burst=20):
         particles = [] 
+        gravity = self.to_length(gravity)
+        spark_radius = self.to_length(0.025)
         
         for t in range(num_frames):
             self.fade_to_black_by(30) # Trails
             
             # 1. Randomly launch (10% chance)
-            if random.random() < 0.1: 
+            if random.random() < launch_chance: 
                 cx = random.choice(self.x)
                 cy = np.min(self.y) + (np.max(self.y) - np.min(self.y)) * 0.3 
                 hue = random.random()
                 
                 # Spawn explosion particles
-                for _ in range(20):
+                for _ in range(particles_per_burst):
                     angle = random.random() * 2 * np.pi
-                    speed = random.uniform(2, 6)
+                    speed = self.to_length(random.uniform(0.003, 0.01))
                     particles.append({
                         'x': cx, 'y': cy,
                         'vx': np.cos(angle) * speed,
@@ -1034,35 +1255,28 @@ class LEDEffectGenerator:
             
             # 2. Update Particles
             active_particles = []
-            if particles:
-                for p in particles:
-                    p['x'] += p['vx']
-                    p['y'] += p['vy']
-                    p['vy'] += gravity
-                    p['life'] -= 0.04
-                    
-                    if p['life'] > 0:
-                        dist = np.sqrt((self.x - p['x'])**2 + (self.y - p['y'])**2)
-                        mask = dist < 15 
-                        
-                        r,g,b = colorsys.hsv_to_rgb(p['hue'], 1.0, p['life'])
-                        color = np.array([r*255, g*255, b*255])
-                        
-                        # Additive blending
-                        current = self.leds[mask].astype(int)
-                        blended = np.minimum(255, current + color).astype(np.uint8)
-                        self.leds[mask] = blended
-                        
-                        active_particles.append(p)
-            
+            for p in particles:
+                p['x'] += p['vx']
+                p['y'] += p['vy']
+                p['vy'] += gravity
+                p['life'] -= 0.04
+                if p['life'] > 0:
+                    active_particles.append(p)
             particles = active_particles
-            frames.append(self.record_frame())
-        return frames
 
-    def falling_snow(self):
-        frames = []
-        num_frames = 400
-        num_flakes = 50
+            if particles:
+                colors = np.array([colorsys.hsv_to_rgb(p['hue'], 1.0, p['life']) for p in particles]) * 255
+                hits = self.near_points([(p['x'], p['y']) for p in particles], spark_radius)
+
+                # Additive blending of every spark covering an LED
+                added = hits.T.astype(np.float32) @ colors.astype(np.float32)
+                lit = hits.any(axis=0)
+                self.leds[lit] = np.minimum(255, self.leds[lit] + added[lit]).astype(np.uint8)
+            yield self.record_frame()
+
+    @effect(spatial=True, stateful=True, randomized=True, cost="moderate")
+    @effect_params(num_frames=FRAMES, color=COLOR, num_flakes=Param("int", 1, 500))
+    def falling_snow(self, num_frames=400, num_flakes=50, color=(200, 200, 255)):
         
         min_y, max_y = np.min(self.y), np.max(self.y)
         min_x, max_x = np.min(self.x), np.max(self.x)
@@ -1070,7 +1284,8 @@ class LEDEffectGenerator:
         # Init flakes
         flake_x = np.random.uniform(min_x, max_x, num_flakes)
         flake_y = np.random.uniform(min_y, max_y, num_flakes)
-        flake_speed = np.random.uniform(2, 5, num_flakes)
+        flake_speed = self.to_length(np.random.uniform(0.003, 0.008, num_flakes))
+        flake_radius = self.to_length(0.015)
         
         for _ in range(num_frames):
             self.fill_solid([0, 0, 0])
@@ -1079,27 +1294,26 @@ class LEDEffectGenerator:
             
             # Reset flakes at bottom
             reset_mask = flake_y > max_y
-            flake_y[reset_mask] = min_y - 10
+            flake_y[reset_mask] = min_y - flake_radius
             flake_x[reset_mask] = np.random.uniform(min_x, max_x, np.sum(reset_mask))
             
-            for i in range(num_flakes):
-                dist = np.sqrt((self.x - flake_x[i])**2 + (self.y - flake_y[i])**2)
-                mask = dist < 10 
-                self.leds[mask] = [200, 200, 255]
+            mask = self.near_points(np.column_stack([flake_x, flake_y]), flake_radius).any(axis=0)
+            self.leds[mask] = color
                 
-            frames.append(self.record_frame())
-        return frames
+            yield self.record_frame()
 
-    def plasma_cloud(self):
-        frames = []
+    @effect(spatial=True)
+    @effect_params(num_frames=FRAMES, scale=Param("float", 0.5, 650.0, "Radians of the pattern across the layout size"),
+                   speed=Param("float", 0.0, 2.0))
+    def plasma_cloud(self, num_frames=300, scale=12.0, speed=0.1):
         time = 0
-        scale = 0.02 
+        x, y = self.local_x * scale / self.scale, self.local_y * scale / self.scale
         
-        for _ in range(300):
+        for _ in range(num_frames):
             # Complex interference pattern
-            v1 = np.sin(self.x * scale + time)
-            v2 = np.sin(self.y * scale + time)
-            v3 = np.sin((self.x + self.y) * scale + time)
+            v1 = np.sin(x + time)
+            v2 = np.sin(y + time)
+            v3 = np.sin((x + y) + time)
             total_val = v1 + v2 + v3
             
             # Norm to 0-1
@@ -1112,12 +1326,13 @@ class LEDEffectGenerator:
             colors[:, 2] = (np.sin(norm_val * np.pi + 4) * 127 + 128).astype(np.uint8)
             
             self.leds[:] = colors
-            frames.append(self.record_frame())
-            time += 0.1
-        return frames
+            yield self.record_frame()
+            time += speed
 
-    def radar_sweep(self):
-        frames = []
+    @effect(spatial=True, stateful=True)
+    @effect_params(num_frames=FRAMES, color=COLOR, speed=Param("float", -2.0, 2.0),
+                   beam_width=Param("float", 0.01, 3.14, "Half width of the beam in radians"))
+    def radar_sweep(self, num_frames=300, speed=0.13, beam_width=0.15, color=(0, 255, 0)):
         center_x = (np.min(self.x) + np.max(self.x)) / 2
         center_y = (np.min(self.y) + np.max(self.y)) / 2
         
@@ -1125,59 +1340,61 @@ class LEDEffectGenerator:
         angles = (angles + 2*np.pi) % (2*np.pi)
         
         sweep_angle = 0
-        speed = 0.13
         
-        for _ in range(300):
+        for _ in range(num_frames):
             self.fade_to_black_by(40) 
             
             diff = np.abs(angles - sweep_angle)
             diff = np.minimum(diff, 2*np.pi - diff)
             
-            mask = diff < 0.15
-            self.leds[mask] = [0, 255, 0] # Green
+            mask = diff < beam_width
+            self.leds[mask] = color # Green
             
-            frames.append(self.record_frame())
+            yield self.record_frame()
             sweep_angle = (sweep_angle + speed) % (2*np.pi)
-            
-        return frames
 
-    def glitter_sparkles(self):
-        frames = []
-        bg_color = np.array([50, 0, 0]) # Dim Red
-        sparkle_color = np.array([255, 255, 200]) # Gold
+    @effect(stateful=True, randomized=True)
+    @effect_params(num_frames=FRAMES, bg_color=COLOR, sparkle_color=COLOR,
+                   sparkle_fraction=Param("float", 0.0, 0.5, "Share of LEDs ignited per frame"))
+    def glitter_sparkles(self, num_frames=200, bg_color=(50, 0, 0), sparkle_color=(255, 255, 200), sparkle_fraction=0.02):
+        bg_color = np.array(bg_color) # Dim Red
+        sparkle_color = np.array(sparkle_color) # Gold
         
-        for _ in range(200):
+        for _ in range(num_frames):
             # Fade towards background color
             current = self.leds.astype(float)
             self.leds = (current * 0.9 + bg_color * 0.1).astype(np.uint8)
             
             # Ignite random LEDs
-            lucky_indices = np.random.choice(self.num_leds, size=int(self.num_leds * 0.02), replace=False)
+            lucky_indices = np.random.choice(self.num_leds, size=int(self.num_leds * sparkle_fraction), replace=False)
             self.leds[lucky_indices] = sparkle_color
             
-            frames.append(self.record_frame())
-        return frames
+            yield self.record_frame()
 
-    def green_glitter(self):
-        frames = []
-        meteor_size = 80 
+    @effect(spatial=True)
+    @effect_params(num_frames=FRAMES, meteor_size=Param("float", 0.04, 1.25, "Fraction of the layout size"),
+                   speed=Param("float", 0.002, 0.15, "Fraction of the layout size per frame"))
+    def green_glitter(self, num_frames=300, meteor_size=0.125, speed=0.025):
         offset = 0
+        # Meteors repeat every 1.25 layout sizes, heads are 3% long
+        period, head = self.to_length(1.25), self.to_length(0.03)
+        meteor_size, speed = self.to_length(meteor_size), self.to_length(speed)
         
-        for _ in range(300):
+        for _ in range(num_frames):
             self.fill_solid([0, 0, 0])
             
             # Pseudo-random column offset based on X
-            col_offset = (self.x * 123.45) % 800 
-            pos = (self.y + offset + col_offset) % 800
+            col_offset = (self.local_x * 123.45) % period
+            pos = (self.local_y + offset + col_offset) % period
             
             # Head
-            mask_head = pos < 20 
+            mask_head = pos < head
             self.leds[mask_head] = [200, 255, 200]
             
             # Trail
-            mask_trail = (pos >= 20) & (pos < meteor_size)
+            mask_trail = (pos >= head) & (pos < meteor_size)
             if np.any(mask_trail):
-                brightness = 1.0 - ((pos[mask_trail] - 20) / (meteor_size - 20))
+                brightness = 1.0 - ((pos[mask_trail] - head) / (meteor_size - head))
                 brightness = np.clip(brightness, 0, 1)
                 
                 green_vals = (brightness * 255).astype(np.uint8)
@@ -1185,28 +1402,26 @@ class LEDEffectGenerator:
                 self.leds[mask_trail, 0] = 0
                 self.leds[mask_trail, 2] = 0
 
-            frames.append(self.record_frame())
-            offset += 15
-        return frames
+            yield self.record_frame()
+            offset += speed
 
-    def bouncing_balls(self):
-        frames = []
+    @effect(spatial=True, stateful=True)
+    @effect_params(num_frames=FRAMES, gravity=Param("float", 0.0001, 0.05), elasticity=Param("float", 0.1, 1.0))
+    def bouncing_balls(self, num_frames=400, gravity=0.002, elasticity=0.85):
         num_balls = 3
         max_y, min_y = np.max(self.y), np.min(self.y)
         height = max_y - min_y
         
         ball_h = np.array([1.0, 0.8, 0.6]) 
         ball_v = np.array([0.0, 0.0, 0.0])
-        gravity = -0.002
-        elasticity = 0.85
         colors = [[255,0,0], [0,255,0], [0,0,255]]
         
         center_x = (np.min(self.x) + np.max(self.x)) / 2
         
-        for _ in range(400):
+        for _ in range(num_frames):
             self.fade_to_black_by(40)
             
-            ball_v += gravity
+            ball_v -= gravity
             ball_h += ball_v
             
             for i in range(num_balls):
@@ -1219,60 +1434,61 @@ class LEDEffectGenerator:
                 dist = np.abs(self.y - real_y)
                 dist_x = np.abs(self.x - center_x)
                 
-                mask = (dist < 30) & (dist_x < 150)
+                mask = (dist < self.to_length(0.05)) & (dist_x < self.to_length(0.25))
                 self.leds[mask] = colors[i]
                 
-            frames.append(self.record_frame())
-        return frames
+            yield self.record_frame()
 
-    def concentric_rings(self):
-        frames = []
+    @effect(spatial=True)
+    @effect_params(num_frames=FRAMES, color=COLOR, ring_spacing=Param("float", 0.002, 1.0, "Fraction of the layout size"),
+                   speed=Param("float", -2.0, 2.0))
+    def concentric_rings(self, num_frames=300, ring_spacing=0.05, speed=0.2, color=(0, 100, 255)):
         center_x = (np.min(self.x) + np.max(self.x)) / 2
         center_y = (np.min(self.y) + np.max(self.y)) / 2
         
         dists = np.sqrt((self.x - center_x)**2 + (self.y - center_y)**2)
         offset = 0
         
-        for _ in range(300):
+        for _ in range(num_frames):
             self.fill_solid([0,0,0])
-            val = np.sin((dists / 30.0) - offset)
+            val = np.sin((dists / self.to_length(ring_spacing)) - offset)
             mask = val > 0.8
-            self.leds[mask] = [0, 100, 255] # Cyan
+            self.leds[mask] = color # Cyan
             
-            frames.append(self.record_frame())
-            offset += 0.2
-        return frames
+            yield self.record_frame()
+            offset += speed
 
-    def dual_rotation(self):
-        frames = []
+    @effect(spatial=True)
+    @effect_params(num_frames=FRAMES, color_a=COLOR, color_b=COLOR, speed=Param("float", -2.0, 2.0))
+    def dual_rotation(self, num_frames=300, speed=0.05, color_a=(255, 0, 0), color_b=(0, 0, 255)):
         center_x = (np.min(self.x) + np.max(self.x)) / 2
         center_y = (np.min(self.y) + np.max(self.y)) / 2
         
         angles = np.arctan2(self.y - center_y, self.x - center_x)
         rotation = 0
         
-        for _ in range(300):
+        for _ in range(num_frames):
             eff_angle = (angles + rotation) % (2*np.pi)
             mask_a = eff_angle < np.pi
             
-            self.leds[mask_a] = [255, 0, 0]
-            self.leds[~mask_a] = [0, 0, 255]
+            self.leds[mask_a] = color_a
+            self.leds[~mask_a] = color_b
             
             # White border
             mask_border = np.abs(eff_angle - np.pi) < 0.1
             self.leds[mask_border] = [255, 255, 255]
             
-            frames.append(self.record_frame())
-            rotation += 0.05
-        return frames
+            yield self.record_frame()
+            rotation += speed
 
-    def gradient_wipe(self):
-        frames = []
+    @effect(spatial=True)
+    @effect_params(num_frames=FRAMES, speed=Param("float", -0.2, 0.2, "Fraction of the layout size per frame"))
+    def gradient_wipe(self, num_frames=300, speed=0.015):
         projection = self.x + self.y
         min_p, max_p = np.min(projection), np.max(projection)
         offset = 0
         
-        for _ in range(300):
+        for _ in range(num_frames):
             self.fill_solid([0,0,0])
             
             pos = (projection - min_p + offset) % (max_p - min_p)
@@ -1285,10 +1501,8 @@ class LEDEffectGenerator:
             colors[:, 2] = (np.sin(norm_pos * 2 * np.pi + 4) * 127 + 128).astype(np.uint8)
             
             self.leds[:] = colors
-            frames.append(self.record_frame())
-            offset += 10
-            
-        return frames
+            yield self.record_frame()
+            offset += self.to_length(speed)
 
 # --- Usage ---
 if __name__ == "__main__":
@@ -1298,12 +1512,12 @@ if __name__ == "__main__":
         
         # Generate a specific effect
         print("Generating Spiral Effect...")
-        frames = gen.color_pulses()
+        frames = gen.render("color_pulses")
         print(f"Generated {len(frames)} frames.")
         
         # Generate Wave Ripple
         print("Generating Wave Ripple...")
-        frames2 = gen.wave_ripple_effect()
+        frames2 = gen.render("wave_ripple_effect")
         print(f"Generated {len(frames2)} frames.")
         
         # Save to JSON (Optional)
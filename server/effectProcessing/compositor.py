@@ -0,0 +1,143 @@
+import json
+from collections import OrderedDict
+
+import numpy as np
+
+from .code_effects import LEDEffectGenerator
+
+MAX_LAYERS = 8
+# Bounded by size, not count: one layer of a 10,000-LED layout is tens of MB
+LAYER_CACHE_BYTES = 128 * 1024 * 1024
+
+# Vectorized blend functions on float arrays in 0..1: f(base, layer) -> result
+BLEND_MODES = {
+    "normal": lambda a, b: b,
+    "add": lambda a, b: np.minimum(a + b, 1.0),
+    "screen": lambda a, b: 1.0 - (1.0 - a) * (1.0 - b),
+    "multiply": lambda a, b: a * b,
+    "lighten": np.maximum,
+}
+
+# Rendered layers (uint8, a quarter of the float size) keyed by (effect, layout key, normalized params);
+# shared across compositions
+layer_cache = OrderedDict()
+
+
+def region_mask(gen, region):
+    """
+    Per-LED alpha (N,) in 0..1 for a region of the layout, in the normalized
+    coordinates effects use ([0, 0] top left to [1, 1] bottom right of the layout):
+    {"type": "rect", "x": [min, max], "y": [min, max]} or
+    {"type": "circle", "center": [x, y], "radius": r}, r a fraction of the layout size.
+    An optional "feather" softens the edge over that fraction of the layout size;
+    "invert": true selects everything outside the region.
+    """
+    x, y = gen.x, gen.y
+    feather = gen.to_length(float(region.get("feather", 0)))
+    kind = region.get("type")
+    if kind == "rect":
+        (x0, y0), (x1, y1) = gen.to_layout(np.transpose([region.get("x", [0, 1]), region.get("y", [0, 1])]))
+        # Distance outside the box (0 inside)
+        dist = np.maximum(np.maximum(x0 - x, x - x1), np.maximum(y0 - y, y - y1))
+    elif kind == "circle":
+        cx, cy = gen.to_layout(region["center"])
+        dist = np.hypot(x - cx, y - cy) - gen.to_length(float(region["radius"]))
+    else:
+        raise ValueError(f"Unknown region type: {kind!r}")
+
+    if feather > 0:
+        alpha = np.clip(1.0 - dist / feather, 0.0, 1.0)
+    else:
+        alpha = (dist <= 0).astype(np.float32)
+    if region.get("invert"):
+        alpha = 1.0 - alpha
+    return alpha.astype(np.float32)
+
+
+def normalize_layers(layers):
+    """Validate a layer list and fill in defaults; raises ValueError when invalid."""
+    if not isinstance(layers, list) or not layers:
+        raise ValueError("layers must be a non-empty list")
+    if len(layers) > MAX_LAYERS:
+        raise ValueError(f"At most {MAX_LAYERS} layers are supported")
+
+    normalized = []
+    for i, layer in enumerate(layers):
+        if not isinstance(layer, dict):
+            raise ValueError(f"layer {i} must be an object")
+        mode = layer.get("mode", "normal")
+        if mode not in BLEND_MODES:
+            raise ValueError(f"layer {i}: unknown blend mode {mode!r}")
+        opacity = float(layer.get("opacity", 1.0))
+        if not 0.0 <= opacity <= 1.0:
+            raise ValueError(f"layer {i}: opacity must be in 0..1")
+        region = layer.get("region")
+        if region is not None:
+            if not isinstance(region, dict) or region.get("type") not in ("rect", "circle"):
+                raise ValueError(f"layer {i}: region must be a rect or circle object")
+            if region["type"] == "circle" and not ("center" in region and "radius" in region):
+                raise ValueError(f"layer {i}: circle regions need center and radius")
+        normalized.append({
+            "effect": layer.get("effect"),
+            "params": LEDEffectGenerator.normalize_params(layer.get("effect"), layer.get("params")),
+            "mode": mode,
+            "opacity": opacity,
+            "region": region,
+        })
+    return normalized
+
+
+def render_layer(gen, effect_name, params, layout_key=None):
+    """
+    Render one effect as a (T, N, 3) float32 array in 0..1.
+    Deterministic effects are kept in layer_cache so other compositions reuse them.
+    """
+    cacheable = LEDEffectGenerator.effect_info(effect_name).cacheable
+    key = (effect_name, layout_key, json.dumps(params, sort_keys=True))
+    if cacheable and key in layer_cache:
+        layer_cache.move_to_end(key)
+        return layer_cache[key] / np.float32(255.0)
+
+    # Every layer starts from a black buffer, not from the previous layer's last frame
+    gen.leds = np.zeros((gen.num_leds, 3), dtype=np.uint8)
+    frames = np.asarray(gen.render(effect_name, params), dtype=np.uint8).reshape(-1, gen.num_leds, 3)
+
+    if cacheable:
+        frames.setflags(write=False)
+        layer_cache[key] = frames
+        while len(layer_cache) > 1 and sum(f.nbytes for f in layer_cache.values()) > LAYER_CACHE_BYTES:
+            layer_cache.popitem(last=False)
+    return frames / np.float32(255.0)
+
+
+def compose(gen, layers, layout_key=None):
+    """
+    Blend effect layers bottom to top into one uint8 (T, N, 3) animation.
+    The result is as long as the longest layer; shorter layers loop.
+    """
+    layers = normalize_layers(layers)
+    rendered = [render_layer(gen, l["effect"], l["params"], layout_key) for l in layers]
+    num_frames = max(len(r) for r in rendered)
+
+    out = np.zeros((num_frames, gen.num_leds, 3), dtype=np.float32)
+    for layer, frames in zip(layers, rendered):
+        if len(frames) != num_frames:
+            frames = np.take(frames, np.arange(num_frames) % len(frames), axis=0)
+        blended = BLEND_MODES[layer["mode"]](out, frames)
+
+        alpha = np.full(gen.num_leds, layer["opacity"], dtype=np.float32)
+        if layer["region"] is not None:
+            alpha *= region_mask(gen, layer["region"])
+        if alpha.min() == 1.0:
+            out = blended
+            continue
+        # In place: at thousands of LEDs every (T, N, 3) temporary is tens of MB.
+        # blended is never a cached array (render_layer returns a fresh one)
+        blended -= out
+        blended *= alpha[None, :, None]
+        out += blended
+
+    out *= 255.0
+    np.rint(out, out=out)
+    np.clip(out, 0, 255, out=out)
+    return out.astype(np.uint8)
@@ -4,7 +4,8 @@ import json
 import cv2
 import os
 
-def process_gif_effects(gif_path, resolution=300, use_gamma_correction=True, smooth_temporal=True, gamma=2.4, saturation_boost=1.2):
+def process_gif_effects(gif_path, resolution=300, use_gamma_correction=True, smooth_temporal=True, gamma=2.4, saturation_boost=1.2,
+                        led_positions_path="jsons/led_positions.json"):
     """
     Process GIF frames for LED display with high-detail preservation.
     
@@ -16,11 +17,11 @@ def process_gif_effects(gif_path, resolution=300, use_gamma_correction=True, smo
 
     # 1. Load and Normalize LED Positions
     # We assume this file exists relative to the running script
-    if not os.path.exists("jsons/led_positions.json"):
-        print("Error: jsons/led_positions.json not found.")
+    if not os.path.exists(led_positions_path):
+        print(f"Error: {led_positions_path} not found.")
         return []
 
-    with open("jsons/led_positions.json") as f:
+    with open(led_positions_path) as f:
         led_positions = json.load(f)
     
     # Extract just coordinates (ignore indices if present)
@@ -102,6 +103,6 @@ def process_gif_effects(gif_path, resolution=300, use_gamma_correction=True, smo
         prev_frame_data = led_pixels.copy()
         
         # Final cast to uint8
-        frames.append(led_pixels.astype(np.uint8).tolist())
+        frames.append(led_pixels.astype(np.uint8))
 
     return frames
\ No newline at end of file
@@ -0,0 +1,232 @@
+import hashlib
+import json
+import multiprocessing
+import os
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import metrics
+import shared_state
+
+PREVIEW_FRAMES = 90
+PREVIEW_FPS = 15
+PREVIEW_CANVAS = (200, 300)
+PREVIEW_DOT_RADIUS = 3
+# A "pending" manifest entry older than this is taken over (its worker died mid-render)
+PENDING_TIMEOUT = 300
+
+_lock = threading.Lock()
+_executor = None
+_hash_cache = {}  # led_positions path -> ((mtime, size), hash)
+
+# Manifest entries are shared by all server workers, so each preview is rendered once:
+#   {"effect", "layout_hash", "file", "status": "pending" | "ready" | "error", ...}
+# "pending" carries started_at, "ready" the render stats, "error" the message
+# (not retried until the layout changes). Entries without a status are ready.
+
+
+def manifest_key(effect_name, layout):
+    return f"{effect_name}@{layout}"
+
+
+def layout_hash(led_positions_path):
+    """Short content hash of led_positions.json; only re-read when its mtime or size changes."""
+    st = os.stat(led_positions_path)
+    stamp = (st.st_mtime_ns, st.st_size)
+    cached = _hash_cache.get(led_positions_path)
+    if cached and cached[0] == stamp:
+        return cached[1]
+    with open(led_positions_path, 'rb') as fh:
+        digest = hashlib.sha1(fh.read()).hexdigest()[:12]
+    _hash_cache[led_positions_path] = (stamp, digest)
+    return digest
+
+
+def _manifest_path(preview_dir):
+    return os.path.join(preview_dir, "manifest.json")
+
+
+def load_manifest(preview_dir):
+    try:
+        with open(_manifest_path(preview_dir), 'r') as fh:
+            return json.load(fh)
+    except (OSError, ValueError):
+        return {}
+
+
+def _save_manifest(preview_dir, manifest):
+    # Callers hold shared_state.file_lock on the manifest (other server workers update it too)
+    shared_state.write_json(_manifest_path(preview_dir), manifest, locked=True, indent=2)
+
+
+def render_preview(effect_name, led_positions_path, output_path):
+    """Render the first PREVIEW_FRAMES frames of an effect to a video. Runs in a worker process."""
+    from effectProcessing.code_effects import LEDEffectGenerator
+    from effectProcessing import preview_encoder
+
+    start = time.perf_counter()
+    gen = LEDEffectGenerator(led_positions_path)
+    # Only the frames shown in the preview are computed
+    frames = gen.render(effect_name, max_frames=PREVIEW_FRAMES)
+    if not frames:
+        raise ValueError(f"Effect {effect_name} returned no frames")
+    effect_seconds = time.perf_counter() - start
+
+    # Encode next to the final file and swap it in, so a preview that another
+    # server worker is rendering at the same time is never served half-written
+    directory, filename = os.path.split(output_path)
+    tmp_path = os.path.join(directory, f".{os.getpid()}.{filename}")
+    try:
+        _, stats = preview_encoder.encode_preview(
+            frames,
+            fmt="mp4",
+            fps=PREVIEW_FPS,
+            output_path=tmp_path,
+            canvas_size=PREVIEW_CANVAS,
+            dot_radius=PREVIEW_DOT_RADIUS,
+            led_positions_path=led_positions_path,
+        )
+        os.replace(tmp_path, output_path)
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+    stats["effect_seconds"] = round(effect_seconds, 4)
+    return stats
+
+
+def _get_executor(max_workers):
+    global _executor
+    with _lock:
+        if _executor is None:
+            # Server workers run many threads; forking one could copy a lock another
+            # thread holds into the child, so workers start from a clean process
+            method = "forkserver" if "forkserver" in multiprocessing.get_all_start_methods() else "spawn"
+            _executor = ProcessPoolExecutor(max_workers=max_workers, mp_context=multiprocessing.get_context(method))
+        return _executor
+
+
+def _entry_state(entry):
+    """Status of a manifest entry; a pending entry past PENDING_TIMEOUT counts as missing."""
+    if entry is None:
+        return None
+    state = entry.get("status", "ready")
+    if state == "pending" and time.time() - entry.get("started_at", 0) > PENDING_TIMEOUT:
+        return None
+    return state
+
+
+def _remove_file(preview_dir, filename):
+    try:
+        os.remove(os.path.join(preview_dir, filename))
+    except OSError:
+        pass
+
+
+def _on_done(preview_dir, effect_name, layout, filename, led_positions_path, future, logger):
+    key = manifest_key(effect_name, layout)
+    try:
+        stats, error = future.result(), None
+    except Exception as e:
+        stats, error = None, str(e)
+        if logger:
+            logger.error(f"Error generating preview for {effect_name}: {error}")
+    try:
+        current = layout_hash(led_positions_path)
+    except OSError:
+        current = layout
+
+    with shared_state.file_lock(_manifest_path(preview_dir)):
+        manifest = load_manifest(preview_dir)
+        if layout != current:
+            # The layout changed while this render ran; its result is already stale
+            if manifest.get(key, {}).get("status") == "pending":
+                manifest.pop(key)
+            if stats:
+                _remove_file(preview_dir, filename)
+            _save_manifest(preview_dir, manifest)
+            return
+        # Drop previews of this effect rendered for an older layout
+        for old_key, entry in list(manifest.items()):
+            if entry.get("effect") == effect_name and entry.get("layout_hash") != current:
+                manifest.pop(old_key)
+                if entry.get("file") != filename:
+                    _remove_file(preview_dir, entry["file"])
+        if error is not None:
+            manifest[key] = {"effect": effect_name, "layout_hash": layout, "file": filename,
+                             "status": "error", "error": error}
+        else:
+            manifest[key] = {
+                "effect": effect_name,
+                "layout_hash": layout,
+                "file": filename,
+                "status": "ready",
+                "stats": stats,
+                "generated_at": time.time(),
+            }
+        _save_manifest(preview_dir, manifest)
+    if error is not None:
+        return
+    # Previews render in worker processes; record their timings here in the server process
+    metrics.observe("render", stats["effect_seconds"], effect=effect_name)
+    metrics.observe("preview_draw", stats["render_seconds"])
+    metrics.observe("encode", stats["encode_seconds"], format="mp4")
+    if logger:
+        logger.info(f"Generated preview for {effect_name}: effect {stats['effect_seconds']:.3f}s, "
+                    f"render {stats['render_seconds']:.3f}s, encode {stats['encode_seconds']:.3f}s, "
+                    f"{stats['bytes'] / 1024:.1f} KB")
+
+
+def schedule_preview(effect_name, led_positions_path, preview_dir, logger=None, max_workers=None):
+    """
+    Queue a background render for the current layout unless it is cached, failed,
+    or already being rendered by this or another server worker.
+    """
+    os.makedirs(preview_dir, exist_ok=True)
+    layout = layout_hash(led_positions_path)
+    key = manifest_key(effect_name, layout)
+    filename = f"{effect_name}_{layout}.mp4"
+
+    # Claim the render under the manifest lock, so concurrent workers see the pending entry
+    with shared_state.file_lock(_manifest_path(preview_dir)):
+        manifest = load_manifest(preview_dir)
+        entry = manifest.get(key)
+        state = _entry_state(entry)
+        if state in ("pending", "error"):
+            return key
+        if state == "ready" and os.path.exists(os.path.join(preview_dir, entry["file"])):
+            return key
+        manifest[key] = {"effect": effect_name, "layout_hash": layout, "file": filename,
+                         "status": "pending", "started_at": time.time(), "pid": os.getpid()}
+        _save_manifest(preview_dir, manifest)
+
+    future = _get_executor(max_workers).submit(
+        render_preview, effect_name, os.path.abspath(led_positions_path),
+        os.path.join(preview_dir, filename))
+    future.add_done_callback(
+        lambda f: _on_done(preview_dir, effect_name, layout, filename, led_positions_path, f, logger))
+    return key
+
+
+def schedule_all(effect_names, led_positions_path, preview_dir, logger=None, max_workers=None):
+    """Queue every effect whose preview is missing or stale for the current layout."""
+    return [schedule_preview(name, led_positions_path, preview_dir, logger, max_workers)
+            for name in effect_names]
+
+
+def preview_status(effect_name, led_positions_path, preview_dir, logger=None):
+    """
+    Look up the preview for the current layout.
+    Returns ("ready", filename, layout_hash), ("pending", None, layout_hash) or
+    ("error", None, layout_hash); a missing or stale preview is scheduled in the background.
+    """
+    layout = layout_hash(led_positions_path)
+    entry = load_manifest(preview_dir).get(manifest_key(effect_name, layout))
+    state = _entry_state(entry)
+    if state == "ready" and os.path.exists(os.path.join(preview_dir, entry["file"])):
+        return "ready", entry["file"], layout
+    if state in ("pending", "error"):
+        return state, None, layout
+    # Missing, stale, or its file was deleted behind our back: render it (again)
+    schedule_preview(effect_name, led_positions_path, preview_dir, logger)
+    return "pending", None, layout
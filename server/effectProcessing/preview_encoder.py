@@ -0,0 +1,152 @@
+import io
+import os
+import shutil
+import subprocess
+import tempfile
+import threading
+import time
+
+import cv2
+import numpy as np
+from PIL import Image
+
+from . import testGifEffects
+
+# Fast settings for small preview clips
+FFMPEG_ARGS = {
+    "mp4": ["-c:v", "libx264", "-preset", "ultrafast", "-tune", "animation", "-pix_fmt", "yuv420p",
+            "-movflags", "frag_keyframe+empty_moov", "-f", "mp4"],
+    "webm": ["-c:v", "libvpx-vp9", "-deadline", "realtime", "-cpu-used", "8", "-b:v", "0", "-crf", "40",
+             "-pix_fmt", "yuv420p", "-f", "webm"],
+}
+MIMETYPES = {"mp4": "video/mp4", "webm": "video/webm", "webp": "image/webp", "gif": "image/gif"}
+
+
+def render_canvases(frames, canvas_size=None, dot_radius=3, led_positions_path=None, glow=0):
+    """Yield one BGR canvas per frame, building the LED index map only once."""
+    if led_positions_path is None:
+        led_positions_path = os.path.normpath(
+            os.path.join(os.path.dirname(__file__), '..', 'jsons', 'led_positions.json'))
+    width, height, xs, ys = testGifEffects._load_canvas_layout(led_positions_path, canvas_size, "preview")
+    index_map = testGifEffects.build_led_index_map(xs, ys, width, height, dot_radius)
+    for colors in frames:
+        yield testGifEffects.render_led_frame(colors, index_map, len(xs), glow=glow)
+
+
+def ffmpeg_available():
+    return shutil.which("ffmpeg") is not None
+
+
+def _encode_ffmpeg(canvases, fps, fmt, output_path=None):
+    """Pipe raw BGR frames into ffmpeg; returns the encoded bytes when output_path is None."""
+    canvases = iter(canvases)
+    first = next(canvases)
+    height, width = first.shape[:2]
+    cmd = ["ffmpeg", "-loglevel", "error", "-y",
+           "-f", "rawvideo", "-pix_fmt", "bgr24", "-s", f"{width}x{height}", "-r", str(fps), "-i", "pipe:0",
+           # yuv420p needs even dimensions
+           "-vf", "pad=ceil(iw/2)*2:ceil(ih/2)*2"]
+    cmd += FFMPEG_ARGS[fmt]
+    cmd.append(output_path or "pipe:1")
+
+    proc = subprocess.Popen(cmd, stdin=subprocess.PIPE, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+    # Drain stdout while feeding stdin so a full pipe cannot deadlock ffmpeg
+    chunks = []
+    reader = threading.Thread(target=lambda: chunks.extend(iter(lambda: proc.stdout.read(65536), b"")))
+    reader.start()
+    try:
+        proc.stdin.write(first.tobytes())
+        for canvas in canvases:
+            proc.stdin.write(canvas.tobytes())
+    finally:
+        proc.stdin.close()
+    reader.join()
+    err = proc.stderr.read()
+    if proc.wait() != 0:
+        raise RuntimeError(f"ffmpeg failed: {err.decode(errors='replace').strip()}")
+    return b"".join(chunks)
+
+
+def _encode_opencv(canvases, fps, output_path=None):
+    """Fallback when ffmpeg is not installed: cv2.VideoWriter through a temp file if needed."""
+    canvases = iter(canvases)
+    first = next(canvases)
+    height, width = first.shape[:2]
+    path = output_path
+    if path is None:
+        fd, path = tempfile.mkstemp(suffix=".mp4")
+        os.close(fd)
+    writer = cv2.VideoWriter(path, cv2.VideoWriter_fourcc(*'mp4v'), float(fps), (width, height))
+    if not writer.isOpened():
+        raise RuntimeError(f"Failed to open video writer for {path}")
+    try:
+        writer.write(first)
+        for canvas in canvases:
+            writer.write(canvas)
+    finally:
+        writer.release()
+    if output_path is not None:
+        return b""
+    with open(path, 'rb') as fh:
+        data = fh.read()
+    os.remove(path)
+    return data
+
+
+def _encode_animation(canvases, fps, fmt):
+    """Animated WebP/GIF entirely in memory with Pillow."""
+    images = [Image.fromarray(np.ascontiguousarray(c[:, :, ::-1])) for c in canvases]
+    out = io.BytesIO()
+    duration = int(round(1000 / fps))
+    if fmt == "webp":
+        images[0].save(out, format="WEBP", save_all=True, append_images=images[1:],
+                       duration=duration, loop=0, quality=60, method=0)
+    else:
+        images[0].save(out, format="GIF", save_all=True, append_images=images[1:],
+                       duration=duration, loop=0, optimize=False)
+    return out.getvalue()
+
+
+def encode_preview(frames, fmt="mp4", fps=15, output_path=None, canvas_size=(200, 300), dot_radius=3,
+                   led_positions_path=None, glow=0):
+    """
+    Encode per-LED RGB frames as a preview clip.
+
+    fmt: "mp4"/"webm" (ffmpeg, with an OpenCV mp4 fallback) or "webp"/"gif" (in memory).
+    Writes to output_path when given, otherwise returns the bytes.
+    Returns (data, stats) where stats has frame count, size and render/encode seconds.
+    """
+    if fmt not in MIMETYPES:
+        raise ValueError(f"Unsupported preview format: {fmt}")
+    if len(frames) == 0:
+        raise ValueError("No frames to encode")
+
+    start = time.perf_counter()
+    canvases = list(render_canvases(frames, canvas_size, dot_radius, led_positions_path, glow))
+    render_seconds = time.perf_counter() - start
+
+    start = time.perf_counter()
+    if fmt in ("webp", "gif"):
+        data = _encode_animation(canvases, fps, fmt)
+        if output_path:
+            with open(output_path, 'wb') as fh:
+                fh.write(data)
+    elif ffmpeg_available():
+        data = _encode_ffmpeg(canvases, fps, fmt, output_path)
+    elif fmt == "mp4":
+        data = _encode_opencv(canvases, fps, output_path)
+    else:
+        raise RuntimeError("ffmpeg is required for webm previews")
+    encode_seconds = time.perf_counter() - start
+
+    size = os.path.getsize(output_path) if output_path else len(data)
+    stats = {
+        "format": fmt,
+        "frames": len(canvases),
+        "width": canvases[0].shape[1],
+        "height": canvases[0].shape[0],
+        "bytes": size,
+        "render_seconds": round(render_seconds, 4),
+        "encode_seconds": round(encode_seconds, 4),
+    }
+    return data, stats
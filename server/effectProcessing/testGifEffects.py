@@ -8,32 +8,54 @@ import requests
 
 ESP_IP = "192.168.1.200"  # ESP's IP
 
-def preview_gif_frame(frames, frame_index=0, canvas_size=None, dot_radius=4, save_path=None, show=True):
-    """Render one frame from the processed GIF as a black canvas with LEDs drawn.
+def build_led_index_map(xs, ys, width, height, dot_radius=4):
+    """Precompute which LED covers each canvas pixel.
 
-    - frames: processed frames from GIF
-    - frame_index: which frame in the processed frames to preview (0-based)
-    - canvas_size: (width, height) of the preview image. If None, auto-calculates from LED positions
-    - dot_radius: radius in pixels for each LED dot
-    - save_path: optional path to save the preview image
-    - show: whether to open a cv2 window to display the preview
+    Every LED is stamped as a filled disc of dot_radius around (xs[i], ys[i]).
+    Returns an (height, width) int32 map holding the LED index per pixel, or
+    len(xs) for background pixels. Later LEDs win where discs overlap, matching
+    the draw order of the old per-LED cv2.circle loop.
+    """
+    num_leds = len(xs)
+    index_map = np.full((height, width), num_leds, dtype=np.int32)
 
-    Returns the preview image (numpy array, BGR uint8).
+    r = int(dot_radius)
+    dy, dx = np.mgrid[-r:r + 1, -r:r + 1]
+    inside = dx ** 2 + dy ** 2 <= r ** 2
+    dx, dy = dx[inside], dy[inside]
+
+    px = (np.asarray(xs, dtype=np.int64)[:, None] + dx[None, :]).ravel()
+    py = (np.asarray(ys, dtype=np.int64)[:, None] + dy[None, :]).ravel()
+    ids = np.repeat(np.arange(num_leds, dtype=np.int32), len(dx))
+    on_canvas = (px >= 0) & (px < width) & (py >= 0) & (py < height)
+    index_map[py[on_canvas], px[on_canvas]] = ids[on_canvas]
+    return index_map
+
+
+def render_led_frame(colors, index_map, num_leds, glow=0):
+    """Composite one frame of RGB LED colors onto a BGR canvas using a precomputed index map.
+
+    The whole frame is a single palette lookup (fancy indexing); glow > 0 adds a
+    Gaussian halo of that sigma around the LEDs.
     """
-    if len(frames) == 0:
-        raise ValueError("No frames extracted from gif")
-    if frame_index < 0 or frame_index >= len(frames):
-        raise IndexError(f"frame_index out of range (got {frame_index}, max {len(frames)-1})")
+    colors = np.asarray(colors, dtype=np.uint8).reshape(-1, 3)
+    n = min(len(colors), num_leds)
+    # Palette row num_leds stays black for background pixels
+    palette = np.zeros((num_leds + 1, 3), dtype=np.uint8)
+    palette[:n] = colors[:n, ::-1]  # RGB -> BGR for cv2
+    canvas = palette[index_map]
+
+    if glow > 0:
+        canvas = cv2.add(canvas, cv2.GaussianBlur(canvas, (0, 0), glow))
+    return canvas
 
-    colors = frames[frame_index]  # shape: (num_leds, 3) in RGB
 
-    # Load LED positions (same format used elsewhere: list of (i, (x,y)))
-    mapping_file = os.path.join(os.path.dirname(__file__), '..', 'jsons', 'led_positions.json')
-    mapping_file = os.path.normpath(mapping_file)
-    if not os.path.exists(mapping_file):
-        raise FileNotFoundError(f"LED positions file not found: {mapping_file}")
+def _load_canvas_layout(led_positions_path, canvas_size, label):
+    """Load LED positions and scale them onto a canvas. Returns (width, height, xs, ys)."""
+    if not os.path.exists(led_positions_path):
+        raise FileNotFoundError(f"LED positions file not found: {led_positions_path}")
 
-    with open(mapping_file, 'r') as fh:
+    with open(led_positions_path, 'r') as fh:
         led_positions_raw = json.load(fh)
 
     # Extract positions into Nx2 array
@@ -41,20 +63,18 @@ def preview_gif_frame(frames, frame_index=0, canvas_size=None, dot_radius=4, sav
     if led_positions.size == 0:
         raise ValueError("No LED positions found in led_positions.json")
 
+    min_xy = led_positions.min(axis=0)
+    max_xy = led_positions.max(axis=0)
+
     # Auto-calculate canvas size if not provided
     if canvas_size is None:
-        min_xy = led_positions.min(axis=0)
-        max_xy = led_positions.max(axis=0)
         # Add padding around the LEDs
         padding = 20
         width = int(max_xy[0] - min_xy[0]) + 2 * padding
         height = int(max_xy[1] - min_xy[1]) + 2 * padding
         canvas_size = (width, height)
-        print(f"Auto-calculated canvas size: {canvas_size}")
-    
-    # Normalize positions to canvas
-    min_xy = led_positions.min(axis=0)
-    max_xy = led_positions.max(axis=0)
+        print(f"Auto-calculated canvas size for {label}: {canvas_size}")
+
     span = max_xy - min_xy
     # avoid division by zero
     span[span == 0] = 1.0
@@ -65,15 +85,36 @@ def preview_gif_frame(frames, frame_index=0, canvas_size=None, dot_radius=4, sav
     margin = 10
     xs = (norm[:, 0] * (width - 2*margin) + margin).astype(int)
     ys = (norm[:, 1] * (height - 2*margin) + margin).astype(int)
+    return width, height, xs, ys
 
-    # Create black canvas (BGR for OpenCV)
-    canvas = np.zeros((height, width, 3), dtype=np.uint8)
 
-    # Draw LEDs: convert RGB -> BGR for cv2
-    num_leds = min(len(colors), len(xs))
-    for i in range(num_leds):
-        r, g, b = colors[i]
-        cv2.circle(canvas, (int(xs[i]), int(ys[i])), dot_radius, (int(b), int(g), int(r)), -1)
+def preview_gif_frame(frames, frame_index=0, canvas_size=None, dot_radius=4, save_path=None, show=True, glow=0):
+    """Render one frame from the processed GIF as a black canvas with LEDs drawn.
+
+    - frames: processed frames from GIF
+    - frame_index: which frame in the processed frames to preview (0-based)
+    - canvas_size: (width, height) of the preview image. If None, auto-calculates from LED positions
+    - dot_radius: radius in pixels for each LED dot
+    - save_path: optional path to save the preview image
+    - show: whether to open a cv2 window to display the preview
+    - glow: sigma of an optional Gaussian glow around the LEDs (0 disables it)
+
+    Returns the preview image (numpy array, BGR uint8).
+    """
+    if len(frames) == 0:
+        raise ValueError("No frames extracted from gif")
+    if frame_index < 0 or frame_index >= len(frames):
+        raise IndexError(f"frame_index out of range (got {frame_index}, max {len(frames)-1})")
+
+    colors = frames[frame_index]  # shape: (num_leds, 3) in RGB
+
+    # Load LED positions (same format used elsewhere: list of (i, (x,y)))
+    mapping_file = os.path.join(os.path.dirname(__file__), '..', 'jsons', 'led_positions.json')
+    mapping_file = os.path.normpath(mapping_file)
+    width, height, xs, ys = _load_canvas_layout(mapping_file, canvas_size, "preview")
+
+    index_map = build_led_index_map(xs, ys, width, height, dot_radius)
+    canvas = render_led_frame(colors, index_map, len(xs), glow=glow)
 
     if save_path:
         cv2.imwrite(save_path, canvas)
@@ -90,7 +131,7 @@ def preview_gif_frame(frames, frame_index=0, canvas_size=None, dot_radius=4, sav
     return canvas
 
 
-def frames_to_video(frames, output_path, fps=15, canvas_size=None, dot_radius=4, led_positions_path=None):
+def frames_to_video(frames, output_path, fps=15, canvas_size=None, dot_radius=4, led_positions_path=None, glow=0):
     """Render a list of per-LED RGB frames to a video file (MP4).
 
     frames: list/array of shape (num_frames, num_leds, 3) in RGB
@@ -99,43 +140,17 @@ def frames_to_video(frames, output_path, fps=15, canvas_size=None, dot_radius=4,
     canvas_size: (width, height). If None, auto-calculates from LED positions
     dot_radius: LED dot radius in pixels
     led_positions_path: optional override path to led_positions.json
+    glow: sigma of an optional Gaussian glow around the LEDs (0 disables it)
+
+    The LED stamp map is built once; each frame is then a single palette lookup.
     """
     # Resolve led positions path if not provided
     if led_positions_path is None:
         led_positions_path = os.path.join(os.path.dirname(__file__), '..', 'jsons', 'led_positions.json')
         led_positions_path = os.path.normpath(led_positions_path)
 
-    if not os.path.exists(led_positions_path):
-        raise FileNotFoundError(f"LED positions file not found: {led_positions_path}")
-
-    with open(led_positions_path, 'r') as fh:
-        led_positions_raw = json.load(fh)
-
-    led_positions = np.array([pos for _, pos in led_positions_raw], dtype=float)
-    if led_positions.size == 0:
-        raise ValueError("No LED positions found in led_positions.json")
-
-    # Auto-calculate canvas size if not provided
-    if canvas_size is None:
-        min_xy = led_positions.min(axis=0)
-        max_xy = led_positions.max(axis=0)
-        padding = 20
-        width = int(max_xy[0] - min_xy[0]) + 2 * padding
-        height = int(max_xy[1] - min_xy[1]) + 2 * padding
-        canvas_size = (width, height)
-        print(f"Auto-calculated canvas size for video: {canvas_size}")
-
-    min_xy = led_positions.min(axis=0)
-    max_xy = led_positions.max(axis=0)
-    span = max_xy - min_xy
-    span[span == 0] = 1.0
-
-    width, height = canvas_size
-    norm = (led_positions - min_xy) / span
-    # Add margin
-    margin = 10
-    xs = (norm[:, 0] * (width - 2*margin) + margin).astype(int)
-    ys = (norm[:, 1] * (height - 2*margin) + margin).astype(int)
+    width, height, xs, ys = _load_canvas_layout(led_positions_path, canvas_size, "video")
+    index_map = build_led_index_map(xs, ys, width, height, dot_radius)
 
     # Ensure output directory exists
     out_dir = os.path.dirname(output_path)
@@ -148,12 +163,7 @@ def frames_to_video(frames, output_path, fps=15, canvas_size=None, dot_radius=4,
         raise RuntimeError(f"Failed to open video writer for {output_path}")
 
     for colors in frames:
-        canvas = np.zeros((height, width, 3), dtype=np.uint8)
-        num_leds = min(len(colors), len(xs))
-        for i in range(num_leds):
-            r, g, b = colors[i]
-            cv2.circle(canvas, (int(xs[i]), int(ys[i])), dot_radius, (int(b), int(g), int(r)), -1)
-        writer.write(canvas)
+        writer.write(render_led_frame(colors, index_map, len(xs), glow=glow))
 
     writer.release()
     return output_path
@@ -0,0 +1,257 @@
+"""
+Async HTTP calls to the ESP's web server (httpx.AsyncClient).
+
+The ESP-facing views (/send_effect, /send_gif, /gif_control, /send_led_mapping)
+are async views: while one waits for a slow upload, the server thread is not
+busy with anything else and rendering runs on a separate, bounded pool.
+
+    resp, stats = await esp_client.upload(ESP_URL, payload, progress=esp_client.log_progress(logger))
+    resp = await esp_client.control(ESP_URL, "/gif/control", {"action": "pause"})
+    results = await esp_client.upload_all([(name, url, payload), ...])   # several trees, started together
+
+Uploads are streamed in CHUNK_SIZE pieces (one TCP segment, the unit the ESP's
+AsyncWebServer hands to its body callback and writes to flash), so memory use
+does not grow with the animation and a slow link only has to keep each chunk
+moving. After a dropped connection the upload resumes where the ESP says it
+stopped (GET /gif/status, then POST /gif?offset=). The ESP keeps a single upload,
+so uploads to one controller are serialized across threads and server workers.
+"""
+import asyncio
+import hashlib
+import os
+import ssl
+import tempfile
+import time
+from contextlib import asynccontextmanager
+
+import httpx
+
+import shared_state
+
+UPLOAD_TIMEOUT = 30   # seconds without progress (per chunk write, or waiting for the reply)
+CONTROL_TIMEOUT = 5
+CHUNK_SIZE = 1460     # TCP MSS on the ESP8266 (lwIP), so one chunk is one body callback
+UPLOAD_RETRIES = 3    # resumes after a dropped connection before giving up
+RETRY_DELAY = 1.0
+START_DELAY = 0.25    # seconds between the start command and playback; covers the slowest controller
+LOCK_POLL = 0.02      # seconds between tries for a controller's upload slot
+
+# Connection refused, timeouts, protocol errors
+Error = httpx.HTTPError
+
+# Building a client's default SSL context costs ~25 ms of CPU; share one (the ESP is plain http anyway)
+_ssl_context = ssl.create_default_context()
+
+
+async def request(base_url, method, path, timeout=CONTROL_TIMEOUT, **kwargs):
+    """One request to the ESP. A client per call: Flask runs every async view in its own event loop."""
+    async with httpx.AsyncClient(base_url=base_url, timeout=timeout, verify=_ssl_context) as client:
+        return await client.request(method, path, **kwargs)
+
+
+async def control(base_url, path, params, timeout=CONTROL_TIMEOUT):
+    """GET a control endpoint (/gif/control, /calibrate) with query parameters."""
+    return await request(base_url, "GET", path, timeout=timeout, params=params)
+
+
+def iter_chunks(payload, offset=0, chunk_size=CHUNK_SIZE):
+    """
+    Body of an upload from `offset`: slices of a bytes-like payload,
+    or reads from a seekable binary file, so file-backed payloads never sit in memory.
+    """
+    if hasattr(payload, "read"):
+        payload.seek(offset)
+        yield from iter(lambda: payload.read(chunk_size), b"")
+    else:
+        view = memoryview(payload)
+        for i in range(offset, len(view), chunk_size):
+            yield bytes(view[i:i + chunk_size])
+
+
+def _payload_size(payload):
+    if hasattr(payload, "read"):
+        return payload.seek(0, 2)
+    return len(payload)
+
+
+async def status(base_url):
+    """The ESP's /gif/status (received, size, frames, staged, leds), or {} on firmware without it."""
+    resp = await request(base_url, "GET", "/gif/status")
+    if resp.status_code != 200:
+        return {}
+    return resp.json()
+
+
+async def upload_status(base_url):
+    """Bytes of the current upload the ESP has stored (0 when nothing can be resumed)."""
+    return int((await status(base_url)).get("received", 0))
+
+
+@asynccontextmanager
+async def upload_slot(base_url):
+    """Hold the controller's upload slot; waits without blocking the event loop."""
+    name = "esp-upload-" + hashlib.sha1(base_url.encode()).hexdigest()[:10]
+    path = os.path.join(tempfile.gettempdir(), name)
+    while True:
+        lock = shared_state.file_lock(path, blocking=False)
+        try:
+            lock.__enter__()
+            break
+        except BlockingIOError:
+            await asyncio.sleep(LOCK_POLL)
+    try:
+        yield
+    finally:
+        lock.__exit__(None, None, None)
+
+
+def log_progress(logger, label="upload", step=0.25):
+    """Progress callback that logs throughput every `step` of the payload."""
+    marks = {"next": step}
+
+    def progress(sent, size, seconds):
+        if sent < size * marks["next"] and sent < size:
+            return
+        while sent >= size * marks["next"]:
+            marks["next"] += step
+        rate = sent / 1024 / seconds if seconds > 0 else 0.0
+        logger.info(f"{label}: {sent}/{size} bytes ({sent / size:.0%}), {rate:.1f} KB/s")
+    return progress
+
+
+async def upload(base_url, payload, timeout=UPLOAD_TIMEOUT, chunk_size=CHUNK_SIZE,
+                 retries=UPLOAD_RETRIES, progress=None, stage=False):
+    """
+    Stream an animation payload ([2-byte frame count][RGB data]) to POST /gif.
+    `payload` is bytes-like or a seekable binary file. progress(sent, size, seconds)
+    is called after every chunk. A dropped upload is resumed from the offset the
+    ESP reports, up to `retries` times. stage=True keeps the current animation
+    playing until a start command (see upload_all).
+    Returns (response, stats) with bytes, seconds, KB/s, resumes and the time spent
+    waiting for another upload to the same controller.
+    """
+    wait_start = time.perf_counter()
+    async with upload_slot(base_url):
+        waited = time.perf_counter() - wait_start
+        resp, stats = await _upload(base_url, payload, timeout, chunk_size, retries, progress,
+                                    {"play": 0} if stage else {})
+    stats["waited"] = round(waited, 3)
+    return resp, stats
+
+
+async def _upload(base_url, payload, timeout, chunk_size, retries, progress, extra_params):
+    size = _payload_size(payload)
+    offset = 0
+    resumes = 0
+    start = time.perf_counter()
+    while True:
+        async def body(position=offset):
+            # Report from inside the body so progress follows the actual socket writes
+            for chunk in iter_chunks(payload, position, chunk_size):
+                yield chunk
+                position += len(chunk)
+                if progress:
+                    progress(position, size, time.perf_counter() - start)
+
+        params = dict(extra_params, size=size)
+        if offset:
+            params["offset"] = offset
+        try:
+            # An explicit Content-Length: the ESP's AsyncWebServer does not accept chunked request bodies
+            resp = await request(base_url, "POST", "/gif", timeout=timeout, params=params, content=body(),
+                                 headers={"Content-Length": str(size - offset)})
+            if resp.status_code == 409 and offset and resumes < retries:
+                # The ESP lost the partial upload (e.g. it rebooted): start over
+                resumes += 1
+                offset = 0
+                continue
+            break
+        except Error:
+            if resumes >= retries:
+                raise
+            resumes += 1
+            await asyncio.sleep(RETRY_DELAY)
+            try:
+                offset = await upload_status(base_url)
+            except Error:
+                offset = 0
+            if offset >= size:
+                offset = 0  # nothing sensible to resume, start over
+
+    seconds = time.perf_counter() - start
+    stats = {
+        "bytes": size,
+        "seconds": round(seconds, 3),
+        "kbps": round(size / 1024 / seconds, 1) if seconds > 0 else None,
+        "resumes": resumes,
+    }
+    return resp, stats
+
+
+def _result(name, resp=None, error=None, **extra):
+    if error is not None:
+        return dict(extra, controller=name, status="error", error=str(error) or type(error).__name__)
+    return dict(extra, controller=name, status="ok" if resp.status_code == 200 else "error",
+                esp_status=resp.status_code, esp_response=resp.text)
+
+
+async def _timed_status(base_url):
+    start = time.perf_counter()
+    await status(base_url)
+    return time.perf_counter() - start
+
+
+async def start_together(urls, delay=START_DELAY):
+    """
+    Start the staged animation on every controller at the same moment.
+    Each one is told to wait `delay` minus its one-way latency (half of a
+    /gif/status round trip just before), so they start together instead of
+    in the order the commands arrive.
+    """
+    rtts = await asyncio.gather(*(_timed_status(url) for url in urls), return_exceptions=True)
+    commands = []
+    for url, rtt in zip(urls, rtts):
+        one_way = rtt / 2 if isinstance(rtt, float) else 0.0
+        delay_ms = max(0, round((delay - one_way) * 1000))
+        commands.append(control(url, "/gif/control", {"action": "start", "delay": delay_ms}))
+    return await asyncio.gather(*commands, return_exceptions=True)
+
+
+async def upload_all(targets, progress=None, start_delay=START_DELAY):
+    """
+    Upload one payload per controller concurrently, so the total time is that of the
+    slowest controller. targets: [(name, base_url, payload)]. With several controllers
+    the uploads are staged and started together once all have arrived; controllers
+    whose upload failed are reported and left on their current animation.
+    Returns a result dict per controller (status, esp_status, esp_response, upload stats or error).
+    """
+    stage = len(targets) > 1
+
+    async def one(name, url, payload):
+        label = f"upload {name}"
+        return await upload(url, payload, stage=stage, progress=progress(label) if progress else None)
+
+    outcomes = await asyncio.gather(*(one(*target) for target in targets), return_exceptions=True)
+    results = []
+    for (name, url, _), outcome in zip(targets, outcomes):
+        if isinstance(outcome, BaseException):
+            results.append(_result(name, error=outcome))
+        else:
+            resp, stats = outcome
+            results.append(_result(name, resp, upload=stats))
+
+    if stage:
+        ready = [(result, url) for result, (_, url, _) in zip(results, targets) if result["status"] == "ok"]
+        started = await start_together([url for _, url in ready], start_delay)
+        for (result, _), outcome in zip(ready, started):
+            if isinstance(outcome, BaseException) or outcome.status_code != 200:
+                result["status"] = "error"
+                result["error"] = f"start failed: {outcome if isinstance(outcome, BaseException) else outcome.text}"
+    return results
+
+
+async def control_all(targets, path, params):
+    """Send one control request to every (name, base_url) concurrently; a result dict per controller."""
+    outcomes = await asyncio.gather(*(control(url, path, params) for _, url in targets), return_exceptions=True)
+    return [_result(name, error=outcome) if isinstance(outcome, BaseException) else _result(name, outcome)
+            for (name, _), outcome in zip(targets, outcomes)]
@@ -0,0 +1,181 @@
+"""
+Local stand-in for the ESP's web server, for load tests without a tree.
+
+Serves the endpoints the server calls (/gif, /gif/status, /gif/control, /calibrate,
+/calibrated_leds) on asyncio, with the ESP's timing simulated: a fixed latency per
+request plus upload time at a limited WiFi bandwidth. --serial handles one request
+at a time like the ESP8266WebServer does. /gif follows the firmware's resumable
+upload (?size=, ?offset=, /gif/status); --drop-after closes the connection once
+that many body bytes of an upload arrived, to exercise resuming. Uploads with ?play=0
+are staged until /gif/control?action=start&delay=ms, whose start times are recorded
+so several stubs can stand in for a multi-tree setup (jsons/controllers.json).
+
+    python esp_stub.py --port 8266 --bandwidth 200
+    ESP_URL=http://127.0.0.1:8266 gunicorn app:app
+"""
+import argparse
+import asyncio
+import json
+import struct
+import threading
+import time
+from collections import Counter
+from urllib.parse import parse_qs, urlsplit
+
+ENDPOINTS = {("POST", "/gif"), ("GET", "/gif/status"), ("GET", "/gif/control"),
+             ("GET", "/calibrate"), ("GET", "/calibrated_leds")}
+CHUNK_SIZE = 1460  # body callback size of the ESP's AsyncWebServer (one TCP segment)
+
+
+class EspStub:
+    def __init__(self, latency=0.02, bandwidth_kbps=200, serial=False, drop_after=None, max_drops=1, leds=250):
+        self.latency = latency
+        self.bandwidth = bandwidth_kbps * 1024
+        self.serial = serial
+        self.drop_after = drop_after
+        self.max_drops = max_drops
+        self.leds = leds
+        self.requests = Counter()
+        self.bad_payloads = 0
+        self.drops = 0
+        self.payloads = []   # completed /gif payloads, for checks
+        self.upload = None   # {"data": bytearray, "size": int} while an upload is incomplete
+        self.staged = None   # payload uploaded with ?play=0, waiting for action=start
+        self.starts = []     # time.perf_counter() at which each started animation began playing
+        self._busy = None
+
+    def _check_payload(self, body):
+        """Same framing the firmware expects: [2-byte frame count][RGB data]."""
+        if len(body) < 2:
+            return False
+        frames = struct.unpack("<H", body[:2])[0]
+        data = len(body) - 2
+        return frames > 0 and data % frames == 0 and (data // frames) % 3 == 0
+
+    async def _receive_gif(self, reader, params, length):
+        """Body of POST /gif, consumed in CHUNK_SIZE callbacks like the firmware. Returns (status, text)."""
+        offset = int(params.get("offset", 0))
+        size = int(params.get("size", offset + length))
+        if offset:
+            if not self.upload or offset != len(self.upload["data"]):
+                await reader.readexactly(length)
+                return 409, b"Resume offset mismatch"
+        else:
+            self.upload = {"data": bytearray(), "size": size}
+
+        received = 0
+        while received < length:
+            chunk = await reader.readexactly(min(CHUNK_SIZE, length - received))
+            await asyncio.sleep(len(chunk) / self.bandwidth)
+            self.upload["data"] += chunk
+            received += len(chunk)
+            if (self.drop_after is not None and received >= self.drop_after and received < length
+                    and self.drops < self.max_drops):
+                self.drops += 1
+                raise ConnectionResetError("simulated drop")
+
+        if len(self.upload["data"]) < self.upload["size"]:
+            return 200, b"OK"
+        payload, self.upload = bytes(self.upload["data"]), None
+        if not self._check_payload(payload):
+            self.bad_payloads += 1
+            return 400, b"Bad payload"
+        self.payloads.append(payload)
+        if params.get("play") == "0":
+            self.staged = payload
+            return 200, b"GIF staged"
+        return 200, b"GIF uploaded to flash storage"
+
+    async def _respond(self, method, path, params, reader, length):
+        await asyncio.sleep(self.latency / 2)  # the other half on the way back
+        if (method, path) == ("POST", "/gif"):
+            return await self._receive_gif(reader, params, length)
+        body = await reader.readexactly(length) if length else b""
+        await asyncio.sleep(len(body) / self.bandwidth)
+        if (method, path) not in ENDPOINTS:
+            return 404, b"Not found"
+        if path == "/gif/status":
+            received = len(self.upload["data"]) if self.upload else 0
+            size = self.upload["size"] if self.upload else 0
+            staged = struct.unpack("<H", self.staged[:2])[0] if self.staged else 0
+            return 200, json.dumps({"received": received, "size": size, "staged": staged,
+                                    "leds": self.leds}).encode()
+        if path == "/gif/control" and params.get("action") == "start":
+            self.staged = None
+            self.starts.append(time.perf_counter() + int(params.get("delay", 0)) / 1000)
+            return 200, b"Starting"
+        return 200, b"OK"
+
+    async def _handle(self, reader, writer):
+        try:
+            request_line = (await reader.readline()).decode("latin-1").split()
+            if len(request_line) < 2:
+                return
+            method, target = request_line[0], urlsplit(request_line[1])
+            params = {k: v[-1] for k, v in parse_qs(target.query).items()}
+            length = 0
+            while True:
+                line = await reader.readline()
+                if line in (b"\r\n", b"\n", b""):
+                    break
+                name, _, value = line.decode("latin-1").partition(":")
+                if name.strip().lower() == "content-length":
+                    length = int(value.strip())
+            self.requests[target.path] += 1
+
+            if self.serial:
+                async with self._busy:
+                    status, text = await self._respond(method, target.path, params, reader, length)
+            else:
+                status, text = await self._respond(method, target.path, params, reader, length)
+            await asyncio.sleep(self.latency / 2)
+            writer.write(f"HTTP/1.1 {status} {'OK' if status == 200 else 'Error'}\r\n"
+                         f"Content-Type: text/plain\r\nContent-Length: {len(text)}\r\n"
+                         f"Connection: close\r\n\r\n".encode() + text)
+            await writer.drain()
+        except ConnectionResetError:
+            writer.transport.abort()
+        except asyncio.IncompleteReadError:
+            pass
+        finally:
+            writer.close()
+
+    async def serve(self, host="127.0.0.1", port=8266, ready=None):
+        self._busy = asyncio.Lock()
+        server = await asyncio.start_server(self._handle, host, port)
+        self.port = server.sockets[0].getsockname()[1]
+        if ready:
+            ready.set()
+        async with server:
+            await server.serve_forever()
+
+    def start_in_thread(self, host="127.0.0.1", port=0):
+        """Serve from a daemon thread; returns the base URL."""
+        ready = threading.Event()
+        threading.Thread(target=lambda: asyncio.run(self.serve(host, port, ready)), daemon=True).start()
+        ready.wait()
+        return f"http://{host}:{self.port}"
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8266)
+    parser.add_argument("--latency", type=float, default=20, help="Milliseconds per request")
+    parser.add_argument("--bandwidth", type=float, default=200, help="Upload bandwidth in KB/s")
+    parser.add_argument("--serial", action="store_true", help="One request at a time, like the ESP8266")
+    parser.add_argument("--drop-after", type=int, default=None, help="Drop an upload after this many body bytes")
+    parser.add_argument("--max-drops", type=int, default=1, help="How many uploads to drop")
+    args = parser.parse_args()
+
+    stub = EspStub(args.latency / 1000, args.bandwidth, args.serial, args.drop_after, args.max_drops)
+    print(f"🎄 ESP stub on http://{args.host}:{args.port}")
+    try:
+        asyncio.run(stub.serve(args.host, args.port))
+    except KeyboardInterrupt:
+        print(f"📊 {dict(stub.requests)}, {len(stub.payloads)} upload(s), {stub.drops} drop(s), "
+              f"{stub.bad_payloads} bad payload(s)")
+
+
+if __name__ == "__main__":
+    main()
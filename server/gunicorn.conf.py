@@ -0,0 +1,34 @@
+"""
+Production serving with gunicorn (the Flask dev server handles one request at a time):
+
+    cd server && gunicorn app:app               # picks up this file
+    WEB_CONCURRENCY=4 BIND=0.0.0.0:8000 gunicorn app:app
+
+Workers share the codebook, LED layout, preview manifest and GIFs through the files
+in jsons/, gifs/ and uploads/ (see shared_state.py). The /stream live session runs in
+one worker at a time and is steered through jsons/stream.json, so any worker can start,
+switch or stop it (live_stream.SharedStream). State that lives in memory stays per
+worker: the effect payload cache and the /metrics histograms.
+"""
+import multiprocessing
+import os
+
+# app.py uses paths relative to server/
+chdir = os.path.dirname(os.path.abspath(__file__))
+
+bind = os.getenv("BIND", "0.0.0.0:5000")
+workers = int(os.getenv("WEB_CONCURRENCY", min(4, multiprocessing.cpu_count())))
+# ESP-facing views mostly wait on the network, so a worker runs many threads;
+# CPU-bound rendering is capped separately by RENDER_WORKERS (app.render_pool)
+threads = int(os.getenv("GUNICORN_THREADS", 16))
+
+# Calibration analyzes a whole video inside the request
+timeout = int(os.getenv("GUNICORN_TIMEOUT", 300))
+graceful_timeout = 30
+
+# No preload: each worker imports app.py itself, so the preview render pool and
+# the lazily imported modules are created after the fork
+preload_app = False
+
+accesslog = "-"
+errorlog = "-"
@@ -0,0 +1,397 @@
+import os
+import socket
+import struct
+import threading
+import time
+from collections import deque
+
+import numpy as np
+
+import shared_state
+
+# DDP (Distributed Display Protocol), as understood by WLED/xLights receivers
+DDP_PORT = 4048
+DDP_VERSION = 0x40
+DDP_FLAG_TIMECODE = 0x10
+DDP_FLAG_PUSH = 0x01
+DDP_TYPE_RGB8 = 0x0B
+DDP_ID_DISPLAY = 0x01
+DDP_MAX_DATA = 1440  # 480 RGB LEDs per datagram, stays below a typical MTU
+DDP_HEADER = struct.Struct('>BBBBIH')
+DDP_TIMECODE = struct.Struct('>I')
+# Frames kept for the jitter/frame time stats; streams run for hours, so older ones are dropped
+STATS_WINDOW = 1000
+CONTROL_POLL = 0.1     # seconds between checks of the control file by the streaming worker
+STATUS_INTERVAL = 1.0  # seconds between status file updates while streaming
+
+
+def _timecode_ms():
+    return int(time.time() * 1000) & 0xFFFFFFFF
+
+
+def ddp_packets(frame, sequence, timecode=None):
+    """
+    Split one frame of RGB bytes into DDP datagrams.
+    sequence is the 4-bit DDP sequence number (1..15); the last datagram carries
+    the PUSH flag so the receiver shows the frame only once it is complete.
+    timecode (ms, 32-bit) is sent in the optional timecode field for latency stats.
+    """
+    data = frame if isinstance(frame, (bytes, bytearray)) else np.asarray(frame, dtype=np.uint8).tobytes()
+    packets = []
+    for offset in range(0, len(data), DDP_MAX_DATA):
+        chunk = data[offset:offset + DDP_MAX_DATA]
+        flags = DDP_VERSION
+        last = offset + DDP_MAX_DATA >= len(data)
+        if last:
+            flags |= DDP_FLAG_PUSH
+        header = DDP_HEADER.pack(flags, sequence & 0x0F, DDP_TYPE_RGB8, DDP_ID_DISPLAY, offset, len(chunk))
+        if timecode is not None and last:
+            header = bytes([header[0] | DDP_FLAG_TIMECODE]) + header[1:] + DDP_TIMECODE.pack(timecode)
+        packets.append(header + chunk)
+    return packets
+
+
+def parse_ddp(datagram):
+    """Return (flags, sequence, offset, data, timecode or None) for one DDP datagram."""
+    flags, sequence, _, _, offset, length = DDP_HEADER.unpack_from(datagram)
+    pos = DDP_HEADER.size
+    timecode = None
+    if flags & DDP_FLAG_TIMECODE:
+        timecode = DDP_TIMECODE.unpack_from(datagram, pos)[0]
+        pos += DDP_TIMECODE.size
+    return flags, sequence & 0x0F, offset, datagram[pos:pos + length], timecode
+
+
+def _summary_ms(values):
+    if not values:
+        return {"mean": None, "p95": None, "max": None}
+    arr = np.asarray(values) * 1000.0
+    return {"mean": round(float(arr.mean()), 3), "p95": round(float(np.percentile(arr, 95)), 3),
+            "max": round(float(arr.max()), 3)}
+
+
+def effect_frames(gen, effect_name, params=None, loop=True):
+    """Frames of an effect computed one at a time, restarting the animation when it ends."""
+    while True:
+        yield from gen.iter_frames(effect_name, params)
+        if not loop:
+            return
+
+
+class LiveStream:
+    """
+    Push frames from an iterator to a DDP receiver at a fixed rate on a background thread.
+    set_source() swaps the iterator between two ticks, so switching effects takes at most one frame.
+    """
+    def __init__(self, host, port=DDP_PORT, fps=30):
+        self.address = (host, port)
+        self.fps = fps
+        self._source = None
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+        self._sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self._reset_stats()
+
+    def _reset_stats(self):
+        self.frames_sent = 0
+        self.packets_sent = 0
+        self.bytes_sent = 0
+        self.late_frames = 0
+        self.send_jitter = deque(maxlen=STATS_WINDOW)   # actual send time - scheduled time, seconds
+        self.render_times = deque(maxlen=STATS_WINDOW)  # time spent pulling the next frame, seconds
+        self.started_at = None
+        self.stopped_at = None
+
+    def set_source(self, frames):
+        with self._lock:
+            self._source = iter(frames)
+
+    def start(self):
+        if self._thread is not None and self._thread.is_alive():
+            return
+        self._stop.clear()
+        self._reset_stats()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout=2)
+        self.stopped_at = time.perf_counter()
+
+    @property
+    def running(self):
+        return self._thread is not None and self._thread.is_alive()
+
+    def _run(self):
+        period = 1.0 / self.fps
+        self.started_at = time.perf_counter()
+        next_tick = self.started_at
+        sequence = 0
+        while not self._stop.is_set():
+            start = time.perf_counter()
+            with self._lock:
+                source = self._source
+            try:
+                frame = next(source) if source is not None else None
+            except StopIteration:
+                frame = None
+                with self._lock:
+                    if self._source is source:
+                        self._source = None
+            self.render_times.append(time.perf_counter() - start)
+
+            # Sleep until the scheduled tick; ticks are absolute so errors do not accumulate
+            delay = next_tick - time.perf_counter()
+            if delay > 0:
+                self._stop.wait(delay)
+            sent_at = time.perf_counter()
+            self.send_jitter.append(sent_at - next_tick)
+            if sent_at - next_tick > period:
+                self.late_frames += 1
+
+            if frame is not None:
+                sequence = sequence % 15 + 1
+                for packet in ddp_packets(frame, sequence, _timecode_ms()):
+                    self._sock.sendto(packet, self.address)
+                    self.packets_sent += 1
+                    self.bytes_sent += len(packet)
+                self.frames_sent += 1
+
+            next_tick += period
+            # Far behind (e.g. a slow heavy effect): resync instead of bursting frames
+            if time.perf_counter() - next_tick > 5 * period:
+                next_tick = time.perf_counter()
+
+    def report(self):
+        end = self.stopped_at if self.stopped_at and not self.running else time.perf_counter()
+        elapsed = (end - self.started_at) if self.started_at else 0.0
+        return {
+            "target": f"{self.address[0]}:{self.address[1]}",
+            "running": self.running,
+            "target_fps": self.fps,
+            "actual_fps": round(self.frames_sent / elapsed, 2) if elapsed else 0.0,
+            "frames_sent": self.frames_sent,
+            "packets_sent": self.packets_sent,
+            "kbytes_sent": round(self.bytes_sent / 1024, 1),
+            "late_frames": self.late_frames,
+            "send_jitter_ms": _summary_ms(list(self.send_jitter)),
+            "frame_time_ms": _summary_ms(list(self.render_times)),
+        }
+
+
+class SharedStream:
+    """
+    One live stream for all server workers (gunicorn -w N).
+
+    Requests never drive a LiveStream directly: they write the wanted state to a
+    control file ({"running", "generation", "effect_name", "params", "fps", "host",
+    "port"}) and call ensure_running(). The worker holding "<control>.owner.lock" runs
+    the only LiveStream and follows the control file, so a start or stop that lands
+    on any worker reaches it within CONTROL_POLL. The owner publishes its report to a
+    status file ({"generation", "owner", "running", "report"}) that every worker reads.
+    make_source(control) returns the frame iterator for a control state.
+    """
+    def __init__(self, control_path, make_source, logger=None):
+        self.control_path = control_path
+        self.status_path = os.path.splitext(control_path)[0] + "_status.json"
+        self._owner_lock_path = control_path + ".owner"
+        self._make_source = make_source
+        self.logger = logger
+        self._lock = threading.Lock()
+        self._thread = None
+
+    def control(self):
+        return shared_state.read_json(self.control_path) or {}
+
+    def status(self):
+        return shared_state.read_json(self.status_path) or {}
+
+    def update(self, **changes):
+        """Merge `changes` into the control file under its lock; returns the new control state."""
+        with shared_state.file_lock(self.control_path):
+            control = dict(self.control(), **changes)
+            control["generation"] = control.get("generation", 0) + 1
+            shared_state.write_json(self.control_path, control, locked=True)
+        return control
+
+    def ensure_running(self):
+        """Start streaming in this worker unless another worker already owns the stream."""
+        with self._lock:
+            if self._thread is not None and self._thread.is_alive():
+                return
+            owner = self._acquire()
+            if owner is None:
+                return  # another worker streams and will pick up the control file
+            self._thread = threading.Thread(target=self._run, args=(owner,), daemon=True)
+            self._thread.start()
+
+    def wait_for_status(self, generation, timeout=3.0):
+        """Owner's status once it has applied `generation` (or the latest status after `timeout`)."""
+        deadline = time.perf_counter() + timeout
+        while time.perf_counter() < deadline:
+            status = self.status()
+            if status.get("generation", 0) >= generation:
+                return status
+            time.sleep(CONTROL_POLL / 2)
+        return self.status()
+
+    def _acquire(self):
+        lock = shared_state.file_lock(self._owner_lock_path, blocking=False)
+        try:
+            lock.__enter__()
+        except BlockingIOError:
+            return None
+        return lock
+
+    def _publish(self, generation, stream, error=None):
+        status = {"generation": generation, "owner": os.getpid(),
+                  "running": bool(stream and stream.running),
+                  "report": stream.report() if stream else None}
+        if error:
+            status["error"] = error
+        shared_state.write_json(self.status_path, status)
+
+    def _run(self, owner):
+        while True:
+            try:
+                self._stream_until_stopped()
+            finally:
+                owner.__exit__(None, None, None)
+            # A start written while this worker was shutting down may have found the
+            # owner lock still taken; take the stream back unless another worker has
+            if not self.control().get("running"):
+                return
+            owner = self._acquire()
+            if owner is None:
+                return
+
+    def _stream_until_stopped(self):
+        stream = None
+        applied = None
+        error = None
+        last_status = 0.0
+        control = {}
+        try:
+            while True:
+                control = self.control()
+                if not control.get("running"):
+                    break
+                target = (control["host"], int(control["port"]), float(control["fps"]))
+                if stream is not None and (stream.address, stream.fps) != (target[:2], target[2]):
+                    stream.stop()
+                    stream = None
+                if stream is None:
+                    stream = LiveStream(*target)
+                    applied = None
+                if control["generation"] != applied:
+                    applied = control["generation"]
+                    try:
+                        stream.set_source(self._make_source(control))
+                        error = None
+                    except Exception as e:
+                        stream.set_source(())
+                        error = str(e)
+                        if self.logger:
+                            self.logger.error(f"Live stream: {error}")
+                    stream.start()
+                    last_status = 0.0
+                if time.perf_counter() - last_status >= STATUS_INTERVAL:
+                    self._publish(applied, stream, error)
+                    last_status = time.perf_counter()
+                time.sleep(CONTROL_POLL)
+        finally:
+            if stream is not None:
+                stream.stop()
+            self._publish(control.get("generation", 0), stream, error)
+
+
+class UDPSink:
+    """
+    Local DDP receiver for testing without a controller: reassembles frames,
+    counts sequence gaps and measures latency from the sender's timecode.
+    """
+    def __init__(self, host="127.0.0.1", port=DDP_PORT):
+        self._sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self._sock.bind((host, port))
+        self._sock.settimeout(0.2)
+        self.address = self._sock.getsockname()
+        self._stop = threading.Event()
+        self._thread = None
+        self.frames = 0
+        self.packets = 0
+        self.lost = 0
+        self.latency = []
+        self.arrivals = []
+        self.last_frame = b""
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout=2)
+        self._sock.close()
+
+    def _run(self):
+        buffer = bytearray()
+        last_sequence = None
+        while not self._stop.is_set():
+            try:
+                datagram = self._sock.recv(65535)
+            except socket.timeout:
+                continue
+            except OSError:
+                break
+            flags, sequence, offset, data, timecode = parse_ddp(datagram)
+            self.packets += 1
+            if len(buffer) < offset + len(data):
+                buffer.extend(bytes(offset + len(data) - len(buffer)))
+            buffer[offset:offset + len(data)] = data
+            if not flags & DDP_FLAG_PUSH:
+                continue
+
+            if last_sequence is not None and sequence:
+                # Sequence numbers wrap 1..15
+                self.lost += (sequence - last_sequence - 1) % 15
+            last_sequence = sequence
+            self.frames += 1
+            self.arrivals.append(time.perf_counter())
+            if timecode is not None:
+                self.latency.append(((_timecode_ms() - timecode) & 0xFFFFFFFF) / 1000.0)
+            self.last_frame = bytes(buffer)
+
+    def report(self):
+        gaps = np.diff(self.arrivals) if len(self.arrivals) > 1 else []
+        return {
+            "frames": self.frames,
+            "packets": self.packets,
+            "lost_frames": self.lost,
+            "latency_ms": _summary_ms(self.latency),
+            "interval_ms": _summary_ms(list(gaps)),
+            "interval_jitter_ms": round(float(np.std(gaps) * 1000), 3) if len(gaps) else None,
+        }
+
+
+if __name__ == '__main__':
+    # Stream an effect to a local sink and print both reports
+    import json
+    import sys
+    from effectProcessing.code_effects import LEDEffectGenerator
+
+    effect_name = sys.argv[1] if len(sys.argv) > 1 else "plasma_cloud"
+    sink = UDPSink(port=0).start()
+    stream = LiveStream(*sink.address, fps=30)
+    stream.set_source(effect_frames(LEDEffectGenerator("jsons/led_positions.json"), effect_name))
+    stream.start()
+    time.sleep(5)
+    stream.stop()
+    time.sleep(0.3)
+    sink.stop()
+    print("Sender:", json.dumps(stream.report(), indent=2))
+    print("Sink:", json.dumps(sink.report(), indent=2))
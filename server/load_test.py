@@ -0,0 +1,235 @@
+"""
+Concurrent load test for the server, run once per gunicorn worker count:
+
+    python load_test.py --workers 1 2 4                   # starts gunicorn for each count
+    python load_test.py --url http://192.168.1.50:5000    # an already running server
+    python load_test.py --workers 4 --writes              # also re-upload the same GIF concurrently
+    python load_test.py --workers 1 --esp                 # also the ESP endpoints, against esp_stub.py
+
+By default only endpoints that never reach the ESP are used: /list_effects, /get_led_positions
+and an on-the-fly /render_effect_preview GIF. With --writes, clients also upload the same GIF
+name over and over while others sample it through /get_frames, so a torn
+write shows up as a failed request. With --esp, the server talks to a local ESP stub
+and clients add /send_effect uploads, /gif_control and /send_led_mapping.
+Needs jsons/led_positions.json (a calibration, or calibration/synthetic_video.py --truth).
+"""
+import argparse
+import io
+import json
+import os
+import socket
+import statistics
+import subprocess
+import sys
+import threading
+import time
+import urllib.error
+import urllib.request
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+from esp_stub import EspStub
+
+SERVER_DIR = os.path.dirname(os.path.abspath(__file__))
+PREVIEW_EFFECT = "christmas_twinkle"
+WRITE_GIF = "load_test.gif"
+# Random effect (never served from the payload cache), so every upload also renders
+UPLOAD_EFFECT = {"effect_name": "christmas_twinkle", "max_frames": 60}
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def start_gunicorn(workers, port, esp_url=None):
+    cmd = [sys.executable, "-m", "gunicorn", "-c", os.path.join(SERVER_DIR, "gunicorn.conf.py"),
+           "-w", str(workers), "-b", f"127.0.0.1:{port}", "app:app"]
+    env = dict(os.environ, ESP_URL=esp_url) if esp_url else None
+    proc = subprocess.Popen(cmd, cwd=SERVER_DIR, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    url = f"http://127.0.0.1:{port}"
+    deadline = time.time() + 30
+    while time.time() < deadline:
+        if proc.poll() is not None:
+            raise RuntimeError(f"gunicorn exited with status {proc.returncode}")
+        try:
+            urllib.request.urlopen(url + "/list_effects", timeout=2).read()
+            return proc, url
+        except (urllib.error.URLError, ConnectionError):
+            time.sleep(0.2)
+    proc.terminate()
+    raise RuntimeError("gunicorn did not come up within 30 s")
+
+
+def make_gif(seed):
+    """Small animated GIF whose size depends on seed, so every upload rewrites the file."""
+    from PIL import Image
+    size = 32 + seed % 32
+    frames = [Image.new("RGB", (size, size), ((seed * 40 + i * 60) % 256, i * 50 % 256, 128)) for i in range(4)]
+    out = io.BytesIO()
+    frames[0].save(out, format="GIF", save_all=True, append_images=frames[1:], duration=100, loop=0)
+    return out.getvalue()
+
+
+def multipart(field, filename, data):
+    boundary = uuid.uuid4().hex
+    body = (f"--{boundary}\r\nContent-Disposition: form-data; name=\"{field}\"; filename=\"{filename}\"\r\n"
+            f"Content-Type: image/gif\r\n\r\n").encode() + data + f"\r\n--{boundary}--\r\n".encode()
+    return body, f"multipart/form-data; boundary={boundary}"
+
+
+def post_json(url, data):
+    return urllib.request.Request(url, data=json.dumps(data).encode(), headers={"Content-Type": "application/json"})
+
+
+def build_requests(url, writes, esp):
+    """(name, factory) pairs; each factory returns a fresh urllib Request."""
+    reqs = [
+        ("list_effects", lambda i: urllib.request.Request(url + "/list_effects")),
+        ("get_led_positions", lambda i: urllib.request.Request(url + "/get_led_positions")),
+        ("preview_gif", lambda i: urllib.request.Request(
+            f"{url}/render_effect_preview/{PREVIEW_EFFECT}?format=gif&frames=10")),
+    ]
+    if writes:
+        def upload(i):
+            body, content_type = multipart("gif", WRITE_GIF, make_gif(i))
+            return urllib.request.Request(url + "/upload_gif_editor", data=body,
+                                          headers={"Content-Type": content_type})
+        reqs += [
+            ("upload_gif", upload),
+            ("get_frames", lambda i: urllib.request.Request(f"{url}/get_frames/{WRITE_GIF}")),
+        ]
+    if esp:
+        reqs += [
+            ("send_effect", lambda i: post_json(url + "/send_effect", UPLOAD_EFFECT)),
+            ("gif_control", lambda i: post_json(url + "/gif_control", {"action": "speed", "value": 40 + i % 60})),
+            ("send_led_mapping", lambda i: urllib.request.Request(url + "/send_led_mapping")),
+        ]
+    return reqs
+
+
+def run_load(url, clients, duration, writes, esp=False, only=None):
+    """Hit the endpoints round-robin from `clients` threads for `duration` seconds."""
+    reqs = build_requests(url, writes, esp)
+    upload = dict(reqs).get("upload_gif")
+    if only:
+        reqs = [(name, factory) for name, factory in reqs if name in only]
+    if writes:
+        # get_frames needs the file to exist before the first read
+        urllib.request.urlopen(upload(0), timeout=30).read()
+    latencies = {name: [] for name, _ in reqs}
+    errors = {name: 0 for name, _ in reqs}
+    lock = threading.Lock()
+    deadline = time.perf_counter() + duration
+
+    def client(client_id):
+        i = client_id
+        while time.perf_counter() < deadline:
+            name, factory = reqs[i % len(reqs)]
+            start = time.perf_counter()
+            try:
+                urllib.request.urlopen(factory(i), timeout=60).read()
+                ok = True
+            except (urllib.error.URLError, ConnectionError):
+                ok = False
+            elapsed = time.perf_counter() - start
+            with lock:
+                if ok:
+                    latencies[name].append(elapsed)
+                else:
+                    errors[name] += 1
+            i += 1
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=clients) as pool:
+        list(pool.map(client, range(clients)))
+    return latencies, errors, time.perf_counter() - start
+
+
+def percentiles(values):
+    if not values:
+        return {"p50": 0.0, "p95": 0.0, "p99": 0.0}
+    if len(values) == 1:
+        return {"p50": values[0], "p95": values[0], "p99": values[0]}
+    cuts = statistics.quantiles(values, n=100, method="inclusive")
+    return {"p50": cuts[49], "p95": cuts[94], "p99": cuts[98]}
+
+
+def report(label, latencies, errors, elapsed):
+    all_latencies = [t for values in latencies.values() for t in values]
+    total = len(all_latencies)
+    failed = sum(errors.values())
+    p = percentiles(all_latencies)
+    print(f"📊 {label}: {total / elapsed:.1f} req/s, {total} ok, {failed} failed, "
+          f"p50 {p['p50'] * 1000:.1f} ms, p95 {p['p95'] * 1000:.1f} ms, p99 {p['p99'] * 1000:.1f} ms")
+    for name, values in latencies.items():
+        p = percentiles(values)
+        print(f"   {name:<18} {len(values):>6} ok {errors[name]:>4} failed   "
+              f"p50 {p['p50'] * 1000:7.1f} ms  p95 {p['p95'] * 1000:7.1f} ms  p99 {p['p99'] * 1000:7.1f} ms")
+    return total / elapsed, failed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--url", help="Test a running server instead of starting gunicorn")
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 2, 4], help="gunicorn worker counts to compare")
+    parser.add_argument("--clients", type=int, default=16, help="Concurrent client threads")
+    parser.add_argument("--duration", type=float, default=10.0, help="Seconds per run")
+    parser.add_argument("--writes", action="store_true", help="Add concurrent GIF uploads and reads of the same file")
+    parser.add_argument("--esp", action="store_true", help="Add the ESP endpoints, served by a local esp_stub.py")
+    parser.add_argument("--esp-bandwidth", type=float, default=200, help="Stub upload bandwidth in KB/s")
+    parser.add_argument("--esp-serial", action="store_true", help="Stub handles one request at a time, like the ESP8266")
+    parser.add_argument("--esp-drop-after", type=int, default=None,
+                        help="Stub drops every upload after this many bytes, so uploads have to resume")
+    parser.add_argument("--only", nargs="+", help="Only these endpoints, e.g. --only send_effect gif_control")
+    args = parser.parse_args()
+    if args.esp and args.url:
+        parser.error("--esp starts its own servers; run esp_stub.py and set ESP_URL yourself to use --url")
+
+    if not os.path.exists(os.path.join(SERVER_DIR, "jsons", "led_positions.json")):
+        print("❌ jsons/led_positions.json not found, calibrate first (or use calibration/synthetic_video.py --truth)")
+        sys.exit(1)
+
+    stub = esp_url = None
+    if args.esp:
+        stub = EspStub(bandwidth_kbps=args.esp_bandwidth, serial=args.esp_serial,
+                       drop_after=args.esp_drop_after, max_drops=sys.maxsize)
+        esp_url = stub.start_in_thread()
+        print(f"🎄 ESP stub on {esp_url} ({args.esp_bandwidth:.0f} KB/s{', serial' if args.esp_serial else ''})")
+
+    failed = 0
+    if args.url:
+        print(f"🚀 {args.url}, {args.clients} clients, {args.duration:.0f} s")
+        _, failed = report(args.url, *run_load(args.url.rstrip("/"), args.clients, args.duration, args.writes,
+                                               only=args.only))
+    else:
+        for workers in args.workers:
+            print(f"🚀 gunicorn -w {workers}, {args.clients} clients, {args.duration:.0f} s")
+            proc, url = start_gunicorn(workers, free_port(), esp_url)
+            try:
+                _, run_failed = report(f"{workers} worker(s)",
+                                       *run_load(url, args.clients, args.duration, args.writes, args.esp, args.only))
+                failed += run_failed
+            finally:
+                proc.terminate()
+                proc.wait()
+
+    if args.writes:
+        upload_path = os.path.join(os.getenv("UPLOAD_DIR", os.path.join(SERVER_DIR, "uploads")), WRITE_GIF)
+        if not args.url:
+            for path in (upload_path, upload_path + ".lock"):
+                if os.path.exists(path):
+                    os.remove(path)
+    if stub:
+        print(f"🎄 ESP stub saw {dict(stub.requests)}, {len(stub.payloads)} complete upload(s), "
+              f"{stub.drops} drop(s), {stub.bad_payloads} bad payload(s)")
+        failed += stub.bad_payloads
+    if failed:
+        print(f"❌ {failed} failed request(s)")
+        sys.exit(1)
+    print("✅ No failed requests")
+
+
+if __name__ == "__main__":
+    main()
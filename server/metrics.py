@@ -0,0 +1,121 @@
+"""
+Lightweight timing instrumentation: spans -> histograms -> Prometheus text format.
+
+    with metrics.span("render", effect=effect_name):
+        frames = gen.render(effect_name, params)
+
+Each span adds its duration to a fixed-bucket histogram keyed by stage and labels,
+and writes one JSON line to `logger` (stage, labels, ms, parent span). A span
+costs two perf_counter() calls, a bisect and a short lock, so it stays on in production.
+"""
+import bisect
+import json
+import logging
+import threading
+import time
+from contextlib import contextmanager
+
+# Upper bounds in seconds, from 1 ms (a cached payload) to 2 min (calibration)
+BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0)
+
+STAGE_METRIC = "smarttree_stage_duration_seconds"
+REQUEST_METRIC = "smarttree_http_request_duration_seconds"
+
+HELP = {
+    STAGE_METRIC: "Time spent in one stage (render, sample, encode, upload, calibration steps)",
+    REQUEST_METRIC: "Flask request handling time by endpoint",
+}
+
+logger = logging.getLogger(__name__)
+
+_lock = threading.Lock()
+_histograms = {}  # (metric, sorted label items) -> [bucket counts..., +Inf count, sum]
+_local = threading.local()
+
+
+def _record(metric, labels, seconds):
+    key = (metric, tuple(sorted(labels.items())))
+    index = bisect.bisect_left(BUCKETS, seconds)
+    with _lock:
+        hist = _histograms.get(key)
+        if hist is None:
+            hist = _histograms[key] = [0] * (len(BUCKETS) + 1) + [0.0]
+        hist[index] += 1
+        hist[-1] += seconds
+
+
+def observe(stage, seconds, **labels):
+    """Record one stage duration. Labels must have low cardinality (effect names yes, file names no)."""
+    _record(STAGE_METRIC, dict(labels, stage=stage), seconds)
+
+
+def observe_request(endpoint, method, status, seconds):
+    _record(REQUEST_METRIC, {"endpoint": endpoint, "method": method, "status": status}, seconds)
+
+
+@contextmanager
+def span(stage, **labels):
+    """Time a block as `stage`; nested spans record their parent in the log line."""
+    stack = getattr(_local, "stack", None)
+    if stack is None:
+        stack = _local.stack = []
+    parent = stack[-1] if stack else None
+    stack.append(stage)
+    start = time.perf_counter()
+    error = None
+    try:
+        yield
+    except Exception as e:
+        error = type(e).__name__
+        raise
+    finally:
+        seconds = time.perf_counter() - start
+        stack.pop()
+        observe(stage, seconds, **labels)
+        if logger.isEnabledFor(logging.INFO):
+            record = {"event": "span", "stage": stage, "ms": round(seconds * 1000, 3)}
+            if parent:
+                record["parent"] = parent
+            if error:
+                record["error"] = error
+            record.update(labels)
+            logger.info(json.dumps(record, default=str))
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _format_labels(items, extra=None):
+    items = list(items) + ([extra] if extra else [])
+    if not items:
+        return ""
+    return "{" + ",".join(f'{k}="{_escape(v)}"' for k, v in items) + "}"
+
+
+def render_prometheus():
+    """All histograms in the Prometheus text exposition format (cumulative buckets)."""
+    with _lock:
+        snapshot = {key: list(hist) for key, hist in _histograms.items()}
+
+    lines = []
+    for metric in sorted({m for m, _ in snapshot}):
+        lines.append(f"# HELP {metric} {HELP.get(metric, metric)}")
+        lines.append(f"# TYPE {metric} histogram")
+        for (m, labels), hist in sorted(snapshot.items(), key=lambda kv: kv[0][1]):
+            if m != metric:
+                continue
+            cumulative = 0
+            for bound, count in zip(BUCKETS, hist):
+                cumulative += count
+                lines.append(f"{metric}_bucket{_format_labels(labels, ('le', bound))} {cumulative}")
+            total = cumulative + hist[len(BUCKETS)]
+            lines.append(f"{metric}_bucket{_format_labels(labels, ('le', '+Inf'))} {total}")
+            lines.append(f"{metric}_sum{_format_labels(labels)} {hist[-1]:.6f}")
+            lines.append(f"{metric}_count{_format_labels(labels)} {total}")
+    return "\n".join(lines) + "\n"
+
+
+def reset():
+    with _lock:
+        _histograms.clear()
@@ -0,0 +1,213 @@
+"""
+Opt-in profiling of single requests, for admins.
+
+Add ?profile=cprofile (or ?profile=1) or ?profile=sampling, or the X-Profile header,
+to a @profiled route and send the admin token in X-Admin-Token. The request runs
+under the profiler and the artifact is saved to PROFILE_DIR:
+- cprofile: deterministic, <id>.pstats (python -m pstats, snakeviz)
+- sampling: wall-clock stack samples, <id>.speedscope.json (https://www.speedscope.app)
+The response carries X-Profile-Id; artifacts are listed at /profiles.
+
+Profiling is disabled unless ADMIN_TOKEN is set in the environment.
+"""
+import cProfile
+import functools
+import hmac
+import inspect
+import json
+import os
+import sys
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+
+from flask import current_app, g, jsonify, request
+
+PROFILE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "profiles")
+MAX_PROFILES = 50
+SAMPLE_INTERVAL = 0.002  # seconds between stack samples
+PROFILERS = {"1": "cprofile", "cprofile": "cprofile", "sampling": "sampling"}
+EXTENSIONS = {"cprofile": ".pstats", "sampling": ".speedscope.json"}
+
+
+def is_admin():
+    """True when the request carries the token from ADMIN_TOKEN (never when it is unset)."""
+    token = os.getenv("ADMIN_TOKEN")
+    given = request.headers.get("X-Admin-Token", "")
+    return bool(token) and hmac.compare_digest(given.encode(), token.encode())
+
+
+def requested_profiler():
+    """Profiler asked for ("cprofile", "sampling" or None); raises ValueError for unknown values."""
+    value = request.args.get("profile") or request.headers.get("X-Profile")
+    if not value:
+        return None
+    if value not in PROFILERS:
+        raise ValueError(f"Unknown profiler {value!r}, use one of: cprofile, sampling")
+    return PROFILERS[value]
+
+
+class StackSampler:
+    """Samples one thread's Python stack at a fixed interval from a background thread."""
+    def __init__(self, thread_id, interval=SAMPLE_INTERVAL):
+        self.thread_id = thread_id
+        self.interval = interval
+        self.frames = {}  # (name, file, line) -> index
+        self.samples = []  # [frame indices, outermost first]
+        self.weights = []
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    def _frame_index(self, code):
+        key = (code.co_name, code.co_filename, code.co_firstlineno)
+        index = self.frames.get(key)
+        if index is None:
+            index = self.frames[key] = len(self.frames)
+        return index
+
+    def _run(self):
+        last = time.perf_counter()
+        while not self._stop.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            now = time.perf_counter()
+            if frame is None:
+                continue
+            stack = []
+            while frame is not None:
+                stack.append(self._frame_index(frame.f_code))
+                frame = frame.f_back
+            stack.reverse()
+            self.samples.append(stack)
+            self.weights.append(now - last)
+            last = now
+
+    def start(self):
+        self._start = time.perf_counter()
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+        self.duration = time.perf_counter() - self._start
+
+    def to_speedscope(self, name):
+        frames = [{"name": fn, "file": path, "line": line} for (fn, path, line) in self.frames]
+        return {
+            "$schema": "https://www.speedscope.app/file-format-schema.json",
+            "shared": {"frames": frames},
+            "profiles": [{
+                "type": "sampled",
+                "name": name,
+                "unit": "seconds",
+                "startValue": 0,
+                "endValue": round(self.duration, 6),
+                "samples": self.samples,
+                "weights": [round(w, 6) for w in self.weights],
+            }],
+            "name": name,
+            "exporter": "SmartChristmasLights profiling.py",
+        }
+
+
+def _prune():
+    files = sorted((os.path.join(PROFILE_DIR, f) for f in os.listdir(PROFILE_DIR)), key=os.path.getmtime)
+    for path in files[:-MAX_PROFILES]:
+        os.remove(path)
+
+
+@contextmanager
+def profile_block(kind, name):
+    """Profile the current thread for the duration of the block; yields the profile id."""
+    os.makedirs(PROFILE_DIR, exist_ok=True)
+    profile_id = f"{time.strftime('%Y%m%d-%H%M%S')}-{name}-{uuid.uuid4().hex[:6]}"
+    path = os.path.join(PROFILE_DIR, profile_id + EXTENSIONS[kind])
+
+    if kind == "cprofile":
+        profiler = cProfile.Profile()
+        profiler.enable()
+        try:
+            yield profile_id
+        finally:
+            profiler.disable()
+            profiler.dump_stats(path)
+    else:
+        sampler = StackSampler(threading.get_ident())
+        sampler.start()
+        try:
+            yield profile_id
+        finally:
+            sampler.stop()
+            with open(path, "w") as fh:
+                json.dump(sampler.to_speedscope(profile_id), fh)
+    _prune()
+
+
+def run_profiled(kind, name, fn):
+    """Run fn under the chosen profiler and save the artifact; returns (result, profile_id)."""
+    with profile_block(kind, name) as profile_id:
+        result = fn()
+    return result, profile_id
+
+
+def _check_request():
+    """(profiler kind or None, error response or None) for the current request."""
+    try:
+        kind = requested_profiler()
+    except ValueError as e:
+        return None, (jsonify({"status": "error", "message": str(e)}), 400)
+    if kind is not None and not is_admin():
+        return None, (jsonify({"status": "error", "message": "Profiling is only available to admins"}), 403)
+    return kind, None
+
+
+def _profiled_response(kind, result, profile_id):
+    response = current_app.make_response(result)
+    response.headers["X-Profile-Id"] = profile_id
+    current_app.logger.info(f"Saved {kind} profile {profile_id}")
+    return response
+
+
+def profiled(view):
+    """
+    Route decorator: profile the request when an admin asks for it.
+    Works for sync and async views; g.profiling holds the profiler kind meanwhile,
+    so views keep work they would hand to other threads inline and the profile sees it.
+    """
+    if inspect.iscoroutinefunction(view):
+        @functools.wraps(view)
+        async def async_wrapper(*args, **kwargs):
+            kind, error = _check_request()
+            if error:
+                return error
+            if kind is None:
+                return await view(*args, **kwargs)
+            g.profiling = kind
+            with profile_block(kind, request.endpoint) as profile_id:
+                result = await view(*args, **kwargs)
+            return _profiled_response(kind, result, profile_id)
+        return async_wrapper
+
+    @functools.wraps(view)
+    def wrapper(*args, **kwargs):
+        kind, error = _check_request()
+        if error:
+            return error
+        if kind is None:
+            return view(*args, **kwargs)
+        g.profiling = kind
+        result, profile_id = run_profiled(kind, request.endpoint, lambda: view(*args, **kwargs))
+        return _profiled_response(kind, result, profile_id)
+    return wrapper
+
+
+def list_profiles():
+    """Saved artifacts, newest first."""
+    if not os.path.isdir(PROFILE_DIR):
+        return []
+    entries = []
+    for name in os.listdir(PROFILE_DIR):
+        st = os.stat(os.path.join(PROFILE_DIR, name))
+        kind = "sampling" if name.endswith(EXTENSIONS["sampling"]) else "cprofile"
+        entries.append({"file": name, "kind": kind, "bytes": st.st_size, "created": st.st_mtime})
+    return sorted(entries, key=lambda e: e["created"], reverse=True)
@@ -38,12 +38,12 @@ def send_gif_to_esp(gif_path, esp_ip=ESP_IP):
     # Append frame data
     for frame in frames:
         # frame is shape (num_leds, 3) - RGB values
-        for led in frame:
-            payload.extend(led)  # Append R, G, B bytes
+        payload.extend(frame.tobytes())
     
+    num_leds = len(frames[0]) if frames else 0
     total_size = len(payload)
     print(f"Total payload size: {total_size} bytes ({total_size / 1024:.2f} KB)")
-    print(f"Expected size: {2 + num_frames * 200 * 3} bytes")
+    print(f"Expected size: {2 + num_frames * num_leds * 3} bytes ({num_leds} LEDs)")
     
     # Send to ESP
     url = f"http://{esp_ip}/gif"
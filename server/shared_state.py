@@ -0,0 +1,108 @@
+"""
+Files shared by server worker processes (gunicorn -w N): codebook, LED layout,
+preview manifest, GIFs. Every worker reads them from disk, so they must never be
+seen half-written and read-modify-write cycles must not interleave.
+
+- file_lock(path): exclusive lock on "<path>.lock", held across processes
+- write_bytes / write_json / save_stream: atomic replace (temp file + os.replace) under the lock
+- read_json: parsed once per process and re-read only when the file changes
+"""
+import json
+import os
+import tempfile
+import threading
+from contextlib import contextmanager
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+    import msvcrt
+
+_cache_lock = threading.Lock()
+_json_cache = {}  # path -> ((mtime_ns, size), data)
+
+
+@contextmanager
+def file_lock(path, blocking=True):
+    """
+    Exclusive advisory lock for `path`, shared by threads and processes.
+    With blocking=False, raises BlockingIOError when someone else holds it.
+    """
+    lock_path = os.path.abspath(path) + ".lock"
+    os.makedirs(os.path.dirname(lock_path), exist_ok=True)
+    with open(lock_path, "a+b") as fh:
+        if fcntl:
+            fcntl.flock(fh.fileno(), fcntl.LOCK_EX if blocking else fcntl.LOCK_EX | fcntl.LOCK_NB)
+        else:
+            fh.seek(0)
+            try:
+                msvcrt.locking(fh.fileno(), msvcrt.LK_LOCK if blocking else msvcrt.LK_NBLCK, 1)
+            except OSError as e:
+                raise BlockingIOError(str(e)) from e
+        try:
+            yield
+        finally:
+            if fcntl:
+                fcntl.flock(fh.fileno(), fcntl.LOCK_UN)
+            else:
+                fh.seek(0)
+                msvcrt.locking(fh.fileno(), msvcrt.LK_UNLCK, 1)
+
+
+def _replace_with(path, write):
+    """Write through `write(fh)` to a temp file next to `path`, then swap it in atomically."""
+    directory = os.path.dirname(os.path.abspath(path))
+    os.makedirs(directory, exist_ok=True)
+    fd, tmp = tempfile.mkstemp(dir=directory, prefix="." + os.path.basename(path), suffix=".tmp")
+    try:
+        with os.fdopen(fd, "wb") as fh:
+            write(fh)
+        os.replace(tmp, path)
+    except BaseException:
+        if os.path.exists(tmp):
+            os.remove(tmp)
+        raise
+
+
+def write_bytes(path, data, locked=False):
+    """Atomically replace `path` with `data`. Pass locked=True when already inside file_lock(path)."""
+    if locked:
+        _replace_with(path, lambda fh: fh.write(data))
+    else:
+        with file_lock(path):
+            _replace_with(path, lambda fh: fh.write(data))
+
+
+def write_json(path, data, locked=False, **dump_kwargs):
+    write_bytes(path, json.dumps(data, **dump_kwargs).encode(), locked=locked)
+
+
+def save_stream(path, stream, chunk_size=1 << 20):
+    """Copy a file-like object (e.g. an upload) to `path` atomically."""
+    def copy(fh):
+        for chunk in iter(lambda: stream.read(chunk_size), b""):
+            fh.write(chunk)
+    with file_lock(path):
+        _replace_with(path, copy)
+
+
+def read_json(path, default=None):
+    """Parsed JSON of `path`, cached until its mtime or size changes; `default` when missing or invalid."""
+    try:
+        st = os.stat(path)
+    except OSError:
+        return default
+    stamp = (st.st_mtime_ns, st.st_size)
+    with _cache_lock:
+        cached = _json_cache.get(path)
+        if cached and cached[0] == stamp:
+            return cached[1]
+    try:
+        with open(path, "r") as fh:
+            data = json.load(fh)
+    except (OSError, ValueError):
+        return default
+    with _cache_lock:
+        _json_cache[path] = (stamp, data)
+    return data
@@ -17,6 +17,23 @@ async function setGifSpeed() {
     });
 }
 
+async function loadEffectPreview(video, effectName, attempt = 0) {
+    // Previews render in the background on the server; poll until ready
+    try {
+        const resp = await fetch(`/get_effect_preview/${effectName}?format=json`);
+        const data = await resp.json();
+        if (data.status === 'ready') {
+            video.src = data.url;
+            return;
+        }
+        if (data.status === 'pending' && attempt < 60) {
+            setTimeout(() => loadEffectPreview(video, effectName, attempt + 1), 2000);
+        }
+    } catch (e) {
+        console.error(e);
+    }
+}
+
 async function loadCombinedEffectsAndGifs() {
     const list = document.getElementById('combined-list');
     if (!list) return;
@@ -45,7 +62,8 @@ async function loadCombinedEffectsAndGifs() {
 
                 // Use video element for effect previews
                 const video = document.createElement('video');
-                video.src = `/get_effect_preview/${effectName}`;
+                video.poster = '/static/images/pngTree.png';
+                loadEffectPreview(video, effectName);
                 video.alt = effectName;
                 video.className = 'effect-thumb';
                 video.autoplay = true;
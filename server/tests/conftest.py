@@ -0,0 +1,64 @@
+import functools
+import json
+import os
+import socket
+import sys
+
+import numpy as np
+import pytest
+
+SERVER_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if SERVER_DIR not in sys.path:
+    sys.path.insert(0, SERVER_DIR)
+
+from esp_stub import EspStub  # noqa: E402
+
+
+def write_layout(path, num_leds, width=400, height=600):
+    """Calibrated-layout file of LEDs spiralling up a cone: [[index, [x, y]], ...]."""
+    h = np.linspace(0.0, 1.0, num_leds)
+    xs = width / 2 + (1.0 - h) * width * 0.4 * np.cos(2 * np.pi * 6 * h)
+    ys = height * (0.9 - 0.8 * h)
+    with open(path, "w") as fh:
+        json.dump([[i, [round(float(x), 1), round(float(y), 1)]] for i, (x, y) in enumerate(zip(xs, ys))], fh)
+    return str(path)
+
+
+def closed_port_url():
+    """URL of a local port nobody listens on (connections are refused)."""
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        port = s.getsockname()[1]
+    return f"http://127.0.0.1:{port}"
+
+
+@pytest.fixture
+def start_stub():
+    """Start an EspStub in a background thread: start_stub(**options) -> (stub, url)."""
+    def start(**options):
+        options.setdefault("latency", 0.005)
+        options.setdefault("bandwidth_kbps", 100000)
+        stub = EspStub(**options)
+        return stub, stub.start_in_thread()
+    return start
+
+
+@pytest.fixture
+def client(tmp_path, monkeypatch):
+    """
+    Flask test client on a temporary layout (60 LEDs) and controller registry.
+    Point it at an ESP with monkeypatch.setattr(app, "ESP_URL", url) or write
+    tmp_path / "controllers.json".
+    """
+    import app
+    import controllers
+
+    monkeypatch.setattr(app, "LED_POSITIONS_PATH", write_layout(tmp_path / "led_positions.json", 60))
+    monkeypatch.setattr(app, "ESP_URL", closed_port_url())
+    monkeypatch.setattr(controllers, "load", functools.partial(
+        controllers.load, path=str(tmp_path / "controllers.json"),
+        combined_path=str(tmp_path / "combined_layout.json")))
+    monkeypatch.setattr(controllers, "configured", functools.partial(
+        controllers.configured, path=str(tmp_path / "controllers.json")))
+    app.effect_payload_cache.clear()
+    return app.app.test_client()
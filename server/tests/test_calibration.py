@@ -0,0 +1,59 @@
+"""Calibration codebooks, matching and outlier correction on hand-built tracks."""
+import json
+
+import pytest
+
+import app
+from calibration import codebook
+from calibration.image_processing import correct_outliers_with_quality, match_leds_detailed
+
+
+def flip(code, pos):
+    """`code` with the symbol at `pos` replaced by another one (a single misdetected frame)."""
+    other = codebook.SYMBOLS[(codebook.SYMBOLS.index(code[pos]) + 1) % len(codebook.SYMBOLS)]
+    return code[:pos] + other + code[pos + 1:]
+
+
+def test_duplicate_decode_falls_back_to_next_best_candidate():
+    codes = codebook.generate_codebook(20, code_len=9)
+    grouped = [
+        # LEDs 0 and 1 both rank this track first; LED 0 has the stronger vote
+        ((10.0, 10.0), list(codes[0] * 3 + codes[1] * 2)),
+        # LED 1's next-best track, one frame misdetected but within the correction radius
+        ((50.0, 50.0), list(flip(codes[1], 4))),
+        # also decodes to LED 0, which is taken, and has no other candidate
+        ((90.0, 90.0), list(codes[0] * 2)),
+    ]
+    matched, report = match_leds_detailed(codes, grouped, min_votes=1, decoder=codebook.decode_codes)
+
+    assert matched == [(0, (10.0, 10.0)), (1, (50.0, 50.0))]
+    assert report['duplicates'] == [(0, [0, 1])]
+    assert report['unmatched'] == [(2, "LED 0 went to track 0 with a stronger vote")]
+
+
+@pytest.mark.parametrize("count", [20, 60, 729])
+def test_generated_codebook_matches_firmware_frames(count, tmp_path, monkeypatch):
+    monkeypatch.setattr(app, "mapping_file", str(tmp_path / "mappings.json"))
+    mappings = app.generate_led_color_mappings(count)
+    assert len(mappings) == count
+    assert {len(c) for c in mappings} == {codebook.FIRMWARE_CODE_LEN}
+    assert codebook.is_codebook(mappings) and codebook.min_distance(mappings) >= 3
+
+
+def test_codebook_of_another_length_is_replaced(tmp_path, monkeypatch):
+    path = tmp_path / "mappings.json"
+    path.write_text(json.dumps(codebook.generate_codebook(60)))  # 8 frames per code
+    monkeypatch.setattr(app, "mapping_file", str(path))
+    mappings = app.load_led_color_mappings(60)
+    assert {len(c) for c in mappings} == {codebook.FIRMWARE_CODE_LEN}
+
+
+def test_outlier_next_to_a_gap_is_interpolated_by_led_index():
+    # LEDs on a line 10 px apart; LED 6 is missing and LED 5 was detected far away
+    matched = [(i, (10.0 * i, 0.0)) for i in range(12) if i != 6]
+    matched[5] = (5, (50.0, 300.0))
+    corrected, quality = correct_outliers_with_quality(matched)
+
+    assert dict(corrected)[5] == pytest.approx((50.0, 0.0))
+    assert quality[5] < 1.0
+    assert [p for i, p in corrected if i != 5] == [p for i, p in matched if i != 5]
@@ -0,0 +1,82 @@
+"""Several trees driven as one display: payload slices, synchronized start, partial failures."""
+import json
+import struct
+
+import numpy as np
+
+import app
+import controllers
+from conftest import closed_port_url, write_layout
+
+SIZES = (60, 40, 25)
+
+
+def write_registry(tmp_path, urls):
+    """controllers.json for one tree per url (SIZES LEDs each, side by side); returns its path."""
+    entries = []
+    for i, (url, size) in enumerate(zip(urls, SIZES)):
+        layout = write_layout(tmp_path / f"tree{i}.json", size)
+        entries.append({"name": f"tree{i}", "url": url, "layout": layout, "offset": [500 * i, 0]})
+    path = tmp_path / "controllers.json"
+    path.write_text(json.dumps({"controllers": entries}))
+    return str(path)
+
+
+def test_split_payload_gives_each_controller_its_leds(tmp_path):
+    path = write_registry(tmp_path, ["http://a", "http://b", "http://c"])
+    registry = controllers.load("http://unused", "unused.json", path, str(tmp_path / "combined.json"))
+    assert registry.led_count == sum(SIZES)
+    assert [(c.start, c.count) for c in registry.controllers] == [(0, 60), (60, 40), (100, 25)]
+
+    frames = np.random.default_rng(1).integers(0, 256, (7, registry.led_count, 3), dtype=np.uint8)
+    payload = struct.pack("<H", 7) + frames.tobytes()
+    parts = registry.split_payload(payload)
+
+    for c, part in parts:
+        assert part == struct.pack("<H", 7) + frames[:, c.start:c.start + c.count].tobytes()
+    # Only the selected controllers
+    assert [c.name for c, _ in registry.split_payload(payload, registry.select(["tree2"]))] == ["tree2"]
+
+
+def test_send_effect_slices_and_starts_all_trees_together(client, tmp_path, start_stub):
+    stubs, urls = zip(*(start_stub(latency=0.02 * (i + 1)) for i in range(3)))
+    write_registry(tmp_path, urls)
+
+    resp = client.post("/send_effect", json={"effect_name": "plasma_cloud", "max_frames": 10})
+
+    assert resp.status_code == 200, resp.get_json()
+    registry = controllers.load(app.ESP_URL, app.LED_POSITIONS_PATH)
+    payload, _, _ = app.render_effect_payload("plasma_cloud", resp.get_json()["params"], 10, registry.layout_path)
+    frames = np.frombuffer(payload[2:], dtype=np.uint8).reshape(10, sum(SIZES), 3)
+    starts = []
+    for stub, c in zip(stubs, registry.controllers):
+        assert stub.payloads == [payload[:2] + frames[:, c.start:c.start + c.count].tobytes()]
+        assert stub.staged is None  # staged with ?play=0, then started
+        assert len(stub.starts) == 1
+        starts.extend(stub.starts)
+    # Latencies differ by 20 ms per tree; the start delays compensate for them
+    assert max(starts) - min(starts) < 0.015
+
+
+def test_a_failed_controller_is_reported_and_the_others_still_start(client, tmp_path, start_stub):
+    (stub0, url0), (stub1, url1) = start_stub(), start_stub()
+    write_registry(tmp_path, [url0, url1, closed_port_url()])
+
+    resp = client.post("/send_effect", json={"effect_name": "plasma_cloud", "max_frames": 10})
+
+    assert resp.status_code == 502
+    body = resp.get_json()
+    assert body["status"] == "error"
+    assert [r["status"] for r in body["controllers"]] == ["ok", "ok", "error"]
+    assert "tree2" in body["error"] and "tree0" not in body["error"]
+    assert len(stub0.starts) == 1 and len(stub1.starts) == 1
+
+
+def test_unknown_controller_names_are_rejected(client, tmp_path, start_stub):
+    _, url = start_stub()
+    write_registry(tmp_path, [url])
+
+    resp = client.post("/gif_control", json={"action": "pause", "controllers": ["nope"]})
+
+    assert resp.status_code == 400
+    assert "nope" in resp.get_json()["message"]
@@ -0,0 +1,67 @@
+"""Effect geometry is normalized to the layout: defaults and output on synthetic layouts."""
+import json
+
+import numpy as np
+import pytest
+
+from conftest import write_layout
+from effectProcessing.code_effects import DEFAULT_CENTER, LEDEffectGenerator
+
+DETERMINISTIC_SPATIAL = [n for n in LEDEffectGenerator.get_effect_names()
+                         if LEDEffectGenerator.effect_info(n).spatial
+                         and not LEDEffectGenerator.effect_info(n).randomized]
+SWEEPS = ["waving_stripe", "color_waves", "down_to_up"]
+
+
+def transformed_layout(src, dst, scale, shift):
+    """Copy of the layout at `src`, scaled and shifted, written to `dst`."""
+    with open(src) as fh:
+        layout = json.load(fh)
+    with open(dst, "w") as fh:
+        json.dump([[i, [x * scale + shift[0], y * scale + shift[1]]] for i, (x, y) in layout], fh)
+    return str(dst)
+
+
+@pytest.fixture
+def layout(tmp_path):
+    return write_layout(tmp_path / "led_positions.json", 120)
+
+
+def test_defaults_are_round_fractions_of_the_layout():
+    assert DEFAULT_CENTER == (0.5, 0.5)
+    # frame counts follow from the round defaults, not from one camera's pixel sizes
+    counts = {n: LEDEffectGenerator.frame_count(n)
+              for n in ("pulsating_glow", "radial_pulse", "ripple_effect", "waving_stripe", "down_to_up")}
+    assert counts == {"pulsating_glow": 100, "radial_pulse": 100, "ripple_effect": 165,
+                      "waving_stripe": 60, "down_to_up": 141}
+
+
+@pytest.mark.parametrize("name", DETERMINISTIC_SPATIAL)
+def test_output_does_not_depend_on_layout_pixels(name, layout, tmp_path):
+    # the same tree photographed larger and elsewhere in the frame looks the same
+    # (a power of two scale keeps the float arithmetic exact)
+    moved = transformed_layout(layout, tmp_path / "moved.json", 4.0, (256.0, -40.0))
+    frames = np.array(LEDEffectGenerator(layout).render(name))
+    assert len(frames) == LEDEffectGenerator.frame_count(name)
+    assert np.array_equal(frames, np.array(LEDEffectGenerator(moved).render(name)))
+
+
+@pytest.mark.parametrize("name", SWEEPS)
+def test_sweeps_cross_the_whole_layout(name, layout, tmp_path):
+    # before, they swept fixed camera columns and could miss a tree standing elsewhere
+    moved = transformed_layout(layout, tmp_path / "moved.json", 1.0, (900.0, 0.0))
+    for path in (layout, moved):
+        frames = np.array(LEDEffectGenerator(path).render(name))
+        changed = (frames != frames[0]).any(axis=2).any(axis=0)
+        assert changed.all(), f"{name} never reached {int((~changed).sum())} LEDs of {path}"
+
+
+def test_radial_pulse_starts_at_the_layout_center(layout):
+    gen = LEDEffectGenerator(layout)
+    frames = np.array(gen.render("radial_pulse"))
+    lit = (frames != frames[0]).any(axis=2)
+    first = np.flatnonzero(lit.any(axis=1))[0]
+    center = gen.to_layout(DEFAULT_CENTER)
+    dists = np.hypot(gen.x - center[0], gen.y - center[1])
+    # the first LEDs reached are the ones nearest the middle of the bounding box
+    assert dists[lit[first]].max() <= np.sort(dists)[lit[first].sum() - 1] + 1e-9
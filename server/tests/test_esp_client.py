@@ -0,0 +1,76 @@
+"""Chunked, resumable uploads (esp_client.upload) against an in-process ESP stub."""
+import asyncio
+import os
+
+import pytest
+
+import esp_client
+
+PAYLOAD = b"\x0a\x00" + os.urandom(10 * 300 * 3)  # 10 frames of 300 LEDs
+
+
+@pytest.fixture(autouse=True)
+def fast_retries(monkeypatch):
+    monkeypatch.setattr(esp_client, "RETRY_DELAY", 0.01)
+
+
+def test_upload_streams_the_payload_in_chunks(start_stub):
+    stub, url = start_stub()
+    progress = []
+
+    resp, stats = asyncio.run(esp_client.upload(url, PAYLOAD, progress=lambda sent, size, s: progress.append(sent)))
+
+    assert resp.status_code == 200
+    assert stub.payloads == [PAYLOAD]
+    assert stats["bytes"] == len(PAYLOAD) and stats["resumes"] == 0
+    # One progress call per chunk, ending at the full size
+    assert len(progress) == -(-len(PAYLOAD) // esp_client.CHUNK_SIZE)
+    assert progress[-1] == len(PAYLOAD)
+
+
+def test_upload_from_a_file(start_stub, tmp_path):
+    stub, url = start_stub()
+    path = tmp_path / "payload.bin"
+    path.write_bytes(PAYLOAD)
+
+    with open(path, "rb") as fh:
+        resp, _ = asyncio.run(esp_client.upload(url, fh))
+
+    assert resp.status_code == 200
+    assert stub.payloads == [PAYLOAD]
+
+
+def test_upload_resumes_after_a_dropped_connection(start_stub):
+    stub, url = start_stub(drop_after=4 * esp_client.CHUNK_SIZE)
+
+    resp, stats = asyncio.run(esp_client.upload(url, PAYLOAD))
+
+    assert resp.status_code == 200
+    assert stub.drops == 1
+    assert stats["resumes"] == 1
+    # Resumed at the ESP's offset: the payload arrives whole and only once
+    assert stub.payloads == [PAYLOAD]
+    assert stub.requests["/gif/status"] == 1
+
+
+def test_upload_starts_over_when_the_esp_lost_the_partial_upload(start_stub, monkeypatch):
+    stub, url = start_stub(drop_after=4 * esp_client.CHUNK_SIZE)
+
+    async def wrong_offset(base_url):
+        return esp_client.CHUNK_SIZE  # e.g. the ESP rebooted and reports something else
+
+    monkeypatch.setattr(esp_client, "upload_status", wrong_offset)
+    resp, stats = asyncio.run(esp_client.upload(url, PAYLOAD))
+
+    assert resp.status_code == 200
+    assert stats["resumes"] == 2  # the failed resume (409) and the restart from 0
+    assert stub.payloads == [PAYLOAD]
+
+
+def test_upload_gives_up_after_the_retries(start_stub):
+    stub, url = start_stub(drop_after=esp_client.CHUNK_SIZE, max_drops=100)
+
+    with pytest.raises(esp_client.Error):
+        asyncio.run(esp_client.upload(url, PAYLOAD, retries=2))
+    assert stub.drops == 3
+    assert stub.payloads == []
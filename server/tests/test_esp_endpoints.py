@@ -0,0 +1,73 @@
+"""The async ESP-facing views, against an in-process ESP stub."""
+import struct
+from concurrent.futures import ThreadPoolExecutor
+
+import app
+from conftest import closed_port_url
+
+EFFECT = {"effect_name": "plasma_cloud", "max_frames": 12}
+
+
+def test_send_effect_uploads_the_rendered_payload(client, start_stub, monkeypatch):
+    stub, url = start_stub()
+    monkeypatch.setattr(app, "ESP_URL", url)
+
+    resp = client.post("/send_effect", json=EFFECT)
+
+    assert resp.status_code == 200, resp.get_json()
+    body = resp.get_json()
+    assert body["frames"] == 12
+    assert [r["status"] for r in body["controllers"]] == ["ok"]
+    payload, _, _ = app.render_effect_payload("plasma_cloud", body["params"], 12, app.LED_POSITIONS_PATH)
+    assert stub.payloads == [payload]
+    assert struct.unpack("<H", payload[:2])[0] == 12
+    assert len(payload) == 2 + 12 * 60 * 3
+
+
+def test_concurrent_uploads_all_arrive(client, start_stub, monkeypatch):
+    stub, url = start_stub(bandwidth_kbps=500)
+    monkeypatch.setattr(app, "ESP_URL", url)
+
+    with ThreadPoolExecutor(max_workers=4) as pool:
+        responses = list(pool.map(lambda _: client.post("/send_effect", json=EFFECT), range(4)))
+
+    assert [r.status_code for r in responses] == [200] * 4
+    # Uploads to one controller are serialized, so none was interleaved with another
+    assert len(stub.payloads) == 4
+    assert stub.bad_payloads == 0
+
+
+def test_gif_control_reaches_the_esp(client, start_stub, monkeypatch):
+    stub, url = start_stub()
+    monkeypatch.setattr(app, "ESP_URL", url)
+
+    resp = client.post("/gif_control", json={"action": "speed", "value": 40})
+
+    assert resp.status_code == 200, resp.get_json()
+    assert stub.requests["/gif/control"] == 1
+
+
+def test_gif_control_works_before_calibration(client, start_stub, monkeypatch, tmp_path):
+    # control only needs the controllers' URLs, not their layouts
+    stub, url = start_stub()
+    monkeypatch.setattr(app, "ESP_URL", url)
+    monkeypatch.setattr(app, "LED_POSITIONS_PATH", str(tmp_path / "missing.json"))
+
+    resp = client.post("/gif_control", json={"action": "pause"})
+
+    assert resp.status_code == 200, resp.get_json()
+    assert stub.requests["/gif/control"] == 1
+    resp = client.post("/send_effect", json={"effect_name": "plasma_cloud"})
+    assert resp.status_code == 400 and "calibrated layout" in resp.get_json()["message"]
+
+
+def test_unreachable_esp_is_a_502_naming_the_controller(client, monkeypatch):
+    monkeypatch.setattr(app, "ESP_URL", closed_port_url())
+
+    resp = client.post("/gif_control", json={"action": "pause"})
+
+    assert resp.status_code == 502
+    body = resp.get_json()
+    assert body["status"] == "error"
+    assert body["controllers"][0]["status"] == "error"
+    assert "tree" in body["error"]
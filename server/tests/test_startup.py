@@ -0,0 +1,50 @@
+"""
+`import app` must stay cheap: heavy modules load on first use (lazy_import) and
+nothing touches the shared files until a request needs them.
+"""
+import json
+import os
+import subprocess
+import sys
+
+SERVER_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+HEAVY_MODULES = ("numpy", "cv2", "PIL.Image", "requests", "httpx")
+# Seconds `import app` may take (Flask included, interpreter start-up excluded). It is
+# about 0.15 s with warm caches; HEAVY_MODULES catches the known offenders, the budget
+# anything else that makes start-up several times slower
+IMPORT_BUDGET = 0.5
+
+IMPORT_SCRIPT = """
+import json, os, sys, time
+start = time.perf_counter()
+import app
+seconds = time.perf_counter() - start
+print(json.dumps({"modules": sorted(sys.modules), "files": sorted(os.listdir(".")), "seconds": seconds}))
+"""
+
+
+def import_app(cwd):
+    """Import app in a fresh interpreter, from `cwd`; returns the loaded modules, the files left in cwd and the time."""
+    env = dict(os.environ, PYTHONPATH=SERVER_DIR + os.pathsep + os.environ.get("PYTHONPATH", ""))
+    out = subprocess.run([sys.executable, "-c", IMPORT_SCRIPT], cwd=cwd, env=env,
+                         capture_output=True, text=True, timeout=120)
+    assert out.returncode == 0, out.stderr
+    return json.loads(out.stdout.strip().splitlines()[-1])
+
+
+def test_import_app_loads_no_heavy_modules(tmp_path):
+    loaded = set(import_app(tmp_path)["modules"])
+    eager = [m for m in HEAVY_MODULES if m in loaded]
+    assert not eager, f"imported eagerly at startup: {', '.join(eager)}"
+
+
+def test_import_app_within_budget(tmp_path):
+    # best of three, so a busy machine does not fail the test
+    seconds = min(import_app(tmp_path)["seconds"] for _ in range(3))
+    assert seconds < IMPORT_BUDGET, f"import app took {seconds:.2f}s (budget {IMPORT_BUDGET}s)"
+
+
+def test_import_app_does_not_touch_the_codebook(tmp_path):
+    # The codebook is loaded (and its file lock taken) on first use, not at import
+    files = import_app(tmp_path)["files"]
+    assert "jsons" not in files, f"import app created {files}"